@@ -3,19 +3,20 @@ Manages authentication with nhl.tv
 """
 # pylint: disable=len-as-condition, line-too-long, missing-docstring
 
+import contextlib
 import http.cookiejar
+import json
 import logging
 import os
 import sys
+import threading
 import time
 
-from datetime import datetime
-from datetime import timedelta
-
-import requests
-
 import mlbam.common.util as util
 import mlbam.common.config as config
+import mlbam.common.httpclient as httpclient
+import mlbam.common.state as state
+import mlbam.common.stream as stream
 
 
 LOG = logging.getLogger(__name__)
@@ -24,50 +25,112 @@ AUTH_STR = 'Basic d2ViX25obC12MS4wLjA6MmQxZDg0NmVhM2IxOTRhMThlZjQwYWM5ZmJjZTk3ZT
 ACCESS_TOKEN_URL = 'https://user.svc.nhl.com/oauth/token?grant_type=client_credentials'
 ROGERS_LOGIN_URL = 'https://activation-rogers.svc.nhl.com/ws/subscription/flow/rogers.login'
 NHL_LOGIN_URL = 'https://user.svc.nhl.com/v2/user/identity'
+SESSION_KEY_URL = 'https://mf.svc.nhl.com/ws/media/mf/v2.4/stream?eventId={}&format=json&platform={}&subject=NHLTV&_={}'
+SESSION_KEY_FILENAME = 'sessionkeys.json'
+DEFAULT_SESSION_KEY_TTL = 24 * 3600
+DEFAULT_SESSION_KEY_BLACKOUT_TTL = 3600
+
+# the cookie jar is loaded once per process (see load_cookies)
+_COOKIE_JAR = None
+_COOKIE_FILE_MTIME = None
+_COOKIE_LOCK = threading.RLock()
 
 
 def get_cookie_file():
     return os.path.join(config.CONFIG.dir, 'cookies.lwp')
 
 
+def _get_cookie_file_mtime(cookie_file):
+    try:
+        return os.stat(cookie_file).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
 def load_cookies():
-    """Load cookies from file."""
+    """Returns the cookie jar. The cookie file is only parsed on first use, or if it has been
+    changed by another process since.
+    """
+    global _COOKIE_JAR, _COOKIE_FILE_MTIME
     cookie_file = get_cookie_file()
-    cookie_jar = http.cookiejar.LWPCookieJar()
-    if os.path.exists(cookie_file):
-        LOG.debug('Loading cookies from %s', cookie_file)
-        cookie_jar.load(cookie_file, ignore_discard=True)
-    return cookie_jar
+    with _COOKIE_LOCK:
+        mtime = _get_cookie_file_mtime(cookie_file)
+        if _COOKIE_JAR is None or mtime != _COOKIE_FILE_MTIME:
+            cookie_jar = http.cookiejar.LWPCookieJar()
+            if mtime is not None:
+                LOG.debug('Loading cookies from %s', cookie_file)
+                try:
+                    cookie_jar.load(cookie_file, ignore_discard=True)
+                except http.cookiejar.LoadError as ex:
+                    LOG.warning('Ignoring unreadable cookie file %s: %s', cookie_file, ex)
+            _COOKIE_JAR = cookie_jar
+            _COOKIE_FILE_MTIME = mtime
+        return _COOKIE_JAR
+
+
+def _get_cookie_key(cookie):
+    return (cookie.domain, cookie.path, cookie.name)
 
 
 def save_cookies(cookiejar):
-    """Save cookies to file."""
-    LOG.debug('Saving cookies')
+    """Merges the cookies into the cookie jar. The cookie file is only written if a cookie changed.
+    The file is locked while merging, so that cookies saved by other processes are kept.
+    """
+    global _COOKIE_FILE_MTIME
     cookie_file = get_cookie_file()
-    cookie_jar = http.cookiejar.LWPCookieJar()
-    if os.path.exists(cookie_file):
-        cookie_jar.load(cookie_file, ignore_discard=True)
-    for cookie in cookiejar:
-        args = dict(list(vars(cookie).items()))
-        args['rest'] = args['_rest']
-        del args['_rest']
-        cookie = http.cookiejar.Cookie(**args)
-        cookie_jar.set_cookie(cookie)
-    cookie_jar.save(cookie_file, ignore_discard=True)
+    with state.locked(cookie_file), _COOKIE_LOCK:
+        cookie_jar = load_cookies()  # picks up any changes made by other processes
+        existing = {_get_cookie_key(cookie): cookie for cookie in cookie_jar}
+        changed = False
+        for cookie in cookiejar:
+            current = existing.get(_get_cookie_key(cookie))
+            if current is not None and current.value == cookie.value and current.expires == cookie.expires:
+                continue
+            args = dict(list(vars(cookie).items()))
+            args['rest'] = args['_rest']
+            del args['_rest']
+            cookie_jar.set_cookie(http.cookiejar.Cookie(**args))
+            changed = True
+        if not changed:
+            LOG.debug('Cookies unchanged')
+            return
+        LOG.debug('Saving cookies')
+        state.atomic_write(cookie_file, '#LWP-Cookies-2.0\n' + cookie_jar.as_lwp_str(ignore_discard=True))
+        _COOKIE_FILE_MTIME = _get_cookie_file_mtime(cookie_file)
 
 
-def get_auth_cookie():
-    """Get authentication cookie from file."""
-    auth_cookie = None
-    cookie_jar = load_cookies()
-    for cookie in cookie_jar:
+def _get_auth_cookie_obj():
+    for cookie in load_cookies():
         if cookie.name == "Authorization" and not cookie.is_expired():
-            auth_cookie = cookie.value
-    return auth_cookie
+            return cookie
+    return None
+
+
+def get_auth_cookie():
+    """Get authentication cookie (no file access or requests if the cookies are already loaded)."""
+    auth_cookie = _get_auth_cookie_obj()
+    if auth_cookie is None:
+        return None
+    return auth_cookie.value
+
 
+def get_auth_cookie_expiry():
+    """Returns the expiry time (epoch seconds) of the authentication cookie, or None."""
+    auth_cookie = _get_auth_cookie_obj()
+    if auth_cookie is None:
+        return None
+    return auth_cookie.expires
+
+
+def nhl_login(force=False):
+    """Authenticates user to nhl site.
+
+    force: log in again even if the current authorization cookie is still valid (used to renew it before it expires)
+    """
+    if not force and get_auth_cookie() is not None:
+        LOG.debug('login: already logged in (we have a valid cookie)')
+        return
 
-def nhl_login():
-    """Authenticates user to nhl site."""
     headers = {
         "Accept": "application/json",
         "Accept-Encoding": "identity",
@@ -78,19 +141,14 @@ def nhl_login():
     }
     util.log_http(ACCESS_TOKEN_URL, 'post', headers,
                   sys._getframe().f_code.co_name)
-    resp = requests.post(ACCESS_TOKEN_URL,
-                         headers=headers,
-                         data='',
-                         cookies=load_cookies(),
-                         verify=config.VERIFY_SSL)
+    resp = httpclient.post(ACCESS_TOKEN_URL,
+                           headers=headers,
+                           data='',
+                           cookies=load_cookies())
     if resp.status_code >= 400:
         util.die("Authorization cookie couldn't be downloaded.")
     json_source = resp.json()
 
-    if get_auth_cookie() is not None:
-        LOG.debug('login: already logged in (we have a valid cookie)')
-        return
-
     auth_cookie = json_source['access_token']
 
     userid = config.CONFIG.parser['username']
@@ -126,11 +184,10 @@ def nhl_login():
     }
 
     util.log_http(login_url, 'post', headers, sys._getframe().f_code.co_name)
-    resp = requests.post(login_url,
-                         headers=headers,
-                         json=login_data,
-                         cookies=load_cookies(),
-                         verify=config.VERIFY_SSL)
+    resp = httpclient.post(login_url,
+                           headers=headers,
+                           json=login_data,
+                           cookies=load_cookies())
     if resp.status_code >= 400:
         try:
             json_source = resp.json()
@@ -145,30 +202,74 @@ def nhl_login():
     save_cookies(resp.cookies)
 
 
-def update_session_key(session_key):
-    """ save session_key to file """
-    session_key_file = os.path.join(config.CONFIG.dir, 'sessionkey')
-    with open(session_key_file, 'w') as handle:
-        print(session_key, file=handle)
+def get_session_key_file():
+    return os.path.join(config.CONFIG.dir, SESSION_KEY_FILENAME)
+
+
+@contextlib.contextmanager
+def _locked_session_keys():
+    """Yields the dict of event_id: session key entry, holding an exclusive lock on the session key
+    file. The dict is written back (atomically) if it was modified.
+    """
+    session_key_file = get_session_key_file()
+    with state.locked(session_key_file):
+        session_keys = dict()
+        try:
+            session_keys = json.loads(state.read_mapped(session_key_file).decode('utf-8'))
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            LOG.warning('Ignoring corrupt session key file: %s', session_key_file)
+        original = dict(session_keys)
+        yield session_keys
+        if session_keys != original:
+            state.atomic_write(session_key_file, json.dumps(session_keys))
 
 
-def get_session_key(game_pk, event_id, content_id, auth_cookie):
+def _is_session_key_fresh(entry, now):
+    if entry['blackout']:
+        ttl = config.CONFIG.parser.getint('session_key_blackout_ttl_secs', DEFAULT_SESSION_KEY_BLACKOUT_TTL)
+    else:
+        ttl = config.CONFIG.parser.getint('session_key_ttl_secs', DEFAULT_SESSION_KEY_TTL)
+    return now - entry['issued'] < ttl
+
+
+def update_session_key(session_key, event_id):
+    """ save the session_key for the event """
+    now = time.time()
+    with _locked_session_keys() as session_keys:
+        # drop the expired entries while we're here
+        for expired_event_id in [key for key, entry in session_keys.items() if not _is_session_key_fresh(entry, now)]:
+            del session_keys[expired_event_id]
+        session_keys[str(event_id)] = {'key': session_key, 'issued': now, 'blackout': session_key == 'blackout'}
+
+
+def get_cached_session_key(event_id):
+    """Returns the stored session key for the event, or None if there is no valid one."""
+    with _locked_session_keys() as session_keys:
+        entry = session_keys.get(str(event_id))
+    if entry is not None and _is_session_key_fresh(entry, time.time()):
+        return entry['key']
+    return None
+
+
+def get_session_key(game_pk, event_id, content_id, auth_cookie, force=False):
     """ game_pk: game_pk
         event_id: eventId
         content_id: mediaPlaybackId
+        force: request a new session key even if the stored one is still valid
+
+    Returns the session key, or 'blackout' if the event is blacked out (this result is also stored,
+    for a shorter time). Raises StreamException if the media service returns an error.
     """
-    session_key_file = os.path.join(config.CONFIG.dir, 'sessionkey')
-    if os.path.exists(session_key_file):
-        if datetime.today() - datetime.fromtimestamp(os.path.getmtime(session_key_file)) < timedelta(days=1):
-            with open(session_key_file, 'r') as handle:
-                for line in handle:
-                    session_key = line.strip()
-                    LOG.debug('Using cached session key: %s', session_key)
-                    return session_key
+    if not force:
+        session_key = get_cached_session_key(event_id)
+        if session_key is not None:
+            LOG.debug('Using stored session key for event %s: %s', event_id, session_key)
+            return session_key
     LOG.debug("Requesting session key")
     epoch_time_now = str(int(round(time.time()*1000)))
-    url = 'https://mf.svc.nhl.com/ws/media/mf/v2.4/stream?eventId={}&format=json&platform={}&subject=NHLTV&_={}'
-    url = url.format(event_id, config.CONFIG.platform, epoch_time_now)
+    url = SESSION_KEY_URL.format(event_id, config.CONFIG.platform, epoch_time_now)
     headers = {
         "Accept": "application/json",
         "Accept-Encoding": "identity",
@@ -180,7 +281,7 @@ def get_session_key(game_pk, event_id, content_id, auth_cookie):
         "Referer": "https://www.nhl.com/tv/{}/{}/{}".format(game_pk, event_id, content_id)
     }
     util.log_http(url, 'get', headers, sys._getframe().f_code.co_name)
-    json_source = requests.get(url, headers=headers, cookies=load_cookies(), verify=config.VERIFY_SSL).json()
+    json_source = httpclient.get(url, headers=headers, cookies=load_cookies()).json()
     LOG.debug('Session key json: %s', json_source)
 
     if json_source['status_code'] == 1:
@@ -193,8 +294,8 @@ def get_session_key(game_pk, event_id, content_id, auth_cookie):
             session_key = str(json_source['session_key'])
     else:
         msg = json_source['status_message']
-        util.die('Could not get session key: {}'.format(msg))
+        raise stream.StreamException('Could not get session key: {}'.format(msg))
 
     LOG.debug('Retrieved session key: %s', session_key)
-    update_session_key(session_key)
+    update_session_key(session_key, event_id)
     return session_key
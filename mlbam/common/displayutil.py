@@ -30,6 +30,25 @@ class ANSI(object):
     def reset():
         return ANSI.CONTROL_CODE['reset']
 
+    @staticmethod
+    def cursor_up(num_lines):
+        """Moves the cursor to the start of the line num_lines above."""
+        return '\033[{}F'.format(num_lines) if num_lines > 0 else '\r'
+
+    @staticmethod
+    def cursor_down(num_lines):
+        """Moves the cursor to the start of the line num_lines below."""
+        return '\033[{}E'.format(num_lines) if num_lines > 0 else '\r'
+
+    @staticmethod
+    def clear_line():
+        return '\033[2K'
+
+    @staticmethod
+    def clear_to_end():
+        """Clears from the cursor to the end of the screen."""
+        return '\033[J'
+
     @staticmethod
     def fg(colour_name):
         if colour_name is not None and colour_name != '' and colour_name in ANSI.FG_COLOUR:
@@ -2,6 +2,7 @@
 Common gamedata utilities
 """
 
+import functools
 import logging
 
 import mlbam.common.config as config
@@ -33,31 +34,157 @@ def convert_to_long_feedtype(feed, feedtype_map):
     return feed
 
 
-def is_fav(game_rec):
-    if 'favourite' in game_rec:
-        return game_rec['favourite']
-    if config.CONFIG.parser['favs'] is None or config.CONFIG.parser['favs'] == '':
-        return False
-    for fav in util.get_csv_list(config.CONFIG.parser['favs']):
-        if fav in (game_rec['away']['abbrev'], game_rec['home']['abbrev']):
+# filter terms which match on game state rather than team
+STATE_TERMS = ('preview', 'live', 'final', 'critical')
+FAV_TERMS = ('fav', 'favs')
+
+_COMPILED_FILTERS = dict()
+
+
+class FilterClause:
+    """A set of teams and/or game states. A game matches if any of them match."""
+    __slots__ = ('teams', 'states')
+
+    def __init__(self, teams, states):
+        self.teams = teams
+        self.states = states
+
+    def matches(self, game_rec):
+        if self.teams and (game_rec.away.abbrev in self.teams or game_rec.home.abbrev in self.teams):
             return True
-    return False
+        return bool(self.states) and not self.states.isdisjoint(get_state_terms(game_rec))
+
+
+class CompiledFilter:
+    """A filter expression, compiled into sets of teams and game states.
+
+    The expression is one or more clauses separated by '+', all of which must match. Each clause
+    is a comma-separated list of terms, any of which may match. A term is one of:
+        - a team code, e.g. 'tor'
+        - a built-in filter name, e.g. 'atlantic'
+        - 'favs', for the favourite teams
+        - a game state: 'preview', 'live', 'final' or 'critical'
+
+    Examples: 'tor,bos', 'atlantic+live', 'favs,central+live'
+    """
+    __slots__ = ('expression', 'clauses')
+
+    def __init__(self, expression, clauses):
+        self.expression = expression
+        self.clauses = clauses
+
+    def matches(self, game_rec):
+        for clause in self.clauses:
+            if not clause.matches(game_rec):
+                return False
+        return True
+
+
+def get_state_terms(game_rec):
+    """Returns the filter state terms which apply to the game."""
+    state_terms = {game_rec.abstract_game_state.lower()}
+    if 'Critical' in game_rec.detailed_state:
+        state_terms.add('critical')
+    return state_terms
+
+
+@functools.lru_cache(maxsize=32)
+def _get_team_set(csv_string):
+    return frozenset(team for team in util.get_csv_list(csv_string) if team)
+
+
+def get_fav_teams(favs=None):
+    """Returns the favourite teams as a frozenset."""
+    if favs is None:
+        favs = config.CONFIG.parser['favs']
+    if not favs:
+        return frozenset()
+    return _get_team_set(favs)
+
+
+def compile_filter(expression, filters, favs=None):
+    """Compiles a filter expression (see CompiledFilter). Returns None if no filtering is active.
+    Compiled filters are cached, so this is cheap to call repeatedly.
+    """
+    if not expression:
+        return None
+    if favs is None:
+        favs = config.CONFIG.parser['favs']
+    # keyed on the filter definitions rather than the dict's identity: e.g. 'favs' is filled in from the config
+    cache_key = (expression, favs, frozenset(filters.items()))
+    if cache_key in _COMPILED_FILTERS:
+        return _COMPILED_FILTERS[cache_key]
+    clauses = list()
+    for clause_str in expression.split('+'):
+        teams = set()
+        states = set()
+        for term in util.get_csv_list(clause_str):
+            if term in FAV_TERMS:
+                teams.update(get_fav_teams(favs))
+            elif term in STATE_TERMS:
+                states.add(term)
+            elif term in filters and filters[term]:
+                teams.update(_get_team_set(filters[term]))
+            elif term:
+                teams.add(term)
+        clauses.append(FilterClause(frozenset(teams), frozenset(states)))
+    compiled_filter = CompiledFilter(expression, tuple(clauses))
+    _COMPILED_FILTERS[cache_key] = compiled_filter
+    return compiled_filter
+
+
+class GameRecords(dict):
+    """Dictionary of game_pk: game_rec, which also indexes the games by team (game_pks in schedule
+    order) and state (sets of game_pks).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.by_team = dict()
+        self.by_state = dict()
+
+    def add(self, game_rec):
+        is_new = game_rec.game_pk not in self
+        self[game_rec.game_pk] = game_rec
+        if is_new:
+            for team in (game_rec.away.abbrev, game_rec.home.abbrev):
+                self.by_team.setdefault(team, list()).append(game_rec.game_pk)
+        for state in get_state_terms(game_rec):
+            self.by_state.setdefault(state, set()).add(game_rec.game_pk)
+
+    def find_team(self, team_code):
+        """Returns the first game for the given team, or None."""
+        game_pks = self.by_team.get(team_code)
+        if not game_pks:
+            return None
+        return self[game_pks[0]]
+
+    def select(self, compiled_filter):
+        """Returns the list of game records matching the compiled filter, in schedule order."""
+        if compiled_filter is None:
+            return list(self.values())
+        selected = None
+        for clause in compiled_filter.clauses:
+            clause_pks = set()
+            for team in clause.teams:
+                clause_pks.update(self.by_team.get(team, ()))
+            for state in clause.states:
+                clause_pks.update(self.by_state.get(state, ()))
+            selected = clause_pks if selected is None else selected & clause_pks
+        return [game_rec for game_pk, game_rec in self.items() if game_pk in selected]
+
+
+def is_fav(game_rec):
+    if game_rec.favourite is not None:
+        return game_rec.favourite
+    fav_teams = get_fav_teams()
+    return game_rec.away.abbrev in fav_teams or game_rec.home.abbrev in fav_teams
 
 
 def apply_filter(game_rec, arg_filter, filters):
     """Returns the game_rec if the game matches the filter, or if no filtering is active.
     """
-    if arg_filter == 'favs':
-        arg_filter = config.CONFIG.parser['favs']
-    elif arg_filter in filters:
-        arg_filter = filters[arg_filter]
-    elif not arg_filter:
+    compiled_filter = compile_filter(arg_filter, filters)
+    if compiled_filter is None or compiled_filter.matches(game_rec):
         return game_rec
-
-    # apply the filter
-    for team in util.get_csv_list(arg_filter):
-        if team in (game_rec['away']['abbrev'], game_rec['home']['abbrev']):
-            return game_rec
-
-    # no match
     return None
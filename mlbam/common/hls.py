@@ -0,0 +1,480 @@
+"""
+Native HLS downloader
+
+Downloads a complete (archived) HLS stream to a file. Segments are downloaded in parallel by a
+bounded pool of workers over the shared http session, and written to the output file in order.
+At most 'window' segments are held in memory at once, in reused buffers (see writer.py for the
+output stage). The written segments are recorded in a journal next to the output file, so that an
+interrupted download resumes where it stopped.
+
+AES-128 encrypted streams are decrypted with pycryptodome (Crypto.Cipher.AES), which is
+installed along with streamlink. If it is not available, or the stream uses a feature which is
+not supported here, HlsException is raised and the caller should fall back to streamlink.
+"""
+
+import collections
+import logging
+import mmap
+import os
+import threading
+import urllib.parse
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import urllib3
+
+import mlbam.common.config as config
+import mlbam.common.httpclient as httpclient
+import mlbam.common.m3u8 as m3u8
+import mlbam.common.segmentcache as segmentcache
+import mlbam.common.state as state
+import mlbam.common.writer as writer
+
+try:
+    from Crypto.Cipher import AES
+except ImportError:
+    AES = None
+
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_WINDOW = 8  # maximum number of downloaded segments held in memory
+SEGMENT_RETRIES = 3
+SEGMENT_TIMEOUT = 60
+PROGRESS_INTERVAL = 100  # segments
+
+JOURNAL_SUFFIX = '.journal'
+JOURNAL_VERSION = 'nhlv-journal-2'
+VERIFY_SEGMENTS = 3  # number of segments at the end of an interrupted download which are verified on resume
+
+
+class HlsException(Exception):
+    pass
+
+
+def _get_config_int(name, default):
+    if config.CONFIG is None:
+        return default
+    return config.CONFIG.parser.getint(name, default)
+
+
+def _get_fsync_policy():
+    if config.CONFIG is None:
+        return writer.FSYNC_CLOSE
+    return config.CONFIG.parser.get('fetch_fsync', writer.FSYNC_CLOSE)
+
+
+def select_best_variant(master_playlist):
+    """Returns the variant with the highest bandwidth."""
+    if not master_playlist.variants:
+        raise HlsException('No variants in master playlist: {}'.format(master_playlist.url))
+    return max(master_playlist.variants, key=lambda variant: variant.bandwidth)
+
+
+def get_journal_filename(output_filename):
+    return output_filename + JOURNAL_SUFFIX
+
+
+def _unpad(data):
+    """Removes the PKCS7 padding from decrypted data."""
+    if not data:
+        return data
+    pad_length = data[-1]
+    if pad_length < 1 or pad_length > 16:
+        raise HlsException('Invalid padding in decrypted segment')
+    return data[:-pad_length]
+
+
+def get_variant_id(playlist_url):
+    """Returns the identity of a media playlist: its url path, without the query (which holds credentials)."""
+    return urllib.parse.urlsplit(playlist_url).path
+
+
+class SegmentJournal:
+    """Sidecar file recording the segments which have been written to a download, so that an
+    interrupted download can be resumed. Each line holds a segment's sequence number, offset and
+    length in the output file, and a crc32 of its data.
+    """
+
+    def __init__(self, path, variant=''):
+        """variant: identifies the media playlist (see get_variant_id): a download of another
+        variant of the stream has the same segment numbers, but isn't resumed
+        """
+        self.path = path
+        self.variant = variant
+        self._handle = None
+
+    def _get_header(self, segments):
+        return '{} {} {} {} {}'.format(JOURNAL_VERSION, len(segments), segments[0].sequence, segments[-1].sequence,
+                                       self.variant)
+
+    def _read_entries(self, segments):
+        try:
+            with open(self.path, 'r') as infile:
+                lines = infile.read().splitlines()
+        except FileNotFoundError:
+            return list()
+        if not lines or lines[0] != self._get_header(segments):
+            LOG.info('Journal does not match the stream, not resuming: %s', self.path)
+            return list()
+        entries = list()
+        for line in lines[1:]:
+            fields = line.split()
+            if len(fields) != 4:
+                break  # a partially written last line
+            entries.append(tuple(int(field) for field in fields))
+        return entries
+
+    def get_resume_point(self, output_filename, segments):
+        """Returns (segment count, file offset) of the verified part of an interrupted download.
+
+        Entries must match the segments in order, and lie within the file. The checksums of the
+        last VERIFY_SEGMENTS entries are checked; anything after a mismatch is downloaded again.
+        """
+        if not segments or not os.path.exists(output_filename):
+            return 0, 0
+        entries = self._read_entries(segments)
+        file_size = os.path.getsize(output_filename)
+        count = 0
+        offset = 0
+        for entry, segment in zip(entries, segments):
+            sequence, entry_offset, length, _ = entry
+            if sequence != segment.sequence or entry_offset != offset or entry_offset + length > file_size:
+                break
+            count += 1
+            offset += length
+        with open(output_filename, 'rb') as infile:
+            for index in range(max(count - VERIFY_SEGMENTS, 0), count):
+                _, entry_offset, length, crc = entries[index]
+                infile.seek(entry_offset)
+                if zlib.crc32(infile.read(length)) != crc:
+                    LOG.info('Checksum mismatch at segment %s, resuming from there', entries[index][0])
+                    return index, entry_offset
+        return count, offset
+
+    def start(self, segments, count):
+        """Opens the journal for writing, keeping the first count entries."""
+        entries = self._read_entries(segments)[:count] if count else list()
+        with state.atomic_open(self.path) as outfile:
+            outfile.write(self._get_header(segments) + '\n')
+            for entry in entries:
+                outfile.write('{} {} {} {}\n'.format(*entry))
+        self._handle = open(self.path, 'a')
+
+    def add(self, sequence, offset, data):
+        self.add_entry(sequence, offset, len(data), zlib.crc32(data))
+
+    def add_entry(self, sequence, offset, length, crc):
+        self._handle.write('{} {} {} {}\n'.format(sequence, offset, length, crc))
+        self._handle.flush()
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def remove(self):
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class _SegmentData:
+    """A downloaded segment: either in a pool buffer, or in an open file (from the segment cache)."""
+    __slots__ = ('buffer', 'infile', 'length', 'crc')
+
+    def __init__(self, buffer, infile, length, crc):
+        self.buffer = buffer
+        self.infile = infile
+        self.length = length
+        self.crc = crc
+
+    def release(self, pool):
+        if self.buffer is not None:
+            pool.release(self.buffer)
+        if self.infile is not None:
+            self.infile.close()
+
+
+def _get_file_crc(infile):
+    if os.fstat(infile.fileno()).st_size == 0:
+        return zlib.crc32(b'')
+    with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return zlib.crc32(mapped)
+
+
+class HlsDownloader:
+    """Downloads an HLS stream into a single file."""
+
+    def __init__(self, playlist_url, output_filename, headers=None, cookies=None, workers=None, window=None,
+                 select_variant=select_best_variant, segment_cache=None):
+        """
+        playlist_url: a master or media playlist. For a master playlist, select_variant chooses the variant.
+        cookies: dict of cookies sent with every request. See set_cookies.
+        segment_cache: SegmentCache which segments of complete (archived) playlists are read through.
+                       Only download_segment (i.e. playback) stores segments: download() reads the cache,
+                       but doesn't fill it with the whole recording.
+        """
+        self.playlist_url = playlist_url
+        self.output_filename = output_filename
+        self.headers = headers or dict()
+        self.workers = workers or _get_config_int('fetch_workers', DEFAULT_WORKERS)
+        self.window = max(window or _get_config_int('fetch_window', DEFAULT_WINDOW), self.workers)
+        self.select_variant = select_variant
+        self.segment_cache = segment_cache
+        self.bandwidth = None  # of the selected variant, if known
+        self._cache_segments = False  # set once the playlist is known to be complete
+        self._local = threading.local()  # per worker: scratch buffer for encrypted segments
+        self._cookies = dict(cookies or dict())
+        self._keys = dict()  # key uri: key bytes
+        self._lock = threading.Lock()
+
+    def set_cookies(self, cookies):
+        """Replaces the cookies used for all further requests (e.g. with renewed credentials)."""
+        with self._lock:
+            self._cookies = dict(cookies)
+
+    def _get(self, url, headers=None, **kwargs):
+        request_headers = dict(self.headers)
+        if headers:
+            request_headers.update(headers)
+        with self._lock:
+            cookies = dict(self._cookies)
+        response = httpclient.get(url, headers=request_headers, cookies=cookies, timeout=SEGMENT_TIMEOUT, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def load_playlist(self):
+        """Returns the media playlist, choosing a variant if the playlist url is a master playlist."""
+        playlist = m3u8.parse(self._get(self.playlist_url).text, self.playlist_url)
+        if isinstance(playlist, m3u8.MasterPlaylist):
+            variant = self.select_variant(playlist)
+            LOG.debug('Selected variant: %s', variant)
+            self.bandwidth = variant.bandwidth
+            playlist = m3u8.parse(self._get(variant.uri).text, variant.uri)
+            if isinstance(playlist, m3u8.MasterPlaylist):
+                raise HlsException('Nested master playlist: {}'.format(variant.uri))
+        self._cache_segments = self.segment_cache is not None and playlist.endlist
+        return playlist
+
+    def check_supported(self, playlist):
+        """Raises HlsException if the playlist can't be downloaded here."""
+        if not playlist.endlist:
+            raise HlsException('Live playlists are not supported')
+        for segment in playlist.segments:
+            if segment.key is not None:
+                if segment.key.method != 'AES-128':
+                    raise HlsException('Unsupported encryption method: {}'.format(segment.key.method))
+                if AES is None:
+                    raise HlsException('Encrypted stream: pycryptodome is required')
+
+    def _get_key(self, key):
+        with self._lock:
+            if key.uri in self._keys:
+                return self._keys[key.uri]
+        key_data = self._get(key.uri).content
+        if len(key_data) != 16:
+            raise HlsException('Invalid key length: {}'.format(len(key_data)))
+        with self._lock:
+            self._keys[key.uri] = key_data
+        return key_data
+
+    @staticmethod
+    def _get_range_headers(segment):
+        if segment.byterange is None:
+            return None
+        length, offset = segment.byterange
+        return {'Range': 'bytes={}-{}'.format(offset, offset + length - 1)}
+
+    def _fetch_segment(self, segment):
+        for attempt in range(1, SEGMENT_RETRIES + 1):
+            try:
+                return self._get(segment.uri, self._get_range_headers(segment)).content
+            except requests.exceptions.RequestException as ex:
+                if attempt == SEGMENT_RETRIES:
+                    raise
+                LOG.debug('Segment %s failed (attempt %s): %s', segment.sequence, attempt, ex)
+        return None
+
+    def _fetch_segment_into(self, segment, buffer):
+        """Reads the segment's body into buffer (grown if required), returns its length."""
+        for attempt in range(1, SEGMENT_RETRIES + 1):
+            try:
+                response = self._get(segment.uri, self._get_range_headers(segment), stream=True)
+                try:
+                    content_length = int(response.headers.get('Content-Length', 0))
+                    if content_length >= len(buffer):
+                        # one spare byte: the read which detects the end of the body doesn't grow the buffer
+                        buffer.extend(bytes(content_length + 1 - len(buffer)))
+                    response.raw.decode_content = True
+                    return writer.readinto_all(response.raw, buffer)
+                finally:
+                    response.close()
+            except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as ex:
+                if attempt == SEGMENT_RETRIES:
+                    if isinstance(ex, requests.exceptions.RequestException):
+                        raise
+                    raise requests.exceptions.ConnectionError(ex) from ex
+                LOG.debug('Segment %s failed (attempt %s): %s', segment.sequence, attempt, ex)
+        return 0
+
+    def _get_scratch(self):
+        if not hasattr(self._local, 'scratch'):
+            self._local.scratch = bytearray(writer.DEFAULT_BUFFER_SIZE)
+        return self._local.scratch
+
+    def _download_segment_into(self, segment, pool):
+        """Returns the _SegmentData of the (decrypted) segment. Unencrypted segments are read
+        directly into a pool buffer, encrypted segments into a scratch buffer first, then
+        decrypted into the pool buffer. Unencrypted segments in the segment cache are returned
+        as the open cache file. Fetched segments aren't added to the cache.
+        """
+        cache_file = None
+        if self._cache_segments:
+            cache_key = segmentcache.get_segment_key(segment.uri, segment.byterange)
+            cache_path = self.segment_cache.get_path(cache_key)
+            if cache_path is not None:
+                try:
+                    cache_file = open(cache_path, 'rb')
+                except FileNotFoundError:
+                    pass  # just evicted
+        if cache_file is not None and segment.key is None:
+            return _SegmentData(None, cache_file, os.fstat(cache_file.fileno()).st_size, _get_file_crc(cache_file))
+        buffer = pool.acquire()
+        try:
+            target = buffer if segment.key is None else self._get_scratch()
+            if cache_file is not None:
+                with cache_file:
+                    length = writer.readinto_all(cache_file, target)
+            else:
+                length = self._fetch_segment_into(segment, target)
+            if segment.key is not None:
+                length = self._decrypt_into(segment, target, length, buffer)
+            with memoryview(buffer) as view:
+                crc = zlib.crc32(view[:length])
+        except BaseException:
+            pool.release(buffer)
+            raise
+        return _SegmentData(buffer, None, length, crc)
+
+    def _decrypt_into(self, segment, data, length, buffer):
+        """Decrypts length bytes of data into buffer, returns the length without padding."""
+        if length % 16:
+            raise HlsException('Invalid encrypted segment length: {}'.format(length))
+        if len(buffer) < length:
+            buffer.extend(bytes(length - len(buffer)))
+        cipher = AES.new(self._get_key(segment.key), AES.MODE_CBC, segment.key.get_iv(segment.sequence))
+        with memoryview(data) as data_view, memoryview(buffer) as buffer_view:
+            cipher.decrypt(data_view[:length], output=buffer_view[:length])
+        pad_length = buffer[length - 1] if length else 0
+        if length and (pad_length < 1 or pad_length > 16):
+            raise HlsException('Invalid padding in decrypted segment')
+        return length - pad_length
+
+    def get_expected_size(self, segments):
+        """Returns the expected size of the segments' data (an upper bound), or None if unknown."""
+        if segments and all(segment.byterange is not None for segment in segments):
+            return sum(segment.byterange[0] for segment in segments)
+        if self.bandwidth:
+            return int(sum(segment.duration for segment in segments) * self.bandwidth / 8)
+        return None
+
+    def download_segment(self, segment):
+        """Returns the (decrypted) data of a segment, from the segment cache if possible, retrying on errors."""
+        if self._cache_segments:
+            cache_key = segmentcache.get_segment_key(segment.uri, segment.byterange)
+            data = self.segment_cache.get(cache_key)
+            if data is None:
+                data = self._fetch_segment(segment)
+                self.segment_cache.put(cache_key, data)
+        else:
+            data = self._fetch_segment(segment)
+        if segment.key is not None:
+            cipher = AES.new(self._get_key(segment.key), AES.MODE_CBC, segment.key.get_iv(segment.sequence))
+            data = _unpad(cipher.decrypt(data))
+        return data
+
+    def download(self, segments=None, playlist=None):
+        """Downloads the stream. Returns the number of bytes in the output file.
+
+        An interrupted download of the same stream to the same file is resumed (see SegmentJournal).
+
+        segments: the segments to download (default: all segments of the playlist)
+        playlist: the media playlist, if already loaded
+        """
+        if playlist is None:
+            playlist = self.load_playlist()
+        self.check_supported(playlist)
+        if segments is None:
+            segments = playlist.segments
+        if not segments:
+            raise HlsException('No segments in playlist: {}'.format(playlist.url))
+        journal = SegmentJournal(get_journal_filename(self.output_filename), get_variant_id(playlist.url))
+        resume_count, offset = journal.get_resume_point(self.output_filename, segments)
+        if resume_count:
+            LOG.info('Resuming download at segment %s of %s', resume_count + 1, len(segments))
+        remaining = segments[resume_count:]
+        LOG.info('Downloading %s segments (%.0f minutes) to %s', len(remaining),
+                 sum(segment.duration for segment in remaining) / 60, self.output_filename)
+        expected_size = self.get_expected_size(remaining)
+        journal.start(segments, resume_count)
+        try:
+            with open(self.output_filename, 'r+b' if resume_count else 'wb') as outfile:
+                outfile.truncate(offset)
+                # the journal entry of a segment is added once its data is in the file
+                recording = writer.RecordingWriter(outfile, offset, offset + expected_size if expected_size else None,
+                                                   fsync_policy=_get_fsync_policy(),
+                                                   on_written=lambda entry: journal.add_entry(*entry))
+                try:
+                    self._download_to(remaining, recording)
+                finally:
+                    recording.close()
+                bytes_written = recording.position
+        finally:
+            journal.close()
+        journal.remove()
+        LOG.info('Download complete: %s (%.1f MB)', self.output_filename, bytes_written / (1024 * 1024))
+        return bytes_written
+
+    def _download_to(self, segments, recording):
+        """Downloads the segments in parallel, writing each to the RecordingWriter in order."""
+        bytes_written = 0
+        pending = collections.deque()
+        segment_iter = iter(segments)
+        pool = writer.BufferPool(self.window)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                for segment in segment_iter:
+                    pending.append((segment, executor.submit(self._download_segment_into, segment, pool)))
+                    if len(pending) >= self.window:
+                        break
+                count = 0
+                while pending:
+                    segment, future = pending.popleft()
+                    segment_data = future.result()
+                    try:
+                        entry = (segment.sequence, recording.position, segment_data.length, segment_data.crc)
+                        if segment_data.infile is not None:
+                            recording.join(segment_data.infile, segment_data.length, entry)
+                        else:
+                            with memoryview(segment_data.buffer) as view:
+                                recording.write(view[:segment_data.length], entry)
+                    finally:
+                        segment_data.release(pool)
+                    bytes_written += segment_data.length
+                    count += 1
+                    if count % PROGRESS_INTERVAL == 0:
+                        LOG.info('Downloaded %s segments (%.1f MB)', count, bytes_written / (1024 * 1024))
+                    segment = next(segment_iter, None)
+                    if segment is not None:
+                        pending.append((segment, executor.submit(self._download_segment_into, segment, pool)))
+            except BaseException:
+                for _, future in pending:
+                    future.cancel()
+                raise
+        return bytes_written
@@ -0,0 +1,211 @@
+"""
+Local caching HLS proxy
+
+Serves an (authenticated) HLS media playlist to local players over plain http. The playlist is
+rewritten so that its segments are requested from the proxy, which downloads each segment from
+the CDN once and serves it to every player: several players watching the same stream share a
+single upstream download. When a player requests a segment, the next 'prefetch' segments are
+downloaded ahead of it.
+
+Segments are downloaded (and decrypted) by an HlsDownloader, so the rewritten playlist has no
+keys or byte ranges. The downloader's cookies can be replaced while the proxy runs (see
+set_cookies), e.g. when the stream credentials are renewed.
+"""
+
+import collections
+import http.server
+import logging
+import math
+import re
+import socketserver
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import mlbam.common.hls as hls
+import mlbam.common.m3u8 as m3u8
+
+
+LOG = logging.getLogger(__name__)
+
+PLAYLIST_PATH = '/stream.m3u8'
+SEGMENT_PATH_RE = re.compile(r'^/segment/(\d+)\.ts$')
+DEFAULT_PREFETCH = 3
+MIN_CACHED_SEGMENTS = 16
+
+
+class ProxyServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """An http server handling each request in a thread."""
+    daemon_threads = True
+
+
+class HlsProxy:
+    """Proxies a media playlist and its segments for any number of local players."""
+
+    def __init__(self, downloader, prefetch=DEFAULT_PREFETCH):
+        """
+        downloader: HlsDownloader for the media playlist (its output file is not used)
+        prefetch: number of segments downloaded ahead of the most recently requested segment
+        """
+        self.downloader = downloader
+        self.prefetch = prefetch
+        self.max_cached = max(MIN_CACHED_SEGMENTS, prefetch * 4)
+        self._playlist = None
+        self._playlist_time = 0
+        self._segments = dict()  # sequence number: Segment, for the current playlist
+        self._cache = collections.OrderedDict()  # sequence number: Future of the segment data
+        self._lock = threading.Lock()
+        self._playlist_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=downloader.workers)
+        self._server = None
+
+    def set_cookies(self, cookies):
+        self.downloader.set_cookies(cookies)
+
+    def get_playlist(self):
+        """Returns the media playlist. A live playlist is reloaded at most every half target duration,
+        whichever player asks for it.
+        """
+        with self._playlist_lock:
+            playlist = self._playlist
+            if playlist is not None and playlist.endlist:
+                return playlist
+            max_age = (playlist.target_duration or 2) / 2 if playlist is not None else 0
+            if playlist is None or time.monotonic() - self._playlist_time >= max_age:
+                playlist = self.downloader.load_playlist()
+                with self._lock:
+                    self._playlist = playlist
+                    self._playlist_time = time.monotonic()
+                    self._segments = {segment.sequence: segment for segment in playlist.segments}
+            return playlist
+
+    def get_playlist_text(self):
+        """Returns the playlist, rewritten to request the segments from the proxy."""
+        playlist = self.get_playlist()
+        target_duration = playlist.target_duration or max((segment.duration for segment in playlist.segments),
+                                                          default=10)
+        lines = ['#EXTM3U',
+                 '#EXT-X-VERSION:3',
+                 '#EXT-X-TARGETDURATION:{}'.format(int(math.ceil(target_duration))),
+                 '#EXT-X-MEDIA-SEQUENCE:{}'.format(playlist.media_sequence)]
+        if playlist.endlist:
+            lines.append('#EXT-X-PLAYLIST-TYPE:VOD')
+        for segment in playlist.segments:
+            if segment.discontinuity:
+                lines.append('#EXT-X-DISCONTINUITY')
+            if segment.program_date_time is not None:
+                lines.append('#EXT-X-PROGRAM-DATE-TIME:' + segment.program_date_time)
+            lines.append('#EXTINF:{:.3f},'.format(segment.duration))
+            lines.append('/segment/{}.ts'.format(segment.sequence))
+        if playlist.endlist:
+            lines.append('#EXT-X-ENDLIST')
+        return '\n'.join(lines) + '\n'
+
+    def _get_future(self, sequence):
+        """Returns the Future of the segment's data (starting its download if required), or None
+        if the segment isn't in the playlist. Must be called with the lock held.
+        """
+        future = self._cache.get(sequence)
+        if future is not None:
+            self._cache.move_to_end(sequence)
+            return future
+        segment = self._segments.get(sequence)
+        if segment is None:
+            return None
+        future = self._executor.submit(self.downloader.download_segment, segment)
+        self._cache[sequence] = future
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+        return future
+
+    def get_segment(self, sequence):
+        """Returns the segment's data, and starts downloading the segments after it.
+        Returns None if the segment isn't in the playlist.
+        """
+        with self._lock:
+            known = sequence in self._segments
+        if not known:
+            self.get_playlist()  # a live playlist may have moved on
+        with self._lock:
+            future = self._get_future(sequence)
+            if future is None:
+                return None
+            for next_sequence in range(sequence + 1, sequence + 1 + self.prefetch):
+                self._get_future(next_sequence)
+        try:
+            return future.result()
+        except BaseException:
+            with self._lock:
+                if self._cache.get(sequence) is future:
+                    del self._cache[sequence]  # retried on the next request
+            raise
+
+    def _create_server(self, host, port):
+        self._server = ProxyServer((host, port), _make_handler(self))
+        return self._server
+
+    def _close(self):
+        self._server.server_close()
+        with self._lock:
+            for future in self._cache.values():
+                future.cancel()  # the segments which haven't started downloading
+            self._cache.clear()
+        self._executor.shutdown(wait=False)
+
+    def serve(self, host, port):
+        """Serves the players until interrupted."""
+        self._create_server(host, port)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._close()
+
+    def start(self, host='127.0.0.1', port=0):
+        """Serves the players in a background thread, until shutdown() is called.
+        Returns the playlist url (port 0 picks a free port).
+        """
+        server = self._create_server(host, port)
+        threading.Thread(target=server.serve_forever, name='proxy', daemon=True).start()
+        return 'http://{}:{}{}'.format(host, server.server_address[1], PLAYLIST_PATH)
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._close()
+            self._server = None
+
+
+def _make_handler(proxy):
+
+    class ProxyRequestHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):  # pylint: disable=invalid-name
+            try:
+                if self.path.split('?', 1)[0] == PLAYLIST_PATH:
+                    self._send(proxy.get_playlist_text().encode(), 'application/vnd.apple.mpegurl')
+                    return
+                match = SEGMENT_PATH_RE.match(self.path)
+                data = proxy.get_segment(int(match.group(1))) if match else None
+                if data is None:
+                    self.send_error(404)
+                    return
+                self._send(data, 'video/mp2t')
+            except (requests.exceptions.RequestException, hls.HlsException, m3u8.PlaylistException) as ex:
+                LOG.error('Proxy request %s failed: %s', self.path, ex)
+                self.send_error(502)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the player went away
+
+        def _send(self, data, content_type):
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            LOG.debug('Proxy: ' + format, *args)
+
+    return ProxyRequestHandler
@@ -0,0 +1,146 @@
+"""
+On-disk cache for JSON responses
+
+Entries are keyed by URL and stored in the config directory. Each entry holds the parsed JSON
+along with the ETag/Last-Modified validators, so that an expired entry can be revalidated with a
+conditional request instead of downloading the full response again.
+
+Entries are serialized with marshal, which is much faster to load than re-parsing the JSON text.
+The marshal format is tied to the python version, so entries written by a different version are
+treated as a cache miss.
+"""
+
+import hashlib
+import logging
+import marshal
+import os
+import time
+
+import mlbam.common.config as config
+import mlbam.common.state as state
+
+
+LOG = logging.getLogger(__name__)
+
+CACHE_FORMAT_VERSION = 1
+CACHE_FILE_SUFFIX = '.cache'
+DEFAULT_MAX_SIZE_MB = 50
+
+_CACHE = None
+
+
+class CacheEntry:
+    """A cached response."""
+    __slots__ = ('url', 'fetched_at', 'etag', 'last_modified', 'data')
+
+    def __init__(self, url, fetched_at, etag, last_modified, data):
+        self.url = url
+        self.fetched_at = fetched_at
+        self.etag = etag
+        self.last_modified = last_modified
+        self.data = data
+
+    def is_fresh(self, ttl_secs):
+        return ttl_secs > 0 and time.time() - self.fetched_at < ttl_secs
+
+    def get_validator_headers(self):
+        """Returns the headers required for a conditional request."""
+        headers = dict()
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    """A size-bounded directory of cache entries, evicted in least-recently-used order."""
+
+    def __init__(self, cache_dir, max_size_bytes):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _get_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + CACHE_FILE_SUFFIX)
+
+    def get(self, url):
+        """Returns the CacheEntry for url, or None if there is no usable entry."""
+        path = self._get_path(url)
+        try:
+            (format_version, marshal_version, entry_url,
+             fetched_at, etag, last_modified, data) = state.read_mapped(path, marshal.loads)
+        except FileNotFoundError:
+            return None
+        except (EOFError, ValueError, TypeError) as ex:
+            LOG.debug('Discarding unreadable cache entry %s: %s', path, ex)
+            self._remove(path)
+            return None
+        if format_version != CACHE_FORMAT_VERSION or marshal_version != marshal.version or entry_url != url:
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            pass  # evicted by another process since it was read: the data is still valid
+        return CacheEntry(entry_url, fetched_at, etag, last_modified, data)
+
+    def put(self, url, data, etag=None, last_modified=None):
+        """Stores a response, then evicts old entries if the cache is over its size limit."""
+        entry = CacheEntry(url, time.time(), etag, last_modified, data)
+        self._write(entry)
+        self.evict()
+        return entry
+
+    def refresh(self, entry):
+        """Marks an entry as freshly fetched (e.g. after a '304 Not Modified' response)."""
+        entry.fetched_at = time.time()
+        self._write(entry)
+
+    def remove(self, url):
+        """Removes the entry for url (e.g. when the cached data is known to be invalid)."""
+        self._remove(self._get_path(url))
+
+    def _write(self, entry):
+        path = self._get_path(entry.url)
+        try:
+            state.atomic_write(path, marshal.dumps((CACHE_FORMAT_VERSION, marshal.version, entry.url, entry.fetched_at,
+                                                    entry.etag, entry.last_modified, entry.data)))
+        except (OSError, ValueError) as ex:
+            LOG.debug('Could not write cache entry for %s: %s', entry.url, ex)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self):
+        """Removes least-recently used entries until the cache is within its size limit."""
+        entries = list()
+        total_size = 0
+        for dir_entry in os.scandir(self.cache_dir):
+            if dir_entry.name.endswith(CACHE_FILE_SUFFIX):
+                stat = dir_entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, dir_entry.path))
+                total_size += stat.st_size
+        if total_size <= self.max_size_bytes:
+            return
+        for _, size, path in sorted(entries):
+            LOG.debug('Evicting cache entry %s', path)
+            self._remove(path)
+            total_size -= size
+            if total_size <= self.max_size_bytes:
+                break
+
+
+def get_cache():
+    """Returns the http cache, or None if caching is disabled in the config."""
+    global _CACHE
+    if _CACHE is None:
+        if config.CONFIG is None or not config.CONFIG.parser.getboolean('http_cache', True):
+            return None
+        max_size_mb = config.CONFIG.parser.getint('http_cache_max_mb', DEFAULT_MAX_SIZE_MB)
+        _CACHE = HttpCache(os.path.join(config.CONFIG.dir, 'cache', 'http'), max_size_mb * 1024 * 1024)
+    return _CACHE
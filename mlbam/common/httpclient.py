@@ -0,0 +1,107 @@
+"""
+Shared HTTP client
+
+Holds a single pooled requests.Session for the process, so that connections (and TLS sessions)
+to the statsapi, auth, media service and CDN hosts are kept alive and reused between requests.
+"""
+
+import logging
+import threading
+import urllib.parse
+
+import requests
+import requests.adapters
+
+import mlbam.common.config as config
+
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_POOL_CONNECTIONS = 10  # number of distinct hosts to keep a connection pool for
+DEFAULT_POOL_MAXSIZE = 4  # maximum number of open connections per host
+
+DEFAULT_HEADERS = {
+    'Accept': '*/*',
+    'Accept-Language': 'en-US,en;q=0.8',
+    'Connection': 'keep-alive',
+}
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+def _get_config_int(name, default):
+    if config.CONFIG is None:
+        return default
+    return config.CONFIG.parser.getint(name, default)
+
+
+def _create_session():
+    pool_connections = _get_config_int('http_pool_connections', DEFAULT_POOL_CONNECTIONS)
+    # the segment download workers all request the same CDN host: with fewer connections, the
+    # workers above http_pool_maxsize would only wait for a connection
+    pool_maxsize = max(_get_config_int('http_pool_maxsize', DEFAULT_POOL_MAXSIZE),
+                       _get_config_int('fetch_workers', DEFAULT_POOL_MAXSIZE))
+    LOG.debug('Creating http session: pool_connections=%s, pool_maxsize=%s', pool_connections, pool_maxsize)
+    session = requests.Session()
+    # pool_block: callers wait for a free connection rather than exceeding the per-host limit
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections,
+                                            pool_maxsize=pool_maxsize,
+                                            pool_block=True,
+                                            max_retries=1)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    return session
+
+
+def get_session():
+    """Returns the process-wide requests.Session, creating it on first use."""
+    global _SESSION
+    if _SESSION is None:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                _SESSION = _create_session()
+    return _SESSION
+
+
+def close():
+    """Closes all pooled connections."""
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is not None:
+            _SESSION.close()
+            _SESSION = None
+
+
+def request(method, url, **kwargs):
+    """Sends a request via the shared session. Accepts the same arguments as requests.request."""
+    kwargs.setdefault('verify', config.VERIFY_SSL)
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request('get', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('post', url, **kwargs)
+
+
+def prewarm(urls, timeout=10):
+    """Opens a pooled connection to the host of each url (DNS lookup, TCP and TLS handshakes), so
+    that the first real request to the host does not pay for it. Failures are only logged.
+    """
+    session = get_session()
+    hosts = list()
+    for url in urls:
+        parsed_url = urllib.parse.urlsplit(url)
+        if parsed_url.netloc and (parsed_url.scheme, parsed_url.netloc) not in hosts:
+            hosts.append((parsed_url.scheme, parsed_url.netloc))
+    for scheme, netloc in hosts:
+        LOG.debug('Pre-warming connection to %s', netloc)
+        try:
+            session.head('{}://{}/'.format(scheme, netloc), timeout=timeout, verify=config.VERIFY_SSL,
+                         allow_redirects=False)
+        except requests.exceptions.RequestException as ex:
+            LOG.debug('Pre-warm failed for %s: %s', netloc, ex)
@@ -0,0 +1,106 @@
+"""
+JSON Patch (RFC 6902)
+
+Applies a list of patch operations to a parsed JSON document, in place.
+"""
+
+
+class JsonPatchException(Exception):
+    pass
+
+
+def _parse_pointer(pointer):
+    """Splits a JSON pointer (RFC 6901) into its unescaped tokens."""
+    if pointer == '':
+        return list()
+    if not pointer.startswith('/'):
+        raise JsonPatchException('Invalid JSON pointer: {}'.format(pointer))
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+
+def _get_index(container, token, allow_end=False):
+    if allow_end and token == '-':
+        return len(container)
+    try:
+        index = int(token)
+    except ValueError:
+        raise JsonPatchException('Invalid list index: {}'.format(token))
+    if index < 0 or index > len(container) or (index == len(container) and not allow_end):
+        raise JsonPatchException('List index out of range: {}'.format(token))
+    return index
+
+
+def _resolve(doc, tokens):
+    """Returns the value at the location given by tokens."""
+    value = doc
+    for token in tokens:
+        try:
+            if isinstance(value, list):
+                value = value[_get_index(value, token)]
+            else:
+                value = value[token]
+        except (KeyError, TypeError):
+            raise JsonPatchException('Path not found: /{}'.format('/'.join(tokens)))
+    return value
+
+
+def _add(doc, tokens, value):
+    if not tokens:
+        return value
+    parent = _resolve(doc, tokens[:-1])
+    if isinstance(parent, list):
+        parent.insert(_get_index(parent, tokens[-1], allow_end=True), value)
+    elif isinstance(parent, dict):
+        parent[tokens[-1]] = value
+    else:
+        raise JsonPatchException('Cannot add to: /{}'.format('/'.join(tokens[:-1])))
+    return doc
+
+
+def _remove(doc, tokens):
+    if not tokens:
+        raise JsonPatchException('Cannot remove the document root')
+    parent = _resolve(doc, tokens[:-1])
+    try:
+        if isinstance(parent, list):
+            return parent.pop(_get_index(parent, tokens[-1]))
+        return parent.pop(tokens[-1])
+    except (KeyError, AttributeError):
+        raise JsonPatchException('Path not found: /{}'.format('/'.join(tokens)))
+
+
+def apply_patch(doc, operations):
+    """Applies the patch operations to doc. Returns the patched document, which is the same object
+    as doc unless the document root was replaced.
+    """
+    for operation in operations:
+        op_name = operation.get('op')
+        tokens = _parse_pointer(operation.get('path', ''))
+        if op_name == 'add':
+            doc = _add(doc, tokens, operation['value'])
+        elif op_name == 'remove':
+            _remove(doc, tokens)
+        elif op_name == 'replace':
+            if tokens:
+                _remove(doc, tokens)
+            doc = _add(doc, tokens, operation['value'])
+        elif op_name == 'move':
+            value = _remove(doc, _parse_pointer(operation['from']))
+            doc = _add(doc, tokens, value)
+        elif op_name == 'copy':
+            value = _resolve(doc, _parse_pointer(operation['from']))
+            doc = _add(doc, tokens, _deep_copy(value))
+        elif op_name == 'test':
+            if _resolve(doc, tokens) != operation['value']:
+                raise JsonPatchException('Test failed: {}'.format(operation.get('path')))
+        else:
+            raise JsonPatchException('Unknown patch operation: {}'.format(op_name))
+    return doc
+
+
+def _deep_copy(value):
+    if isinstance(value, dict):
+        return {key: _deep_copy(val) for key, val in value.items()}
+    if isinstance(value, list):
+        return [_deep_copy(val) for val in value]
+    return value
@@ -0,0 +1,292 @@
+"""
+HLS playlist (m3u8) parsing
+
+Parses master playlists (the list of variant streams) and media playlists (the list of segments),
+resolving all URIs against the playlist URL. Only the tags used by the NHL/MLB streams are
+interpreted; other tags are ignored.
+
+TimeIndex holds the timing of a media playlist's segments in array columns, to find the segment
+at a stream offset or a wall-clock time by binary search.
+"""
+
+import array
+import bisect
+import logging
+import re
+import urllib.parse
+
+from dateutil import parser
+
+
+LOG = logging.getLogger(__name__)
+
+_ATTRIBUTE_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+class PlaylistException(Exception):
+    pass
+
+
+class Key:
+    """Encryption key for the segments following an EXT-X-KEY tag."""
+    __slots__ = ('method', 'uri', 'iv')
+
+    def __init__(self, method, uri=None, iv=None):
+        self.method = method
+        self.uri = uri
+        self.iv = iv  # bytes, or None to use the segment sequence number
+
+    def get_iv(self, sequence):
+        if self.iv is not None:
+            return self.iv
+        return sequence.to_bytes(16, 'big')
+
+
+class Segment:
+    """A media segment."""
+    __slots__ = ('uri', 'duration', 'sequence', 'key', 'byterange', 'program_date_time', 'discontinuity')
+
+    def __init__(self, uri, duration, sequence, key=None, byterange=None, program_date_time=None,
+                 discontinuity=False):
+        self.uri = uri
+        self.duration = duration
+        self.sequence = sequence
+        self.key = key  # Key, or None if not encrypted
+        self.byterange = byterange  # (length, offset), or None for the whole resource
+        self.program_date_time = program_date_time  # EXT-X-PROGRAM-DATE-TIME string, or None
+        self.discontinuity = discontinuity
+
+    def __repr__(self):
+        return 'Segment({}: {})'.format(self.sequence, self.uri)
+
+
+class MediaPlaylist:
+    """A list of media segments."""
+    __slots__ = ('url', 'target_duration', 'media_sequence', 'segments', 'endlist')
+
+    def __init__(self, url, target_duration=None, media_sequence=0, segments=None, endlist=False):
+        self.url = url
+        self.target_duration = target_duration
+        self.media_sequence = media_sequence
+        self.segments = segments if segments is not None else list()
+        self.endlist = endlist  # True for a complete (archived) playlist
+
+    def get_duration(self):
+        return sum(segment.duration for segment in self.segments)
+
+    def get_time_index(self):
+        return TimeIndex(self.segments)
+
+
+class Variant:
+    """A variant stream in a master playlist."""
+    __slots__ = ('uri', 'bandwidth', 'resolution', 'frame_rate', 'codecs')
+
+    def __init__(self, uri, bandwidth, resolution=None, frame_rate=None, codecs=None):
+        self.uri = uri
+        self.bandwidth = bandwidth
+        self.resolution = resolution  # (width, height), or None for audio-only
+        self.frame_rate = frame_rate
+        self.codecs = codecs
+
+    def __repr__(self):
+        return 'Variant({}, {}, {})'.format(self.bandwidth, self.resolution, self.frame_rate)
+
+
+class MasterPlaylist:
+    """A list of variant streams."""
+    __slots__ = ('url', 'variants')
+
+    def __init__(self, url, variants=None):
+        self.url = url
+        self.variants = variants if variants is not None else list()
+
+
+def parse_attributes(attribute_str):
+    """Parses an attribute list (e.g. 'BANDWIDTH=800000,RESOLUTION=640x360') into a dict. Quotes are removed."""
+    attributes = dict()
+    for name, value in _ATTRIBUTE_RE.findall(attribute_str):
+        if value.startswith('"'):
+            value = value[1:-1]
+        attributes[name] = value
+    return attributes
+
+
+def _parse_key(attribute_str, base_url):
+    attributes = parse_attributes(attribute_str)
+    method = attributes.get('METHOD', 'NONE')
+    if method == 'NONE':
+        return None
+    iv = None
+    if 'IV' in attributes:
+        iv = bytes.fromhex(attributes['IV'][2:] if attributes['IV'].lower().startswith('0x') else attributes['IV'])
+    uri = attributes.get('URI')
+    if uri is not None:
+        uri = urllib.parse.urljoin(base_url, uri)
+    return Key(method, uri, iv)
+
+
+def _parse_master(lines, url):
+    playlist = MasterPlaylist(url)
+    attributes = None
+    for line in lines:
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            attributes = parse_attributes(line[len('#EXT-X-STREAM-INF:'):])
+        elif line and not line.startswith('#') and attributes is not None:
+            resolution = None
+            if 'RESOLUTION' in attributes:
+                width, _, height = attributes['RESOLUTION'].partition('x')
+                resolution = (int(width), int(height))
+            frame_rate = float(attributes['FRAME-RATE']) if 'FRAME-RATE' in attributes else None
+            playlist.variants.append(Variant(urllib.parse.urljoin(url, line),
+                                             int(attributes.get('BANDWIDTH', 0)),
+                                             resolution, frame_rate, attributes.get('CODECS')))
+            attributes = None
+    return playlist
+
+
+def _parse_media(lines, url):  # pylint: disable=too-many-branches
+    playlist = MediaPlaylist(url)
+    sequence = 0
+    duration = None
+    key = None
+    byterange = None
+    program_date_time = None
+    discontinuity = False
+    next_offsets = dict()  # uri: offset following the previous byte range
+    for line in lines:
+        if line.startswith('#EXTINF:'):
+            duration = float(line[len('#EXTINF:'):].split(',', 1)[0])
+        elif line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+            playlist.media_sequence = sequence = int(line[len('#EXT-X-MEDIA-SEQUENCE:'):])
+        elif line.startswith('#EXT-X-TARGETDURATION:'):
+            playlist.target_duration = float(line[len('#EXT-X-TARGETDURATION:'):])
+        elif line.startswith('#EXT-X-KEY:'):
+            key = _parse_key(line[len('#EXT-X-KEY:'):], url)
+        elif line.startswith('#EXT-X-BYTERANGE:'):
+            length, _, offset = line[len('#EXT-X-BYTERANGE:'):].partition('@')
+            byterange = (int(length), int(offset) if offset else None)
+        elif line.startswith('#EXT-X-PROGRAM-DATE-TIME:'):
+            program_date_time = line[len('#EXT-X-PROGRAM-DATE-TIME:'):]
+        elif line.startswith('#EXT-X-DISCONTINUITY') and not line.startswith('#EXT-X-DISCONTINUITY-SEQUENCE'):
+            discontinuity = True
+        elif line.startswith('#EXT-X-ENDLIST'):
+            playlist.endlist = True
+        elif line and not line.startswith('#'):
+            if duration is None:
+                raise PlaylistException('Segment without #EXTINF: {}'.format(line))
+            uri = urllib.parse.urljoin(url, line)
+            if byterange is not None:
+                length, offset = byterange
+                if offset is None:
+                    offset = next_offsets.get(uri, 0)
+                byterange = (length, offset)
+                next_offsets[uri] = offset + length
+            playlist.segments.append(Segment(uri, duration, sequence, key, byterange, program_date_time,
+                                             discontinuity))
+            sequence += 1
+            duration = None
+            byterange = None
+            program_date_time = None
+            discontinuity = False
+    return playlist
+
+
+def parse(text, url):
+    """Parses a playlist. Returns a MasterPlaylist or a MediaPlaylist."""
+    lines = [line.strip() for line in text.splitlines()]
+    if not lines or lines[0] != '#EXTM3U':
+        raise PlaylistException('Not an m3u8 playlist: {}'.format(url))
+    if any(line.startswith('#EXT-X-STREAM-INF:') for line in lines):
+        return _parse_master(lines, url)
+    return _parse_media(lines, url)
+
+
+class TimeIndex:
+    """Segment timing of a media playlist, stored in array columns (one entry per segment):
+
+    starts: the offset of each segment from the start of the playlist (plus the end of the last)
+    times: the wall-clock time (epoch seconds) of each segment, from EXT-X-PROGRAM-DATE-TIME.
+        Segments without the tag are timed from the previous tagged segment. Empty if the
+        playlist has no program date times.
+    sequences: the sequence number of each segment
+    range_lengths, range_offsets: the byte range of each segment, or -1 for a whole resource
+    """
+    __slots__ = ('starts', 'times', 'sequences', 'range_lengths', 'range_offsets')
+
+    def __init__(self, segments):
+        self.starts = array.array('d', [0.0])
+        self.times = array.array('d')
+        self.sequences = array.array('q')
+        self.range_lengths = array.array('q')
+        self.range_offsets = array.array('q')
+        first_time_index = None
+        for index, segment in enumerate(segments):
+            self.starts.append(self.starts[-1] + segment.duration)
+            self.sequences.append(segment.sequence)
+            length, offset = segment.byterange if segment.byterange is not None else (-1, -1)
+            self.range_lengths.append(length)
+            self.range_offsets.append(offset)
+            if segment.program_date_time is not None:
+                segment_time = parser.isoparse(segment.program_date_time).timestamp()
+                if first_time_index is None:
+                    first_time_index = index
+                    # time the untagged segments before the first tag backwards from it
+                    self.times.extend(segment_time - (self.starts[index] - self.starts[earlier])
+                                      for earlier in range(index))
+                self.times.append(segment_time)
+            elif first_time_index is not None:
+                self.times.append(self.times[-1] + segments[index - 1].duration)
+
+    def __len__(self):
+        return len(self.sequences)
+
+    def get_duration(self):
+        return self.starts[-1]
+
+    def get_byterange(self, index):
+        """Returns the (length, offset) byte range of the segment, or None."""
+        if self.range_lengths[index] < 0:
+            return None
+        return self.range_lengths[index], self.range_offsets[index]
+
+    def find_offset(self, offset):
+        """Returns the index of the segment playing at offset seconds from the start of the playlist."""
+        if not self or offset < 0 or offset >= self.starts[-1]:
+            raise PlaylistException('Offset {}s is outside of the stream (0-{:.0f}s)'.format(offset, self.get_duration()))
+        return bisect.bisect_right(self.starts, offset) - 1
+
+    def find_time(self, timestamp):
+        """Returns the index of the segment playing at the wall-clock time (epoch seconds).
+        A time before the start of the playlist returns the first segment.
+        """
+        if not self.times:
+            raise PlaylistException('Playlist has no program date time: cannot seek to a time')
+        if timestamp >= self.times[-1] + (self.starts[-1] - self.starts[-2]):
+            raise PlaylistException('Time is after the end of the stream')
+        return max(bisect.bisect_right(self.times, timestamp) - 1, 0)
+
+    def find_sequence(self, sequence):
+        """Returns the index of the segment with the sequence number, or None."""
+        index = bisect.bisect_left(self.sequences, sequence)
+        if index < len(self.sequences) and self.sequences[index] == sequence:
+            return index
+        return None
+
+    def find_range(self, offset=None, duration=None, timestamp=None):
+        """Returns the (start, end) slice of the segments to play from offset seconds, or from the
+        wall-clock timestamp (default: from the start), for duration seconds (default: to the end).
+        """
+        start = 0
+        position = 0  # the offset of the requested start
+        if timestamp is not None:
+            start = self.find_time(timestamp)
+            position = self.starts[start] + max(timestamp - self.times[start], 0)
+        elif offset:
+            start = self.find_offset(offset)
+            position = offset
+        end = len(self)
+        if duration:
+            # the segment playing at the end of the duration is included
+            end = min(bisect.bisect_left(self.starts, position + duration), len(self))
+        return start, end
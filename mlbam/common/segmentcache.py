@@ -0,0 +1,135 @@
+"""
+On-disk cache for HLS segments
+
+Segments of archived streams never change, so they are cached in the config directory and read
+back instead of being downloaded again, e.g. when seeking back in an archived game or re-watching
+a highlight. The cache is opt-in (the segment_cache config option): it's filled by playing archived
+streams through the local proxy, and only read when fetching. Entries are keyed by the segment URI
+(and byte range) with the volatile auth tokens removed, so that a segment is found again with new
+credentials. The raw (still encrypted) data is stored.
+
+The cache is bounded in size: the least-recently used entries are evicted once it grows over
+its limit.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import urllib.parse
+
+import mlbam.common.config as config
+import mlbam.common.state as state
+
+
+LOG = logging.getLogger(__name__)
+
+CACHE_FILE_SUFFIX = '.seg'
+DEFAULT_MAX_SIZE_MB = 2048
+EVICT_TO_RATIO = 0.9  # evict down to this share of the limit, so that eviction doesn't run on every put
+
+# query parameters which carry (expiring) credentials rather than identify the content
+VOLATILE_PARAMS = frozenset(('hdnea', 'hdnts', '__gda__', 'token', 'exp', 'expires', 'signature', 'policy',
+                             'key-pair-id', 'auth', 'mediaauth'))
+
+_CACHE = None
+
+
+def get_segment_key(uri, byterange=None):
+    """Returns the cache key of a segment: its URI without auth tokens, plus its byte range."""
+    parts = urllib.parse.urlsplit(uri)
+    query = [(name, value) for name, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+             if name.lower() not in VOLATILE_PARAMS]
+    key = urllib.parse.urlunsplit((parts.scheme, parts.netloc, parts.path, urllib.parse.urlencode(query), ''))
+    if byterange is not None:
+        key += '@{}+{}'.format(byterange[1], byterange[0])
+    return key
+
+
+class SegmentCache:
+    """A size-bounded directory of segments, evicted in least-recently-used order."""
+
+    def __init__(self, cache_dir, max_size_bytes):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self._size = None  # total size of the entries, from a directory scan on the first put
+        self._lock = threading.Lock()
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _get_path(self, key):
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + CACHE_FILE_SUFFIX)
+
+    def get(self, key):
+        """Returns the cached segment data, or None."""
+        path = self._get_path(key)
+        try:
+            data = state.read_mapped(path)
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            pass  # evicted by another process since it was read: the data is still valid
+        return data
+
+    def get_path(self, key):
+        """Returns the path of the cached segment, or None."""
+        path = self._get_path(key)
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, data):
+        """Stores a segment, then evicts old entries if the cache is over its size limit."""
+        try:
+            state.atomic_write(self._get_path(key), data)
+        except OSError as ex:
+            LOG.debug('Could not write segment cache entry for %s: %s', key, ex)
+            return
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._scan())
+            else:
+                self._size += len(data)
+            if self._size > self.max_size_bytes:
+                self.evict()
+
+    def _scan(self):
+        entries = list()
+        for dir_entry in os.scandir(self.cache_dir):
+            if dir_entry.name.endswith(CACHE_FILE_SUFFIX):
+                try:
+                    stat = dir_entry.stat()
+                except FileNotFoundError:
+                    continue  # evicted by another process
+                entries.append((stat.st_mtime, stat.st_size, dir_entry.path))
+        return entries
+
+    def evict(self):
+        """Removes least-recently used entries until the cache is within its size limit."""
+        entries = self._scan()
+        total_size = sum(size for _, size, _ in entries)
+        if total_size > self.max_size_bytes:
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total_size -= size
+                if total_size <= self.max_size_bytes * EVICT_TO_RATIO:
+                    break
+        self._size = total_size
+
+
+def get_cache():
+    """Returns the segment cache, or None if caching is disabled in the config."""
+    global _CACHE
+    if _CACHE is None:
+        if config.CONFIG is None or not config.CONFIG.parser.getboolean('segment_cache', False):
+            return None
+        max_size_mb = config.CONFIG.parser.getint('segment_cache_max_mb', DEFAULT_MAX_SIZE_MB)
+        _CACHE = SegmentCache(os.path.join(config.CONFIG.dir, 'cache', 'segments'), max_size_mb * 1024 * 1024)
+    return _CACHE
@@ -0,0 +1,101 @@
+"""
+Shared state files
+
+Helpers for the files which are shared between concurrent nhlv processes (cookies, session keys,
+response caches):
+
+- locked(): an exclusive lock held for a read-modify-write cycle. This uses flock on a sidecar
+  '.lock' file; on platforms without fcntl the lock is a no-op.
+- atomic_write(): writes to a temporary file in the same directory, then renames it over the
+  target, so readers never see a partially written file.
+- read_mapped(): reads a file via a read-only memory map. Readers don't need the lock since
+  files are only ever replaced, never modified in place.
+"""
+
+import contextlib
+import logging
+import mmap
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # not available on Windows
+
+
+LOG = logging.getLogger(__name__)
+
+LOCK_SUFFIX = '.lock'
+
+# flock locks are per open file, so threads of this process are serialized separately
+_THREAD_LOCKS = dict()
+_THREAD_LOCKS_LOCK = threading.Lock()
+
+
+def _get_thread_lock(path):
+    with _THREAD_LOCKS_LOCK:
+        if path not in _THREAD_LOCKS:
+            _THREAD_LOCKS[path] = threading.RLock()
+        return _THREAD_LOCKS[path]
+
+
+@contextlib.contextmanager
+def locked(path):
+    """Holds an exclusive lock for path (across threads and processes) for the duration of the context."""
+    path = os.path.abspath(path)
+    with _get_thread_lock(path):
+        with open(path + LOCK_SUFFIX, 'a') as lock_handle:
+            if fcntl is not None:
+                fcntl.flock(lock_handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_handle, fcntl.LOCK_UN)
+
+
+def atomic_write(path, data, fsync=False):
+    """Replaces the file at path with data (str or bytes)."""
+    tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+    mode = 'wb' if isinstance(data, (bytes, bytearray, memoryview)) else 'w'
+    try:
+        with open(tmp_path, mode) as outfile:
+            outfile.write(data)
+            if fsync:
+                outfile.flush()
+                os.fsync(outfile.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+@contextlib.contextmanager
+def atomic_open(path, mode='w', **kwargs):
+    """Opens a temporary file for writing, which replaces the file at path when the context exits without error."""
+    tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+    try:
+        with open(tmp_path, mode, **kwargs) as outfile:
+            yield outfile
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def read_mapped(path, loads=bytes):
+    """Reads the file via a read-only memory map. Returns loads(buffer): the bytes by default, or
+    e.g. marshal.loads to parse the file without copying it first. Raises FileNotFoundError.
+    """
+    with open(path, 'rb') as infile:
+        if os.fstat(infile.fileno()).st_size == 0:
+            return loads(b'')
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return loads(mapped)
@@ -3,20 +3,34 @@ Streaming functions
 """
 
 import logging
+import math
 import os
+import shlex
 import subprocess
 
 from datetime import datetime
 from datetime import timezone
 from dateutil import parser
 
+import requests
+
 import mlbam.common.config as config
+import mlbam.common.hls as hls
+import mlbam.common.hlsproxy as hlsproxy
+import mlbam.common.httpclient as httpclient
+import mlbam.common.m3u8 as m3u8
+import mlbam.common.segmentcache as segmentcache
 import mlbam.common.util as util
 
 
 LOG = logging.getLogger(__name__)
 
 
+class StreamException(Exception):
+    """A stream can't be resolved, e.g. a blackout or an account without a subscription."""
+    pass
+
+
 def _has_game_started(start_time_utc):
     return start_time_utc.replace(timezone.utc) < datetime.now(timezone.utc)
 
@@ -33,7 +47,88 @@ def _get_resolution():
     return resolution
 
 
+def _get_variant_sort_key(variant):
+    height = variant.resolution[1] if variant.resolution else 0
+    return height, variant.frame_rate or 0, variant.bandwidth
+
+
+def get_variant_names(master_playlist):
+    """Returns a dict of stream name: variant, named as streamlink names them.
+
+    Video variants are named by height ('720p'). Where several variants share a height, the one
+    with the lowest frame rate/bandwidth keeps the plain name and the others are named '720p_alt',
+    '720p_alt2', ... so '720p_alt' is the 60fps stream. Variants with a frame rate above 30 are
+    also named with it ('720p60'). Audio-only variants are named by bandwidth ('64k').
+    """
+    names = dict()
+    groups = dict()
+    for variant in master_playlist.variants:
+        if variant.resolution:
+            base_name = '{}p'.format(variant.resolution[1])
+        else:
+            base_name = '{}k'.format(variant.bandwidth // 1000)
+        groups.setdefault(base_name, list()).append(variant)
+    for base_name, variants in groups.items():
+        for index, variant in enumerate(sorted(variants, key=_get_variant_sort_key)):
+            if index == 0:
+                names[base_name] = variant
+            else:
+                names['{}_alt{}'.format(base_name, index if index > 1 else '')] = variant
+            if variant.resolution and variant.frame_rate and variant.frame_rate > 30:
+                names.setdefault('{}{}'.format(base_name, int(round(variant.frame_rate))), variant)
+    return names
+
+
+def select_variant(master_playlist, resolution=None):
+    """Returns the variant for the first stream name in the comma-separated resolution list
+    (default: the 'resolution' config option) which is in the playlist.
+    'best' and 'worst' select the highest and lowest quality video variant.
+    Raises m3u8.PlaylistException if none of the names match.
+    """
+    if resolution is None:
+        resolution = config.CONFIG.parser.get('resolution', '720p_alt')
+    names = get_variant_names(master_playlist)
+    video_variants = sorted((variant for variant in master_playlist.variants if variant.resolution),
+                            key=_get_variant_sort_key) or master_playlist.variants
+    for name in (name.strip() for name in resolution.split(',')):
+        if name == 'best' and video_variants:
+            return video_variants[-1]
+        if name == 'worst' and video_variants:
+            return video_variants[0]
+        if name in names:
+            return names[name]
+    raise m3u8.PlaylistException('Resolution {} not found in {} (available: {})'.format(
+        resolution, master_playlist.url, ', '.join(sorted(names))))
+
+
+def resolve_playlist_url(playlist_url, headers=None, cookies=None, resolution=None):
+    """Resolves a master playlist to the url of the media playlist selected by the resolution
+    preference list (see select_variant). The media playlist url can be handed directly to the
+    player, or to streamlink, which then doesn't need to fetch the master playlist again.
+
+    Returns (url, stream name): the media playlist url and 'best' (its only stream in streamlink),
+    or the original url and the resolution list if the playlist can't be resolved here.
+    """
+    if resolution is None:
+        resolution = config.CONFIG.parser.get('resolution', '720p_alt')
+    try:
+        response = httpclient.get(playlist_url, headers=headers, cookies=cookies, timeout=30)
+        response.raise_for_status()
+        playlist = m3u8.parse(response.text, playlist_url)
+        if isinstance(playlist, m3u8.MediaPlaylist):
+            return playlist_url, 'best'
+        variant = select_variant(playlist, resolution)
+    except (requests.exceptions.RequestException, m3u8.PlaylistException) as ex:
+        LOG.warning('Could not resolve playlist, using it as is: %s', ex)
+        return playlist_url, _get_resolution()
+    LOG.debug('Selected variant %s for resolution %s', variant, resolution)
+    return variant.uri, 'best'
+
+
 def _uniquify_fetch_filename(fetch_filename, strategy='date'):
+    if os.path.exists(hls.get_journal_filename(fetch_filename)):
+        LOG.info('Resuming interrupted download: %s', fetch_filename)
+        return fetch_filename
     if os.path.exists(fetch_filename):
         # don't overwrite existing file - use a new name based on hour,minute
         fetch_filename_orig = fetch_filename
@@ -63,18 +158,75 @@ def get_fetch_filename(date_str, home_abbrev, away_abbrev, feedtype, fetch):
     return None
 
 
+def get_start_offset(playlist_url, start_time, headers=None, cookies=None):
+    """Returns (offset, is_live): the offset in seconds from the start of the media playlist of the
+    segment playing at the wall-clock start_time (epoch seconds), and whether the stream is live.
+    Raises m3u8.PlaylistException if the playlist can't be seeked by time.
+    """
+    response = httpclient.get(playlist_url, headers=headers, cookies=cookies, timeout=30)
+    response.raise_for_status()
+    playlist = m3u8.parse(response.text, playlist_url)
+    if isinstance(playlist, m3u8.MasterPlaylist):
+        raise m3u8.PlaylistException('Not a media playlist: {}'.format(playlist_url))
+    time_index = playlist.get_time_index()
+    return time_index.starts[time_index.find_time(start_time)], not playlist.endlist
+
+
+def format_offset(seconds):
+    """Formats an offset as HH:MM:SS for streamlink. Rounded up, so that it falls within the segment starting there."""
+    seconds = int(math.ceil(seconds))
+    return '{:02d}:{:02d}:{:02d}'.format(seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
+
+def play_cached(downloader, is_multi_highlight=False):
+    """Plays an archived stream in the video player through a local proxy, which reads the segments
+    through the segment cache: anything watched before is not downloaded again.
+    Returns False if the stream can't be played this way (e.g. a live stream).
+    """
+    video_player = config.CONFIG.parser['video_player']
+    if not video_player or downloader.segment_cache is None:
+        return False
+    proxy = hlsproxy.HlsProxy(downloader, config.CONFIG.parser.getint('proxy_prefetch', hlsproxy.DEFAULT_PREFETCH))
+    try:
+        playlist = proxy.get_playlist()
+        if not playlist.endlist:
+            return False
+        downloader.check_supported(playlist)
+    except (requests.exceptions.RequestException, hls.HlsException, m3u8.PlaylistException) as ex:
+        LOG.debug('Not playing through the segment cache: %s', ex)
+        return False
+    cmd = shlex.split(video_player)
+    if is_multi_highlight and cmd[0] == 'mpv':
+        cmd.append('--keep-open=no')
+    cmd.append(proxy.start())
+    LOG.info('Playing through the segment cache: %s', str(cmd))
+    try:
+        subprocess.run(cmd)
+    finally:
+        proxy.shutdown()
+    return True
+
+
 def play_highlight(playback_url, fetch_filename, is_multi_highlight=False):
     video_player = config.CONFIG.parser['video_player']
+    stream_name = _get_resolution()
+    if '.m3u8' in playback_url:
+        playback_url, stream_name = resolve_playlist_url(playback_url)
+        if not fetch_filename and segmentcache.get_cache() is not None:
+            downloader = hls.HlsDownloader(playback_url, None, select_variant=select_variant,
+                                           segment_cache=segmentcache.get_cache())
+            if play_cached(downloader, is_multi_highlight):
+                return
     if (fetch_filename is None or fetch_filename != '') \
             and not config.CONFIG.parser.getboolean('streamlink_highlights', True):
         cmd = [video_player, playback_url]
         LOG.info('Playing highlight: %s', str(cmd))
         subprocess.run(cmd)
     else:
-        streamlink_highlight(playback_url, fetch_filename, is_multi_highlight)
+        streamlink_highlight(playback_url, fetch_filename, is_multi_highlight, stream_name)
 
 
-def streamlink_highlight(playback_url, fetch_filename, is_multi_highlight=False):
+def streamlink_highlight(playback_url, fetch_filename, is_multi_highlight=False, stream_name=None):
     video_player = config.CONFIG.parser['video_player']
     streamlink_cmd = ["streamlink", ]
 
@@ -103,7 +255,7 @@ def streamlink_highlight(playback_url, fetch_filename, is_multi_highlight=False)
         streamlink_cmd.append("--loglevel")
         streamlink_cmd.append("debug")
     streamlink_cmd.append(playback_url)
-    streamlink_cmd.append(_get_resolution())
+    streamlink_cmd.append(stream_name or _get_resolution())
 
     LOG.info('Playing highlight via streamlink: %s', str(streamlink_cmd))
     subprocess.run(streamlink_cmd)
@@ -2,19 +2,24 @@
 Utility functions
 """
 
+import contextlib
 import logging
 import os.path
+import re
 import sys
 import tempfile
+import threading
 import time
 
-import requests
-
 from datetime import datetime
 from datetime import timezone
+from dateutil import parser as dateutil_parser
 from dateutil import tz
 
 import mlbam.common.config as config
+import mlbam.common.httpcache as httpcache
+import mlbam.common.httpclient as httpclient
+import mlbam.common.state as state
 
 
 LOG = None
@@ -71,15 +76,35 @@ def get_tempdir():
     return tempdir
 
 
-def request_json(url, output_filename=None):
-    """Sends a request expecting a json-formatted response."""
+def request_json(url, output_filename=None, cache_ttl=None):
+    """Sends a request expecting a json-formatted response.
+
+    cache_ttl: if not None, the response is cached on disk. A cached response younger than cache_ttl
+               seconds is returned without any request; an older one is revalidated with a
+               conditional request.
+    """
+    http_cache = None
+    cache_entry = None
+    if cache_ttl is not None:
+        http_cache = httpcache.get_cache()
+    if http_cache is not None:
+        cache_entry = http_cache.get(url)
+        if cache_entry is not None and cache_entry.is_fresh(cache_ttl):
+            LOG.debug('Using cached response for url=%s', url)
+            return cache_entry.data
+
     LOG.debug('Getting url=%s ...', url)
     headers = {
         'User-Agent': config.CONFIG.ua_iphone,
-        'Connection': 'close'
     }
+    if cache_entry is not None:
+        headers.update(cache_entry.get_validator_headers())
     log_http(url, 'get', headers, sys._getframe().f_code.co_name)
-    response = requests.get(url, headers=headers, verify=config.VERIFY_SSL)
+    response = httpclient.get(url, headers=headers)
+    if cache_entry is not None and response.status_code == 304:
+        LOG.debug('Cached response not modified for url=%s', url)
+        http_cache.refresh(cache_entry)
+        return cache_entry.data
     response.raise_for_status()
 
     # Note: this fails on windows in some cases https://github.com/kennethreitz/requests-html/issues/171
@@ -89,10 +114,12 @@ def request_json(url, output_filename=None):
                                      '{}-{}.json'.format(output_filename, time.strftime("%Y-%m-%d-%H%M")))
         else:
             json_file = os.path.join(get_tempdir(), '{}.json'.format(output_filename))
-        with open(json_file, 'w', encoding='utf-8') as out:  # write date to json_file
-            out.write(response.text)
+        state.atomic_write(json_file, response.content)
 
-    return response.json()
+    json_data = response.json()
+    if http_cache is not None:
+        http_cache.put(url, json_data, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+    return json_data
 
 
 def convert_time_to_local(d):
@@ -112,6 +139,31 @@ def get_csv_list(csv_string):
     return [l.strip() for l in csv_string.split(',')]
 
 
+def parse_duration(duration_str):
+    """Returns the seconds in a duration: [HH:]MM:SS, 1h30m10s or plain seconds."""
+    duration_str = duration_str.strip()
+    match = re.fullmatch(r'(?:(\d+)h)?(?:(\d+)m)?(?:(\d+(?:\.\d+)?)s)?', duration_str)
+    if match and duration_str:
+        hours, minutes, seconds = match.groups()
+        return int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds or 0)
+    seconds = 0.0
+    for field in duration_str.split(':'):
+        seconds = seconds * 60 + float(field)  # raises ValueError if invalid
+    return seconds
+
+
+def parse_start_time(start_time_str, date_str):
+    """Returns the epoch seconds of a wall-clock time: HH:MM[:SS] local time on the given date
+    (YYYY-MM-DD), or a full date and time (local time unless it includes a timezone).
+    """
+    if re.fullmatch(r'\d{1,2}:\d{2}(:\d{2})?', start_time_str.strip()):
+        start_time_str = '{} {}'.format(date_str, start_time_str.strip())
+    start_time = dateutil_parser.parse(start_time_str)
+    if start_time.tzinfo is None:
+        start_time = start_time.replace(tzinfo=tz.tzlocal())
+    return start_time.timestamp()
+
+
 def log_http(url, request_type=None, headers=None, method_name=None):
     """Helper function to log http requests."""
     msg = ''
@@ -126,3 +178,38 @@ def log_http(url, request_type=None, headers=None, method_name=None):
     LOG.debug(msg)
 
 
+class StepTimer:
+    """Records the start and end times of named steps (which may run in different threads), for a timing report."""
+
+    def __init__(self):
+        self.start_time = time.monotonic()
+        self.steps = list()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def step(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.steps.append((name, start - self.start_time, time.monotonic() - self.start_time))
+
+    def run(self, name, func, *args, **kwargs):
+        """Calls func, timed as the given step."""
+        with self.step(name):
+            return func(*args, **kwargs)
+
+    def get_report_lines(self):
+        lines = list()
+        for name, start, end in sorted(self.steps, key=lambda step: step[1]):
+            lines.append('{:<12} {:6.3f}s  ({:.3f} - {:.3f})'.format(name, end - start, start, end))
+        lines.append('{:<12} {:6.3f}s'.format('total', time.monotonic() - self.start_time))
+        return lines
+
+    def report(self):
+        """Logs the timing report (at info level if verbose)."""
+        level = logging.INFO if config.VERBOSE else logging.DEBUG
+        LOG.log(level, 'Startup timing:')
+        for line in self.get_report_lines():
+            LOG.log(level, '  %s', line)
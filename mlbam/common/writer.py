@@ -0,0 +1,247 @@
+"""
+Recording writer
+
+The output stage of the native downloader, written for small machines recording several games
+at once:
+
+- BufferPool: a fixed set of reusable buffers which segments are read into, so memory use is
+  bounded by the download window and doesn't churn with every segment.
+- RecordingWriter: coalesces the segments into large writes, aligned to the filesystem block
+  size. The expected size of the recording is preallocated to avoid fragmentation, where the
+  filesystem supports it natively (fallocate); the unused remainder is truncated on close. Data
+  is fsync'ed according to the fsync policy: 'none', 'close' (default), or a number of MB between
+  fsyncs.
+  Segments which are already in a file (e.g. the segment cache) are joined into the recording
+  with copy_file_range, without passing the data through python.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import threading
+
+
+LOG = logging.getLogger(__name__)
+
+BLOCK_SIZE = 4096
+DEFAULT_WRITE_SIZE = 4 * 1024 * 1024
+DEFAULT_BUFFER_SIZE = 2 * 1024 * 1024  # initial size of a pool buffer; grown to the largest segment
+FSYNC_NONE = 'none'
+FSYNC_CLOSE = 'close'
+
+
+def _load_fallocate():
+    """Returns libc's fallocate(fd, mode, offset, length), or None if there is none (e.g. not Linux).
+    Unlike posix_fallocate, it fails where the filesystem can't preallocate, rather than writing zeros.
+    """
+    library = ctypes.util.find_library('c')
+    if library is None:
+        return None
+    try:
+        libc = ctypes.CDLL(library, use_errno=True)
+    except OSError:
+        return None
+    fallocate = getattr(libc, 'fallocate64', None) or getattr(libc, 'fallocate', None)
+    if fallocate is not None:
+        fallocate.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64)
+        fallocate.restype = ctypes.c_int
+    return fallocate
+
+
+_FALLOCATE = _load_fallocate()
+
+
+class BufferPool:
+    """A fixed number of reusable bytearrays. acquire() blocks until a buffer is released."""
+
+    def __init__(self, count, size=DEFAULT_BUFFER_SIZE):
+        self._buffers = [bytearray(size) for _ in range(count)]
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while not self._buffers:
+                self._condition.wait()
+            return self._buffers.pop()
+
+    def release(self, buffer):
+        with self._condition:
+            self._buffers.append(buffer)
+            self._condition.notify()
+
+
+def readinto_all(infile, buffer, offset=0):
+    """Reads infile (with a readinto method) to its end into buffer, starting at offset, growing the
+    buffer if required. Returns the total length of the data in buffer.
+    """
+    length = offset
+    while True:
+        if length == len(buffer):
+            buffer.extend(bytes(max(len(buffer), BLOCK_SIZE)))
+        with memoryview(buffer) as view:
+            count = infile.readinto(view[length:])
+        if not count:
+            return length
+        length += count
+
+
+def pread(fileno, length, offset):
+    """os.pread, or seek and read where it isn't available (Windows)."""
+    if hasattr(os, 'pread'):
+        return os.pread(fileno, length, offset)
+    os.lseek(fileno, offset, os.SEEK_SET)
+    return os.read(fileno, length)
+
+
+def pwrite(fileno, data, offset):
+    """os.pwrite, or seek and write where it isn't available (Windows). Returns the number of bytes written."""
+    if hasattr(os, 'pwrite'):
+        return os.pwrite(fileno, data, offset)
+    os.lseek(fileno, offset, os.SEEK_SET)
+    return os.write(fileno, data)
+
+
+def copy_file_range(src_fd, dst_fd, length, dst_offset):
+    """Copies length bytes from the start of src_fd to dst_offset in dst_fd, within the kernel
+    where possible (os.copy_file_range), falling back to reading and writing.
+    """
+    copied = 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while copied < length:
+                count = os.copy_file_range(src_fd, dst_fd, length - copied, copied, dst_offset + copied)
+                if count == 0:
+                    break
+                copied += count
+        except OSError as ex:
+            LOG.debug('copy_file_range failed, copying via python: %s', ex)
+    while copied < length:
+        data = pread(src_fd, min(length - copied, DEFAULT_WRITE_SIZE), copied)
+        if not data:
+            raise EOFError('Unexpected end of file: {} of {} bytes copied'.format(copied, length))
+        pwrite(dst_fd, data, dst_offset + copied)
+        copied += len(data)
+    return copied
+
+
+def preallocate(fileno, offset, length):
+    """Reserves length bytes at offset in the file. Returns False if the filesystem can't do it
+    natively: the emulation of posix_fallocate writes zeros over the whole (estimated) size first.
+    """
+    if _FALLOCATE is None:
+        return False
+    if _FALLOCATE(fileno, 0, offset, length) != 0:
+        LOG.debug('Not preallocating %s bytes: %s', length, os.strerror(ctypes.get_errno()))
+        return False
+    return True
+
+
+def get_fsync_interval(fsync_policy):
+    """Returns the number of bytes between fsyncs for a policy: None for no periodic fsync.
+    Raises ValueError for an invalid policy.
+    """
+    if fsync_policy in (FSYNC_NONE, FSYNC_CLOSE):
+        return None
+    interval_mb = int(fsync_policy)
+    if interval_mb <= 0:
+        raise ValueError('Invalid fsync interval: {}'.format(fsync_policy))
+    return interval_mb * 1024 * 1024
+
+
+class RecordingWriter:
+    """Writes the segments of a recording to a file, starting at offset.
+
+    Each write is given an entry, which is passed to on_written() once the data is in the file
+    (e.g. to record it in a journal).
+    """
+
+    def __init__(self, outfile, offset=0, expected_size=None, write_size=DEFAULT_WRITE_SIZE,
+                 fsync_policy=FSYNC_CLOSE, on_written=None):
+        """
+        outfile: binary file opened for writing; its position isn't used
+        expected_size: the expected total size of the file, which is preallocated
+        """
+        self.fileno = outfile.fileno()
+        self.position = offset  # the end of the data written so far, including the buffer
+        try:
+            self._fsync_interval = get_fsync_interval(fsync_policy)
+        except ValueError:
+            LOG.warning("Invalid fsync policy '%s', using '%s'", fsync_policy, FSYNC_CLOSE)
+            fsync_policy = FSYNC_CLOSE
+            self._fsync_interval = None
+        self.fsync_policy = fsync_policy
+        self.on_written = on_written
+        self._unsynced = 0
+        self._buffer = bytearray(max(write_size // BLOCK_SIZE, 1) * BLOCK_SIZE)
+        self._fill = 0
+        self._buffer_offset = offset  # the file offset of the start of the buffer
+        self._entries = list()  # entries of the data in the buffer
+        if expected_size and expected_size > offset:
+            preallocate(self.fileno, offset, expected_size - offset)
+
+    def _get_capacity(self):
+        # the first write ends on a block boundary, so that all further writes are aligned
+        return len(self._buffer) - self._buffer_offset % BLOCK_SIZE
+
+    def write(self, data, entry=None):
+        """Appends data (a bytes-like object) to the recording."""
+        with memoryview(data) as view:
+            written = 0
+            while written < len(view):
+                count = min(len(view) - written, self._get_capacity() - self._fill)
+                self._buffer[self._fill:self._fill + count] = view[written:written + count]
+                self._fill += count
+                written += count
+                if self._fill == self._get_capacity():
+                    self._flush_buffer()
+            self.position += len(view)
+        if entry is not None:
+            self._entries.append(entry)
+            if self._fill == 0:
+                self._complete_entries()
+
+    def join(self, infile, length, entry=None):
+        """Appends the first length bytes of the (binary) file to the recording."""
+        self._flush_buffer()
+        copy_file_range(infile.fileno(), self.fileno, length, self.position)
+        self.position += length
+        self._buffer_offset = self.position
+        self._after_write(length)
+        if entry is not None:
+            self._entries.append(entry)
+        self._complete_entries()
+
+    def _flush_buffer(self):
+        if self._fill == 0:
+            return
+        with memoryview(self._buffer) as view:
+            written = 0
+            while written < self._fill:
+                written += pwrite(self.fileno, view[written:self._fill], self._buffer_offset + written)
+        self._buffer_offset += self._fill
+        self._after_write(self._fill)
+        self._fill = 0
+        self._complete_entries()
+
+    def _after_write(self, length):
+        if self._fsync_interval is not None:
+            self._unsynced += length
+            if self._unsynced >= self._fsync_interval:
+                os.fsync(self.fileno)
+                self._unsynced = 0
+
+    def _complete_entries(self):
+        """Passes on the entries once the buffer is empty: all their data is in the file."""
+        entries = self._entries
+        self._entries = list()
+        if self.on_written is not None:
+            for entry in entries:
+                self.on_written(entry)
+
+    def close(self):
+        """Writes the buffered data and truncates the preallocated space which wasn't used."""
+        self._flush_buffer()
+        os.ftruncate(self.fileno, self.position)
+        if self.fsync_policy != FSYNC_NONE:
+            os.fsync(self.fileno)
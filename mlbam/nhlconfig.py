@@ -25,12 +25,14 @@ DEFAULTS = {  # is applied to initial config before reading from file - these ar
         'video_player': 'mpv',
 
         'api_url': 'http://statsapi.web.nhl.com/api/v1/',
+        'schedule_chunk_days': '31',  # maximum number of days per schedule request
+        'lean_fetch': 'true',  # request only the fields required from the schedule
         # 'mf_svc_url': 'https://mf.svc.nhl.com/ws/media/mf/v2.4/stream',
         'mf_svc_url': 'https://mf.svc.nhl.com/ws/media/mf/v2.4/stream?contentId={}&playbackScenario={}&platform={}&sessionKey={}&cdnName={}',
         'ua_nhl': 'NHL/11479 CFNetwork/887 Darwin/17.0.0',
         'svc_user_agent': 'NHL/11479 CFNetwork/887 Darwin/17.0.0',
 
-        'streamlink_highlights': 'true',  # if false will send url direct to video_player (no resolution selection)
+        'streamlink_highlights': 'true',  # if false will send the selected stream url direct to video_player
         'streamlink_passthrough_highlights': 'true',  # allows seeking
         'streamlink_passthrough': 'false',
         'streamlink_hls_audio_select': '*',
@@ -41,6 +43,43 @@ DEFAULTS = {  # is applied to initial config before reading from file - these ar
         'verbose': 'false',
         'game_critical_colour': 'yellow',
         'verify_ssl': 'true',
+        'http_pool_connections': '10',  # number of hosts to keep open connections to
+        'http_pool_maxsize': '4',  # maximum open connections per host
+        'http_cache': 'true',
+        'http_cache_max_mb': '50',
+        'cache_ttl_schedule': '30',  # seconds
+        'cache_ttl_standings': '600',  # seconds
+        'watch_interval_critical': '10',  # seconds
+        'watch_interval_live': '20',  # seconds
+        'watch_interval_preview': '300',  # seconds
+        'wait_lead_secs': '300',  # seconds
+        'wait_feed_timeout_secs': '3600',  # seconds
+        'prewarm_urls': '',  # comma-separated, e.g. CDN hosts
+        'plays_poll_interval': '10',  # seconds
+        'record_replan_secs': '1800',  # seconds
+        'record_max_concurrent': '4',
+        'record_max_retries': '3',
+        'record_start_lead_secs': '600',  # seconds
+        'resolve_workers': '8',
+        'credentials_refresh_margin_secs': '300',  # seconds
+        'media_auth_ttl_secs': '7200',  # seconds
+        'session_key_ttl_secs': '86400',  # seconds
+        'session_key_blackout_ttl_secs': '3600',  # seconds
+        'stream_cache': 'true',
+        'native_fetch': 'true',
+        'fetch_workers': '4',
+        'fetch_window': '8',
+        'fetch_fsync': 'close',  # none, close, or a number of MB between fsyncs
+        'proxy_host': '127.0.0.1',  # this machine only; 0.0.0.0 serves players on the local network
+        'proxy_port': '8400',
+        'proxy_prefetch': '3',  # segments
+        'segment_cache': 'false',
+        'segment_cache_max_mb': '2048',
+        'season_store': 'true',
+        'store_ttl_live': '30',  # seconds
+        'store_ttl_preview': '3600',  # seconds
+        'store_preview_lead_secs': '900',
+        'store_final_settle_secs': '21600',
         'save_json_file_by_timestamp': 'false',
         'unicode': 'true',
     }
@@ -0,0 +1,139 @@
+"""
+Live game feed (play-by-play)
+
+A LiveFeed does one full request of the statsapi live feed (game/<pk>/feed/live), then keeps it
+current by polling feed/live/diffPatch with the timestamp of the last update and applying the
+returned JSON patches in place. This avoids downloading the whole feed document on each refresh,
+so several live games can be followed at once.
+
+The plays are exposed as Event objects, for goals, penalties and period transitions by default.
+"""
+
+import logging
+import time
+
+import requests
+
+import mlbam.common.config as config
+import mlbam.common.jsonpatch as jsonpatch
+import mlbam.common.util as util
+
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 10
+
+# statsapi result.eventTypeId values
+DEFAULT_EVENT_TYPES = frozenset(('GOAL', 'PENALTY', 'PERIOD_START', 'PERIOD_END', 'GAME_END'))
+
+
+class Event:
+    """A single play from the live feed."""
+    __slots__ = ('game_pk', 'index', 'event_type', 'description', 'period', 'period_ordinal',
+                 'period_time', 'team', 'away_goals', 'home_goals')
+
+    def __init__(self, game_pk, play_json):
+        about = play_json['about']
+        self.game_pk = game_pk
+        self.index = about['eventIdx']
+        self.event_type = play_json['result']['eventTypeId']
+        self.description = play_json['result'].get('description', '')
+        self.period = about.get('period')
+        self.period_ordinal = about.get('ordinalNum', '')
+        self.period_time = about.get('periodTime', '')
+        if 'team' in play_json:
+            self.team = play_json['team'].get('triCode', '').lower()
+        else:
+            self.team = None
+        self.away_goals = about['goals']['away']
+        self.home_goals = about['goals']['home']
+
+    def __repr__(self):
+        return '<Event {} {} {} {}>'.format(self.game_pk, self.period_ordinal, self.period_time, self.event_type)
+
+
+class LiveFeed:
+    """The live feed for a single game, refreshed incrementally."""
+
+    def __init__(self, game_pk):
+        self.game_pk = game_pk
+        self.feed = None
+        self.timecode = None
+        self._next_play_index = 0
+
+    def _get_url(self, path=''):
+        return '{0}/game/{1}/feed/live{2}'.format(config.CONFIG.parser['api_url'], self.game_pk, path)
+
+    def _fetch_full(self):
+        LOG.debug('Requesting full live feed for game %s', self.game_pk)
+        self.feed = util.request_json(self._get_url(), 'feedlive')
+        self.timecode = self.feed['metaData']['timeStamp']
+
+    def _fetch_patch(self):
+        """Returns False if the feed has not changed."""
+        patches = util.request_json(self._get_url('/diffPatch?startTimecode={}'.format(self.timecode)))
+        if not patches:
+            return False
+        if isinstance(patches, dict):
+            # the full document is returned if the changes can't be expressed as patches
+            self.feed = patches
+        else:
+            for patch in patches:
+                self.feed = jsonpatch.apply_patch(self.feed, patch['diff'])
+        self.timecode = self.feed['metaData']['timeStamp']
+        return True
+
+    def refresh(self):
+        """Brings the feed up to date. Returns False if the feed has not changed."""
+        if self.feed is None:
+            self._fetch_full()
+            return True
+        try:
+            return self._fetch_patch()
+        except (jsonpatch.JsonPatchException, KeyError, TypeError) as ex:
+            LOG.debug('Could not apply live feed patch for game %s (%s), requesting full feed', self.game_pk, ex)
+            self._fetch_full()
+            return True
+
+    def is_final(self):
+        return self.feed is not None and self.feed['gameData']['status']['abstractGameState'] == 'Final'
+
+    def get_new_events(self, event_types=DEFAULT_EVENT_TYPES):
+        """Returns the events added since the last call."""
+        if self.feed is None:
+            return list()
+        plays = self.feed['liveData']['plays']['allPlays']
+        events = [Event(self.game_pk, play) for play in plays[self._next_play_index:]
+                  if event_types is None or play['result']['eventTypeId'] in event_types]
+        self._next_play_index = len(plays)
+        return events
+
+
+def iter_events(live_feeds, event_types=DEFAULT_EVENT_TYPES, poll_interval=None):
+    """Yields new events from each of the live feeds, as they happen, until all games are final."""
+    if poll_interval is None:
+        poll_interval = config.CONFIG.parser.getint('plays_poll_interval', DEFAULT_POLL_INTERVAL)
+    active_feeds = list(live_feeds)
+    while active_feeds:
+        for live_feed in list(active_feeds):
+            try:
+                live_feed.refresh()
+            except requests.exceptions.RequestException as ex:
+                LOG.warning('Live feed request failed for game %s: %s', live_feed.game_pk, ex)
+                continue
+            yield from live_feed.get_new_events(event_types)
+            if live_feed.is_final():
+                active_feeds.remove(live_feed)
+        if active_feeds:
+            time.sleep(poll_interval)
+
+
+def format_event(event, game_rec=None):
+    """Returns a one-line display string for the event."""
+    prefix = ''
+    if game_rec is not None:
+        prefix = '{}@{} '.format(game_rec.away.abbrev.upper(), game_rec.home.abbrev.upper())
+    score = ''
+    if event.event_type == 'GOAL':
+        score = ' ({}-{})'.format(event.away_goals, event.home_goals)
+    return '{}{} {:>5} {}{}'.format(prefix, event.period_ordinal, event.period_time, event.description, score)
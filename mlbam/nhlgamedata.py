@@ -9,11 +9,15 @@ import time
 
 from datetime import datetime
 from datetime import timedelta
+from datetime import timezone
+
+import requests
 
 import mlbam.common.config as config
 import mlbam.common.gamedata as gamedata
 import mlbam.common.util as util
 import mlbam.common.displayutil as displayutil
+import mlbam.nhlstore as nhlstore
 
 from mlbam.common.displayutil import ANSI
 
@@ -49,150 +53,356 @@ FEEDTYPE_MAP = {
     'audio-home': 'aud-h',
 }
 
+# statsapi team ids, used to request the schedule for a single team
+TEAM_IDS = {
+    'njd': 1, 'nyi': 2, 'nyr': 3, 'phi': 4, 'pit': 5, 'bos': 6, 'buf': 7, 'mtl': 8,
+    'ott': 9, 'tor': 10, 'car': 12, 'fla': 13, 'tbl': 14, 'wsh': 15, 'chi': 16, 'det': 17,
+    'nsh': 18, 'stl': 19, 'cgy': 20, 'col': 21, 'edm': 22, 'van': 23, 'ana': 24, 'dal': 25,
+    'lak': 26, 'sjs': 28, 'cbj': 29, 'min': 30, 'wpg': 52, 'ari': 53, 'vgk': 54, 'sea': 55,
+}
+
+# Flags for the data a command needs from the schedule. The teams/game state are always included.
+NEED_TEAMS = 1
+NEED_LINESCORE = 2
+NEED_FEEDS = 4
+NEED_ALL = NEED_TEAMS | NEED_LINESCORE | NEED_FEEDS
+
+SCHEDULE_EXPANDS = {
+    NEED_TEAMS: 'schedule.teams',
+    NEED_LINESCORE: 'schedule.linescore',
+    NEED_FEEDS: 'schedule.game.content.media.epg',
+}
+
+# the fields= projection: names of the fields to keep in the response, for each NEED_* flag (0: always)
+SCHEDULE_FIELDS = {
+    0: 'dates,date,games,gamePk,gameDate,season,status,abstractGameState,detailedState',
+    NEED_TEAMS: 'teams,away,home,team,id,name,abbreviation,score',
+    NEED_LINESCORE: 'linescore,currentPeriod,currentPeriodOrdinal,currentPeriodTimeRemaining,hasShootout',
+    NEED_FEEDS: 'content,media,epg,title,items,mediaFeedType,mediaPlaybackId,eventId,callLetters,mediaState,'
+                'playbacks,name,url',
+}
+
+
+class Team:
+    """A team in a game record."""
+    __slots__ = ('name', 'abbrev', 'score')
+
+    def __init__(self, name, abbrev, score=0):
+        self.name = name
+        self.abbrev = abbrev
+        self.score = score
+
+    @classmethod
+    def from_json(cls, team_json):
+        return cls(team_json['team']['name'], team_json['team']['abbreviation'].lower(), team_json.get('score', 0))
+
+
+class Linescore:
+    """Current period/time of a game."""
+    __slots__ = ('current_period', 'current_period_ordinal', 'current_period_time_remaining', 'has_shootout')
+
+    def __init__(self, current_period=0, current_period_ordinal='Not Started',
+                 current_period_time_remaining='20:00', has_shootout=False):
+        self.current_period = current_period
+        self.current_period_ordinal = current_period_ordinal  # "2nd", "OT", "SO"
+        self.current_period_time_remaining = current_period_time_remaining  # "18:58", "Final"
+        self.has_shootout = has_shootout
+
+    @classmethod
+    def from_json(cls, linescore_json):
+        if 'currentPeriodOrdinal' not in linescore_json:
+            return cls(linescore_json.get('currentPeriod', 0))
+        return cls(linescore_json['currentPeriod'],
+                   linescore_json['currentPeriodOrdinal'],
+                   linescore_json['currentPeriodTimeRemaining'],
+                   bool(linescore_json['hasShootout']))
+
+
+class Feed:
+    """A game feed: either a live/archive stream, an audio stream or a highlight (condensed/recap)."""
+    __slots__ = ('feedtype', 'media_playback_id', 'event_id', 'call_letters', 'playback_url', 'media_state')
+
+    def __init__(self, feedtype, media_playback_id, event_id=None, call_letters=None, playback_url=None,
+                 media_state=None):
+        self.feedtype = feedtype
+        self.media_playback_id = media_playback_id
+        self.event_id = event_id
+        self.call_letters = call_letters
+        self.playback_url = playback_url
+        self.media_state = media_state  # MEDIA_OFF, MEDIA_ON, MEDIA_ARCHIVE
+
+    @classmethod
+    def from_stream_json(cls, feedtype, stream_json):
+        return cls(feedtype, str(stream_json['mediaPlaybackId']), str(stream_json['eventId']),
+                   stream_json['callLetters'], media_state=stream_json.get('mediaState'))
+
+    def is_available(self):
+        """Returns False if the stream has not started yet."""
+        return self.media_state != 'MEDIA_OFF'
+
+    @classmethod
+    def from_highlight_json(cls, feedtype, highlight_json):
+        feed = cls(feedtype, str(highlight_json['mediaPlaybackId']))
+        for playback_item in highlight_json['playbacks']:
+            if playback_item['name'] == config.CONFIG.playback_scenario:
+                feed.playback_url = playback_item['url']
+        return feed
+
+
+def _parse_epg(epg):
+    """Parses the content.media.epg list into a dict of feedtype: Feed."""
+    feeds = dict()
+    for media in epg:
+        if media['title'] == 'NHLTV':
+            for stream in media['items']:
+                if stream['mediaFeedType'] not in ('COMPOSITE', 'ISO'):
+                    # home, away, national, french...:
+                    feedtype = stream['mediaFeedType'].lower()
+                    feeds[feedtype] = Feed.from_stream_json(feedtype, stream)
+        elif media['title'] in ('Extended Highlights', 'Recap'):
+            feedtype = 'condensed' if media['title'] == 'Extended Highlights' else 'recap'
+            if len(media['items']) > 0:
+                feeds[feedtype] = Feed.from_highlight_json(feedtype, media['items'][0])
+        elif media['title'] == 'Audio':
+            for stream in media['items']:
+                # home, away, national, french, ...:
+                feedtype = 'audio-' + stream['mediaFeedType'].lower()
+                feeds[feedtype] = Feed.from_stream_json(feedtype, stream)
+    return feeds
+
+
+class GameRecord:
+    """A single game from the schedule.
+
+    The feeds are parsed from the EPG on first access to the 'feeds' attribute, since most
+    listings never look at them. If the EPG was not requested with the schedule (see NEED_FEEDS)
+    then it is requested for this game on first access.
+    """
+    __slots__ = ('game_pk', 'abstract_game_state', 'detailed_state', 'nhldate', 'away', 'home',
+                 'linescore', 'favourite', '_epg', '_feeds')
+
+    def __init__(self, game_json, has_feeds=True):
+        self.game_pk = str(game_json['gamePk'])
+        self.abstract_game_state = game_json['status']['abstractGameState']  # Preview, Live, Final
+        # is something like: Scheduled, Live, Final, In Progress, Critical:
+        self.detailed_state = game_json['status']['detailedState']
+        self.nhldate = datetime.strptime(game_json['gameDate'],
+                                         "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+        self.away = Team.from_json(game_json['teams']['away'])
+        self.home = Team.from_json(game_json['teams']['home'])
+        self.linescore = Linescore.from_json(game_json.get('linescore', {}))
+        self.favourite = None
+        self.favourite = gamedata.is_fav(self)
+        self._epg = None
+        if has_feeds:
+            self._epg = _get_epg_json(game_json)
+        self._feeds = None
+
+    @property
+    def feeds(self):
+        """Dict of feedtype: Feed"""
+        if self._feeds is None:
+            if self._epg is None:
+                self._epg = GameDataRetriever.request_game_epg(self.game_pk)
+            self._feeds = _parse_epg(self._epg)
+            self._epg = None
+        return self._feeds
+
+    def refresh_feeds(self):
+        """Requests the EPG for this game again, bypassing the http cache."""
+        self._epg = GameDataRetriever.request_game_epg(self.game_pk, use_cache=False)
+        self._feeds = None
+        return self.feeds
+
+    def copy_feeds_from(self, game_rec):
+        """Re-use the already parsed feeds of an earlier record of the same game."""
+        if game_rec._feeds is not None:  # pylint: disable=protected-access
+            self._feeds = game_rec._feeds  # pylint: disable=protected-access
+            self._epg = None
+
+    def __repr__(self):
+        return 'GameRecord({}: {} at {}, {})'.format(self.game_pk, self.away.abbrev, self.home.abbrev,
+                                                     self.abstract_game_state)
+
+
+def choose_feedtype(game_rec, team_code, feedtype=None):
+    """Returns the feedtype to play for the team's game: feedtype if given, otherwise the team's own
+    (home/away) feed, otherwise the first game feed (not audio or a highlight). None if there is no such feed.
+    """
+    feeds = game_rec.feeds
+    if feedtype is not None:
+        return feedtype if feedtype in feeds else None
+    team_feedtype = 'away' if game_rec.away.abbrev == team_code else 'home'
+    if team_feedtype in feeds:
+        return team_feedtype
+    for candidate, feed in feeds.items():
+        if feed.event_id is not None and not candidate.startswith('audio-'):
+            LOG.info("Default (home/away) feed not found: chose '%s' feed (override with --feed option)", candidate)
+            return candidate
+    return None
+
+
+def _get_epg_json(game_json):
+    return game_json.get('content', {}).get('media', {}).get('epg', ())
+
 
 # pylint: disable=too-few-public-methods, too-many-statements
 class GameDataRetriever:
     """Retrieves and parses game data from statsapi.mlb.com"""
 
-    @staticmethod
-    def _get_games_by_date(date_str=None):  # pylint: disable=too-many-branches
-        if date_str is None:
-            date_str = time.strftime("%Y-%m-%d")
-        # if config.SAVE_JSON_FILE_BY_TIMESTAMP:
-        #     json_file = os.path.join(
-        #         config.CONFIG.dir,
-        #         'gamedata-{}.json'.format(time.strftime("%Y-%m-%d-%H%M")))
-        # else:
-        #     json_file = os.path.join(config.CONFIG.dir, 'gamedata.json')
-        LOG.debug('Getting game data...')
+    def __init__(self, use_store=True, use_cache=True):
+        self.store = None
+        if use_store:
+            self.store = nhlstore.get_store()
+        self.use_cache = use_cache
 
-        url = ('{0}/schedule?&startDate={1}&endDate={1}&expand='
-               'schedule.teams,schedule.linescore,schedule.game.content'
-               '.media.epg').format( config.CONFIG.parser['api_url'],
-                                    date_str)
-        json_data = util.request_json(url, 'gamedata')
-
-        game_records = dict()  # we return this dictionary
+    @staticmethod
+    def _request_schedule(query_str, needs=NEED_ALL, use_cache=True):
+        """Requests the schedule, expanded with only the data given in needs."""
+        expands = [SCHEDULE_EXPANDS[need] for need in sorted(SCHEDULE_EXPANDS) if needs & need]
+        url = '{0}/schedule?&{1}&expand={2}'.format(config.CONFIG.parser['api_url'], query_str, ','.join(expands))
+        if config.CONFIG.parser.getboolean('lean_fetch', True):
+            fields = [SCHEDULE_FIELDS[need] for need in sorted(SCHEDULE_FIELDS) if needs & need or need == 0]
+            url += '&fields={}'.format(','.join(fields))
+        cache_ttl = None
+        if use_cache:
+            cache_ttl = config.CONFIG.parser.getint('cache_ttl_schedule')
+        return util.request_json(url, 'gamedata', cache_ttl=cache_ttl)
+
+    def _get_schedule_json(self, start_date_str, end_date_str, needs=NEED_ALL, team_code=None):
+        LOG.debug('Getting game data for %s to %s...', start_date_str, end_date_str)
+        query_str = 'startDate={}&endDate={}'.format(start_date_str, end_date_str)
+        if team_code is not None:
+            query_str += '&teamId={}'.format(TEAM_IDS[team_code])
+        return self._request_schedule(query_str, needs, self.use_cache)
 
-        if json_data is None:
-            LOG.error("No JSON data returned for %s", date_str)
-            return None
-        if json_data['dates'] is None or len(json_data['dates']) < 1:
-            LOG.debug("_get_games_by_date: no game data for %s", date_str)
-            return None
+    @staticmethod
+    def request_game_epg(game_pk, use_cache=True):
+        """Requests only the EPG for a single game."""
+        LOG.debug('Getting feeds for game %s...', game_pk)
+        json_data = GameDataRetriever._request_schedule('gamePk={}'.format(game_pk), NEED_FEEDS, use_cache)
+        if json_data is None or not json_data.get('dates'):
+            return ()
+        return _get_epg_json(json_data['dates'][0]['games'][0])
 
-        for game in json_data['dates'][0]['games']:  # pylint: disable=too-many-nested-blocks
-            # LOG.debug('game: {}'.format(game))
-            game_pk_str = str(game['gamePk'])
-            game_records[game_pk_str] = dict()
-            game_rec = game_records[game_pk_str]
-            game_rec['game_pk'] = game_pk_str
-            game_rec['abstractGameState'] = str(
-                game['status']['abstractGameState'])  # Preview, Live, Final
-            # is something like: Scheduled, Live, Final, In Progress, Critical:
-            game_rec['detailedState'] = str(game['status']['detailedState'])
-            game_rec['nhldate'] = datetime.strptime(str(game['gameDate']),
-                                                    "%Y-%m-%dT%H:%M:%SZ")
-            game_rec['away'] = dict()
-            game_rec['away']['name'] = str(
-                game['teams']['away']['team']['name'])
-            game_rec['away']['abbrev'] = str(
-                game['teams']['away']['team']['abbreviation'].lower())
-            game_rec['away']['score'] = str(game['teams']['away']['score'])
-            game_rec['home'] = dict()
-            game_rec['home']['name'] = str(
-                game['teams']['home']['team']['name'])
-            game_rec['home']['abbrev'] = str(
-                game['teams']['home']['team']['abbreviation'].lower())
-            game_rec['home']['score'] = str(game['teams']['home']['score'])
-            game_rec['favourite'] = gamedata.is_fav(game_rec)
-            # game_rec['nhltv_link'] = 'http://nhl.com/tv/{0}/'.format(game_pk_str)
-
-            # linescore
-            game_rec['linescore'] = dict()
-            game_rec['linescore']['currentPeriod'] = str(
-                game['linescore']['currentPeriod'])
-            if 'currentPeriodOrdinal' in game['linescore']:
-                game_rec['linescore']['currentPeriodOrdinal'] = str(
-                    game['linescore']
-                    ['currentPeriodOrdinal'])  # : "2nd", "OT", "SO"
-                game_rec['linescore']['currentPeriodTimeRemaining'] = str(
-                    game['linescore']['currentPeriodTimeRemaining']
-                )  # : "18:58", "Final"
-                game_rec['linescore']['hasShootout'] = bool(
-                    game['linescore']['hasShootout'])
+    @staticmethod
+    def _parse_games(games, has_feeds=True):
+        """Returns a GameRecords dict of game_pk: GameRecord
+        games: either a list of statsapi games, or a list of (statsapi game, needs) tuples from the store
+        """
+        game_records = gamedata.GameRecords()  # we return this dictionary
+        for game in games:
+            if isinstance(game, tuple):
+                game, needs = game
+                game_records.add(GameRecord(game, needs & NEED_FEEDS != 0))
             else:
-                game_rec['linescore']['currentPeriodOrdinal'] = 'Not Started'
-                game_rec['linescore']['currentPeriodTimeRemaining'] = '20:00'
-                game_rec['linescore']['hasShootout'] = False
-
-            # epg
-            game_rec['feed'] = dict()
-            if 'media' in game['content'] and 'epg' in game['content']['media']:
-                for media in game['content']['media']['epg']:
-                    if media['title'] == 'NHLTV':
-                        for stream in media['items']:
-                            if (stream['mediaFeedType'] != 'COMPOSITE'
-                                    and stream['mediaFeedType'] != 'ISO'):
-                                # home, away, national, french...:
-                                feedtype = str(stream['mediaFeedType']).lower()
-                                game_rec['feed'][feedtype] = dict()
-                                game_rec['feed'][feedtype]['mediaPlaybackId'] \
-                                    = str(stream['mediaPlaybackId'])
-                                game_rec['feed'][feedtype]['eventId'] \
-                                    = str(stream['eventId'])
-                                game_rec['feed'][feedtype]['callLetters'] \
-                                    = str(stream['callLetters'])
-                    elif media['title'] == 'Extended Highlights':
-                        feedtype = 'condensed'
-                        if len(media['items']) > 0:
-                            game_rec['feed'][feedtype] = dict()
-                            stream = media['items'][0]
-                            game_rec['feed'][feedtype]['mediaPlaybackId'] \
-                                = str(stream['mediaPlaybackId'])
-                            for playback_item in stream['playbacks']:
-                                if playback_item['name'] \
-                                        == config.CONFIG.playback_scenario:
-                                    game_rec['feed'][feedtype][
-                                        'playback_url'] = playback_item['url']
-                    elif media['title'] == 'Recap':
-                        feedtype = 'recap'
-                        if len(media['items']) > 0:
-                            game_rec['feed'][feedtype] = dict()
-                            stream = media['items'][0]
-                            game_rec['feed'][feedtype]['mediaPlaybackId'] \
-                                = str(stream['mediaPlaybackId'])
-                            for playback_item in stream['playbacks']:
-                                if playback_item['name'] \
-                                        == config.CONFIG.playback_scenario:
-                                    game_rec['feed'][feedtype]['playback_url'] \
-                                        = playback_item['url']
-                    elif media['title'] == 'Audio':
-                        for stream in media['items']:
-                            # home, away, national, french, ...:
-                            feedtype = 'audio-' + str(
-                                stream['mediaFeedType']).lower()
-                            game_rec['feed'][feedtype] = dict()
-                            game_rec['feed'][feedtype]['mediaPlaybackId'] \
-                                = str(stream['mediaPlaybackId'])
-                            game_rec['feed'][feedtype]['eventId'] \
-                                = str(stream['eventId'])
-                            game_rec['feed'][feedtype]['callLetters'] \
-                                = str(stream['callLetters'])
+                game_records.add(GameRecord(game, has_feeds))
         return game_records
 
-    def process_game_data(self, game_date, num_days=1):
-        """ Process game data into list by days."""
+    def _get_games_by_date_range(self, start_date_str, end_date_str, needs=NEED_ALL, team_code=None):
+        """Retrieves all games from start to end date (inclusive) in a single request.
+        Returns a list of (game_date, game_records) tuples, one per date which has games.
+        """
+        json_data = self._get_schedule_json(start_date_str, end_date_str, needs, team_code)
         game_days_list = list()
-        for i in range(0, num_days):  # pylint: disable=unused-variable
-            game_records = self._get_games_by_date(game_date)
-            if game_records is not None:
-                game_days_list.append((game_date, game_records))
-            game_date = datetime.strftime(
-                datetime.strptime(game_date, "%Y-%m-%d") + timedelta(days=1),
-                "%Y-%m-%d")
+        if json_data is None:
+            LOG.error("No JSON data returned for %s to %s", start_date_str, end_date_str)
+            return game_days_list
+        if json_data.get('dates') is None or len(json_data['dates']) < 1:
+            LOG.debug("_get_games_by_date_range: no game data for %s to %s", start_date_str, end_date_str)
+            return game_days_list
+        for date_entry in json_data['dates']:
+            game_days_list.append((date_entry['date'],
+                                   self._parse_games(date_entry['games'], needs & NEED_FEEDS != 0)))
         return game_days_list
 
+    def _get_games_by_date(self, date_str=None):
+        if date_str is None:
+            date_str = time.strftime("%Y-%m-%d")
+        game_days_list = self._get_games_by_date_range(date_str, date_str)
+        if len(game_days_list) < 1:
+            return None
+        return game_days_list[0][1]
+
+    @staticmethod
+    def _get_date_ranges(date_list):
+        """Groups a sorted list of dates into (start, end) ranges of consecutive dates.
+        Ranges are limited to at most 'schedule_chunk_days' days.
+        """
+        chunk_days = max(1, config.CONFIG.parser.getint('schedule_chunk_days', 31))
+        date_ranges = list()
+        range_start = range_end = None
+        range_days = 0
+        for date_str in date_list:
+            if range_end is not None and range_days < chunk_days \
+                    and datetime.strptime(date_str, "%Y-%m-%d") \
+                    == datetime.strptime(range_end, "%Y-%m-%d") + timedelta(days=1):
+                range_end = date_str
+                range_days += 1
+            else:
+                if range_start is not None:
+                    date_ranges.append((range_start, range_end))
+                range_start = range_end = date_str
+                range_days = 1
+        if range_start is not None:
+            date_ranges.append((range_start, range_end))
+        return date_ranges
+
+    def _update_store(self, date_list, needs, team_code):
+        """Fetches the stale dates into the season store. Returns False if the network request failed."""
+        stale_dates = self.store.get_stale_dates(date_list, needs, team_code)
+        for start_date_str, end_date_str in self._get_date_ranges(stale_dates):
+            try:
+                json_data = self._get_schedule_json(start_date_str, end_date_str, needs, team_code)
+            except requests.exceptions.RequestException as ex:
+                LOG.warning('Could not retrieve game data, using stored data instead: %s', ex)
+                return False
+            if json_data is not None:
+                self.store.save_schedule(json_data, start_date_str, end_date_str, needs, team_code)
+        return True
+
+    def process_game_data(self, game_date, num_days=1, needs=NEED_ALL, team_code=None):
+        """ Process game data into list by days.
+
+        The schedule is requested as a date range rather than one request per day. Very long ranges
+        are split into chunks of at most 'schedule_chunk_days' days. If the season store is enabled
+        then only stale dates are requested, and the rest is answered from the store.
+
+        needs: NEED_* flags for the data required by the caller. Feeds which are not requested
+               here are retrieved per game when first accessed (see GameRecord.feeds).
+        team_code: if given, only the games for this team are requested
+        """
+        start_date = datetime.strptime(game_date, "%Y-%m-%d")
+        date_list = [datetime.strftime(start_date + timedelta(days=i), "%Y-%m-%d") for i in range(0, num_days)]
+        if not date_list:
+            return list()
+        if team_code not in TEAM_IDS:
+            team_code = None  # e.g. all-star game teams: request all games instead
+        if self.store is None:
+            game_days_list = list()
+            for start_date_str, end_date_str in self._get_date_ranges(date_list):
+                game_days_list.extend(self._get_games_by_date_range(start_date_str, end_date_str, needs, team_code))
+            return game_days_list
+
+        self._update_store(date_list, needs, team_code)
+        return [(date_str, self._parse_games(games))
+                for date_str, games in self.store.get_games_by_date(date_list[0], date_list[-1], team_code)]
+
+    def backfill_season(self, season):
+        """Retrieves an entire season (e.g. 20232024) into the season store in a single request.
+        Returns the number of games stored.
+        """
+        if self.store is None:
+            util.die("The season store is disabled (see 'season_store' config option)")
+        LOG.info('Retrieving schedule for season %s...', season)
+        # a full season is too large to be worth keeping in the http cache
+        json_data = self._request_schedule('season={}'.format(season), use_cache=False)
+        if json_data is None or not json_data.get('dates'):
+            LOG.info('No game data found for season %s', season)
+            return 0
+        dates = [date_entry['date'] for date_entry in json_data['dates']]
+        return self.store.save_schedule(json_data, min(dates), max(dates), NEED_ALL)
+
 
 class GameDatePresenter:
     """Formats game data for CLI output."""
@@ -201,7 +411,7 @@ class GameDatePresenter:
         non_highlight_feeds = list()
         use_short_feeds = config.CONFIG.parser.getboolean('use_short_feeds',
                                                           True)
-        for feed in sorted(game_rec['feed'].keys()):
+        for feed in sorted(game_rec.feeds.keys()):
             if (feed not in config.HIGHLIGHT_FEEDTYPES
                     and not feed.startswith('audio-')):
                 if use_short_feeds:
@@ -210,7 +420,7 @@ class GameDatePresenter:
                 else:
                     non_highlight_feeds.append(feed)
         highlight_feeds = list()
-        for feed in game_rec['feed'].keys():
+        for feed in game_rec.feeds.keys():
             if (feed in config.HIGHLIGHT_FEEDTYPES
                     and not feed.startswith('audio-')):
                 if use_short_feeds:
@@ -224,14 +434,19 @@ class GameDatePresenter:
 
     def display_game_data(self, game_date, game_records, arg_filter):
         """Game data output."""
-        show_scores = config.CONFIG.parser.getboolean('scores')
-        border = displayutil.Border(use_unicode=config.UNICODE)
         if game_records is None:
             # outl.append("No game data for {}".format(game_date))
             LOG.info("No game data for %s", game_date)
             # LOG.info("No game data to display")
             return
+        outl = self.get_game_data_lines(game_date, game_records, arg_filter)
+        if outl:
+            print('\n'.join(outl))
 
+    def get_game_data_lines(self, game_date, game_records, arg_filter):
+        """Returns the game data output as a list of lines, or an empty list if no games match the filter."""
+        show_scores = config.CONFIG.parser.getboolean('scores')
+        border = displayutil.Border(use_unicode=config.UNICODE)
         outl = list()  # holds list of strings for output
         print_outl = False
 
@@ -262,17 +477,16 @@ class GameDatePresenter:
                 c_off=border.color_off))
 
         games_displayed_count = 0
-        for game_pk in game_records:
-            if gamedata.apply_filter(game_records[game_pk], arg_filter,
-                                     FILTERS) is not None:
-                games_displayed_count += 1
-                outl.extend(
-                    self._display_game_details(game_pk, game_records[game_pk],
-                                               games_displayed_count))
-                print_outl = True
+        for game_rec in game_records.select(gamedata.compile_filter(arg_filter, FILTERS)):
+            games_displayed_count += 1
+            outl.extend(
+                self._display_game_details(game_rec.game_pk, game_rec,
+                                           games_displayed_count))
+            print_outl = True
 
         if print_outl:
-            print('\n'.join(outl))
+            return outl
+        return list()
 
     # pylint: disable=too-many-branches, too-many-locals, unused-argument
     def _display_game_details(self, game_pk, game_rec, games_displayed_count):
@@ -284,49 +498,49 @@ class GameDatePresenter:
             if config.CONFIG.parser['fav_colour'] != '':
                 color_on = ANSI.fg(config.CONFIG.parser['fav_colour'])
                 color_off = ANSI.reset()
-        if game_rec['abstractGameState'] == 'Live':
+        if game_rec.abstract_game_state == 'Live':
             color_on += ANSI.control_code('bold')
             color_off = ANSI.reset()
         show_scores = config.CONFIG.parser.getboolean('scores')
         game_info_str = "{}: {} ({}) at {} ({})".format(
-            util.convert_time_to_local(game_rec['nhldate']),
-            game_rec['away']['name'], game_rec['away']['abbrev'].upper(),
-            game_rec['home']['name'], game_rec['home']['abbrev'].upper())
+            util.convert_time_to_local(game_rec.nhldate),
+            game_rec.away.name, game_rec.away.abbrev.upper(),
+            game_rec.home.name, game_rec.home.abbrev.upper())
         game_state = ''
         game_state_color_on = color_on
         game_state_color_off = color_off
-        if game_rec['abstractGameState'] not in ('Preview', ):
+        if game_rec.abstract_game_state not in ('Preview', ):
             if not show_scores:
-                game_state = game_rec['abstractGameState']
-                if 'In Progress - ' in game_rec['detailedState']:
+                game_state = game_rec.abstract_game_state
+                if 'In Progress - ' in game_rec.detailed_state:
                     game_state \
-                        = game_rec['detailedState'].split('In Progress - ')[-1]
-                elif game_rec['detailedState'] not in ('Live', 'Final',
+                        = game_rec.detailed_state.split('In Progress - ')[-1]
+                elif game_rec.detailed_state not in ('Live', 'Final',
                                                        'Scheduled',
                                                        'In Progress'):
-                    game_state = game_rec['detailedState']
+                    game_state = game_rec.detailed_state
             else:
-                if 'Critical' in game_rec['detailedState']:
+                if 'Critical' in game_rec.detailed_state:
                     game_state_color_on = ANSI.fg(
                         config.CONFIG.parser['game_critical_colour'])
                     game_state_color_off = ANSI.reset()
-                if (game_rec['linescore']['currentPeriodTimeRemaining']
+                if (game_rec.linescore.current_period_time_remaining
                         == 'Final'
-                        and game_rec['linescore']['currentPeriodOrdinal']
+                        and game_rec.linescore.current_period_ordinal
                         == '3rd'):
                     game_state = 'Final'
                 else:
                     game_state = '{} {}'.format(
-                        game_rec['linescore']
-                        ['currentPeriodTimeRemaining'].title(),
-                        game_rec['linescore']['currentPeriodOrdinal'])
+                        game_rec.linescore
+                        .current_period_time_remaining.title(),
+                        game_rec.linescore.current_period_ordinal)
         # else:
         #    game_state = 'Pending'
         if config.CONFIG.parser.getboolean('scores'):
             score = ''
-            if game_rec['abstractGameState'] not in ('Preview', ):
-                score = '{}-{}'.format(game_rec['away']['score'],
-                                       game_rec['home']['score'])
+            if game_rec.abstract_game_state not in ('Preview', ):
+                score = '{}-{}'.format(game_rec.away.score,
+                                       game_rec.home.score)
             outl.append(('{c_on}{gameinfo:<64}{c_off} {pipe} {c_on}{score:^5}'
                          '{c_off} {pipe} {gsc_on}{state:>9}{gsc_off} '
                          '{pipe} {c_on}{feeds}{c_off}').format(
@@ -350,11 +564,11 @@ class GameDatePresenter:
                              c_off=color_off))
         if (config.CONFIG.parser.getboolean('debug')
                 and config.CONFIG.parser.getboolean('verbose')):
-            for feedtype in game_rec['feed']:
+            for feedtype in game_rec.feeds:
                 outl.append(
                     '    {}: {}  [game_pk:{}, mediaPlaybackId:{}]'.format(
-                        feedtype, game_rec['abstractGameState'], game_pk,
-                        game_rec['feed'][feedtype]['mediaPlaybackId']))
+                        feedtype, game_rec.abstract_game_state, game_pk,
+                        game_rec.feeds[feedtype].media_playback_id))
         return outl
 
     def get_audio_stream_url(self):
@@ -0,0 +1,242 @@
+"""
+Recording daemon (--record-daemon)
+
+Plans recordings of the games matching a filter (favourites by default) from the schedule, then
+starts each recording at game time as a separate 'nhlv --fetch --wait' process, which is given the
+daemon's stream options (e.g. -f/--feed, -r/--resolution). Several games are recorded in parallel.
+The recording processes are supervised: a recording which fails while its game may still be in
+progress is restarted.
+
+The schedule is re-checked periodically, so that postponements and start time changes are picked
+up. Only the current and next day are re-checked: the plan for later dates is made once those
+dates are reached. This allows a daemon to be left running for a whole season (see --days).
+"""
+
+import logging
+import os
+import subprocess
+import sys
+import time
+
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+import mlbam.common.config as config
+import mlbam.common.gamedata as gamedata
+import mlbam.nhlgamedata as nhlgamedata
+
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_REPLAN_SECS = 1800
+DEFAULT_MAX_CONCURRENT = 4
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_START_LEAD_SECS = 600  # start the recording process this long before game time (it then waits for the feed)
+SUPERVISE_INTERVAL = 10
+
+# detailed states of games which will not be played as scheduled
+CANCELLED_DETAILED_STATES = ('Postponed', )
+
+
+def get_recording_args(args):
+    """Returns the daemon's command line options (argparse namespace) which are passed on to each recording."""
+    recording_args = list()
+    for option, value in (('--feed', args.feed), ('--resolution', args.resolution), ('--duration', args.duration),
+                          ('--use-rogers', args.use_rogers)):
+        if value:
+            recording_args.extend((option, value))
+    for option, enabled in (('--from-start', args.from_start), ('--verbose', args.verbose), ('--debug', args.debug)):
+        if enabled:
+            recording_args.append(option)
+    return recording_args
+
+
+class Recording:
+    """A planned recording of a single game."""
+    __slots__ = ('game_pk', 'game_date', 'team_code', 'away', 'home', 'nhldate', 'process', 'log_handle',
+                 'attempts', 'done')
+
+    def __init__(self, game_pk, game_date, team_code, game_rec):
+        self.game_pk = game_pk
+        self.game_date = game_date
+        self.team_code = team_code
+        self.away = game_rec.away.abbrev
+        self.home = game_rec.home.abbrev
+        self.nhldate = game_rec.nhldate
+        self.process = None
+        self.log_handle = None
+        self.attempts = 0
+        self.done = False
+
+    def get_command(self, extra_args=()):
+        """extra_args: further nhlv options, e.g. from get_recording_args"""
+        return [sys.executable, '-m', 'mlbam.nhlv', '-t', self.team_code, '--date', self.game_date,
+                '--fetch', '--wait'] + list(extra_args)
+
+    def __repr__(self):
+        return 'Recording({}: {} at {}, {})'.format(self.game_pk, self.away, self.home, self.game_date)
+
+
+class RecordingDaemon:
+    """Plans, starts and supervises recordings."""
+
+    def __init__(self, start_date, num_days, arg_filter=None, recording_args=None):
+        """recording_args: options passed on to each recording process (see get_recording_args)"""
+        self.start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+        self.end_date = self.start_date + timedelta(days=num_days - 1)
+        self.arg_filter = arg_filter or 'favs'
+        self.recording_args = recording_args or list()
+        self.retriever = nhlgamedata.GameDataRetriever()
+        self.recordings = dict()  # game_pk: Recording
+        parser = config.CONFIG.parser
+        self.replan_secs = parser.getint('record_replan_secs', DEFAULT_REPLAN_SECS)
+        self.max_concurrent = parser.getint('record_max_concurrent', DEFAULT_MAX_CONCURRENT)
+        self.max_retries = parser.getint('record_max_retries', DEFAULT_MAX_RETRIES)
+        self.start_lead_secs = parser.getint('record_start_lead_secs', DEFAULT_START_LEAD_SECS)
+        self.log_dir = os.path.join(config.CONFIG.dir, 'recordings')
+
+    @staticmethod
+    def choose_team(game_rec, compiled_filter):
+        """Returns the team whose feed is recorded: the team which matched the filter, preferring the home team."""
+        if compiled_filter is not None:
+            for clause in compiled_filter.clauses:
+                if game_rec.home.abbrev in clause.teams:
+                    return game_rec.home.abbrev
+                if game_rec.away.abbrev in clause.teams:
+                    return game_rec.away.abbrev
+        return game_rec.home.abbrev
+
+    def plan(self, today=None):
+        """Updates the planned recordings from the schedule for the current and next day."""
+        if today is None:
+            today = datetime.now().date()
+        plan_start = max(self.start_date, today - timedelta(days=1))  # late games from yesterday
+        plan_end = min(self.end_date, today + timedelta(days=1))
+        if plan_start > plan_end:
+            return
+        num_days = (plan_end - plan_start).days + 1
+        game_day_tuple_list = self.retriever.process_game_data(plan_start.strftime('%Y-%m-%d'), num_days,
+                                                               nhlgamedata.NEED_TEAMS)
+        compiled_filter = gamedata.compile_filter(self.arg_filter, nhlgamedata.FILTERS)
+        for game_date, game_records in game_day_tuple_list:
+            for game_rec in game_records.select(compiled_filter):
+                recording = self.recordings.get(game_rec.game_pk)
+                if game_rec.detailed_state in CANCELLED_DETAILED_STATES:
+                    if recording is not None and not recording.done:
+                        LOG.info('Game postponed, cancelling recording: %s', recording)
+                        if recording.process is not None:
+                            self._terminate(recording)  # it would wait for the feed until it times out
+                        recording.done = True
+                    continue
+                if recording is None:
+                    if game_rec.abstract_game_state == 'Final':
+                        continue
+                    recording = Recording(game_rec.game_pk, game_date, self.choose_team(game_rec, compiled_filter),
+                                          game_rec)
+                    LOG.info('Planned recording: %s, local start time %s', recording,
+                             game_rec.nhldate.astimezone().strftime('%H:%M'))
+                    self.recordings[game_rec.game_pk] = recording
+                elif recording.nhldate != game_rec.nhldate:
+                    LOG.info('Start time changed for %s', recording)
+                    recording.nhldate = game_rec.nhldate
+                    recording.game_date = game_date
+
+    def _start(self, recording):
+        os.makedirs(self.log_dir, exist_ok=True)
+        log_file = os.path.join(self.log_dir, '{}-{}-{}.log'.format(recording.game_date, recording.away,
+                                                                   recording.home))
+        recording.attempts += 1
+        LOG.info('Starting recording: %s (attempt %s)', recording, recording.attempts)
+        recording.log_handle = open(log_file, 'a')
+        recording.process = subprocess.Popen(recording.get_command(self.recording_args), stdin=subprocess.DEVNULL,
+                                             stdout=recording.log_handle, stderr=subprocess.STDOUT)
+
+    @staticmethod
+    def _terminate(recording):
+        recording.process.terminate()
+        try:
+            recording.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            recording.process.kill()
+        recording.process = None
+        recording.log_handle.close()
+        recording.log_handle = None
+
+    def _check(self, recording, now):
+        """Checks a running recording. A failed recording is restarted while the game may still be on."""
+        return_code = recording.process.poll()
+        if return_code is None:
+            return
+        recording.process = None
+        recording.log_handle.close()
+        recording.log_handle = None
+        if return_code == 0:
+            LOG.info('Recording finished: %s', recording)
+            recording.done = True
+        elif recording.attempts > self.max_retries or now - recording.nhldate > timedelta(hours=6):
+            LOG.error('Recording failed: %s (exit code %s)', recording, return_code)
+            recording.done = True
+        else:
+            LOG.warning('Recording exited with code %s, restarting: %s', return_code, recording)
+
+    def _get_active(self):
+        return [recording for recording in self.recordings.values() if recording.process is not None]
+
+    def supervise(self, now=None):
+        """Checks the running recordings and starts the recordings which are due."""
+        if now is None:
+            now = datetime.now(timezone.utc)
+        for recording in self._get_active():
+            self._check(recording, now)
+        active_count = len(self._get_active())
+        for recording in sorted(self.recordings.values(), key=lambda rec: rec.nhldate):
+            if recording.done or recording.process is not None:
+                continue
+            if (recording.nhldate - now).total_seconds() > self.start_lead_secs:
+                continue
+            if active_count >= self.max_concurrent:
+                LOG.warning('Maximum number of concurrent recordings reached, delaying: %s', recording)
+                break
+            self._start(recording)
+            active_count += 1
+
+    def is_finished(self, today=None):
+        if today is None:
+            today = datetime.now().date()
+        if today <= self.end_date:
+            return False
+        return all(recording.done for recording in self.recordings.values())
+
+    def stop(self):
+        for recording in self._get_active():
+            LOG.info('Stopping recording: %s', recording)
+            recording.process.terminate()
+        for recording in self._get_active():
+            try:
+                recording.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                recording.process.kill()
+            recording.log_handle.close()
+
+    def run(self):
+        """Runs until all recordings in the date range are done, or until interrupted."""
+        LOG.info('Recording daemon: recording %s games from %s to %s', self.arg_filter,
+                 self.start_date, self.end_date)
+        last_plan = None
+        try:
+            while True:
+                if last_plan is None or time.monotonic() - last_plan >= self.replan_secs:
+                    try:
+                        self.plan()
+                    except Exception as ex:  # pylint: disable=broad-except
+                        LOG.error('Could not update the recording plan: %s', ex)
+                    last_plan = time.monotonic()
+                self.supervise()
+                if self.is_finished():
+                    LOG.info('All recordings are done')
+                    return 0
+                time.sleep(SUPERVISE_INTERVAL)
+        except KeyboardInterrupt:
+            self.stop()
+        return 0
@@ -0,0 +1,91 @@
+"""
+Batch stream resolution (--resolve)
+
+Resolves the stream url and media authorization for every feed of the games matching the filter,
+in parallel, and prints the results as newline-delimited JSON (one object per feed) instead of
+launching a player. This is meant for external download tools.
+"""
+
+import json
+import logging
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+
+import mlbam.auth as auth
+import mlbam.common.config as config
+import mlbam.common.gamedata as gamedata
+import mlbam.nhlgamedata as nhlgamedata
+import mlbam.nhlstream as nhlstream
+
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+
+
+def get_feedtypes(game_rec, feedtype=None):
+    """Returns the stream feedtypes of the game: either the given feedtype, or all non-highlight, non-audio feeds."""
+    if feedtype is not None:
+        return [feedtype] if feedtype in game_rec.feeds else []
+    return [feed for feed in sorted(game_rec.feeds)
+            if feed not in config.HIGHLIGHT_FEEDTYPES and not feed.startswith('audio-')]
+
+
+def resolve_feed(game_date, game_rec, feedtype):
+    """Resolves a single feed. Returns a dict for output."""
+    result = {
+        'date': game_date,
+        'game_pk': game_rec.game_pk,
+        'away': game_rec.away.abbrev,
+        'home': game_rec.home.abbrev,
+        'feedtype': feedtype,
+        'stream_url': None,
+        'media_auth': None,
+    }
+    feed = game_rec.feeds[feedtype]
+    try:
+        stream_url, media_auth = nhlstream.fetch_stream(game_rec.game_pk, feed.media_playback_id, feed.event_id)
+    except nhlstream.StreamException as ex:
+        # e.g. a blackout: the reason is reported along with the feed
+        result['error'] = str(ex)
+        return result
+    except Exception as ex:  # pylint: disable=broad-except
+        result['error'] = str(ex)
+        return result
+    result['stream_url'] = stream_url
+    result['media_auth'] = media_auth
+    if stream_url is None:
+        result['error'] = 'No stream URL found'
+    return result
+
+
+def resolve_streams(game_day_tuple_list, arg_filter, feedtype=None, out=sys.stdout):
+    """Resolves the streams of all matching games in parallel, writing one JSON line per feed.
+    Returns the number of feeds which could not be resolved.
+    """
+    if auth.get_auth_cookie() is None:
+        auth.nhl_login()
+    auth_cookie = auth.get_auth_cookie()
+    compiled_filter = gamedata.compile_filter(arg_filter, nhlgamedata.FILTERS)
+    jobs = list()
+    for game_date, game_records in game_day_tuple_list:
+        for game_rec in game_records.select(compiled_filter):
+            for game_feedtype in get_feedtypes(game_rec, feedtype):
+                jobs.append((game_date, game_rec, game_feedtype))
+    if not jobs:
+        LOG.info('No feeds to resolve')
+        return 0
+    error_count = 0
+    workers = config.CONFIG.parser.getint('resolve_workers', DEFAULT_WORKERS)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(resolve_feed, *job) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            if result['stream_url'] is None:
+                error_count += 1
+            else:
+                result['cookies'] = {'Authorization': auth_cookie}
+            print(json.dumps(result), file=out, flush=True)
+    return error_count
@@ -0,0 +1,255 @@
+"""
+Local store of schedule data
+
+Keeps the raw statsapi game records in a sqlite database in the config directory. Each game
+remembers when it was fetched, and its freshness depends on the game state:
+
+- Final games do not change once the archive/highlight feeds are published
+- Preview games are valid until shortly before the game starts
+- Live games are only valid for a short time
+
+This allows schedule queries (dates, ranges, teams, whole seasons) to be answered locally, only
+going to the network for the dates which are stale.
+
+Each game also remembers which data was requested for it (see the NEED_* flags in nhlgamedata),
+so a game stored from a lean request is refreshed when more data is needed. The dates which were
+fetched are remembered as well, per team for team requests, so that dates without games (e.g. a
+team's off-days) aren't fetched again.
+"""
+
+import calendar
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from datetime import datetime
+from datetime import timedelta
+
+import mlbam.common.config as config
+
+
+LOG = logging.getLogger(__name__)
+
+STORE_FILENAME = 'season.db'
+SCHEMA_VERSION = 3  # the store is only a cache: a database with a different version is recreated
+
+# freshness defaults, in seconds. These can be overridden in the config file.
+DEFAULT_TTL_LIVE = 30
+DEFAULT_TTL_PREVIEW = 3600
+DEFAULT_PREVIEW_LEAD = 900
+DEFAULT_FINAL_SETTLE = 6 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    game_pk INTEGER PRIMARY KEY,
+    game_date TEXT NOT NULL,
+    start_time REAL NOT NULL,
+    season TEXT,
+    away TEXT,
+    home TEXT,
+    state TEXT,
+    needs INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_by_date ON games (game_date);
+CREATE INDEX IF NOT EXISTS games_by_away ON games (away, game_date);
+CREATE INDEX IF NOT EXISTS games_by_home ON games (home, game_date);
+CREATE TABLE IF NOT EXISTS dates (
+    game_date TEXT PRIMARY KEY,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS team_dates (
+    game_date TEXT NOT NULL,
+    team TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (game_date, team)
+);
+"""
+
+_STORE = None
+
+
+def _parse_start_time(game_date_str):
+    return calendar.timegm(time.strptime(game_date_str, "%Y-%m-%dT%H:%M:%SZ"))
+
+
+def get_date_list(start_date_str, end_date_str):
+    """Returns all dates from start to end (inclusive) as yyyy-mm-dd strings."""
+    date_list = list()
+    current_date = datetime.strptime(start_date_str, "%Y-%m-%d")
+    end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
+    while current_date <= end_date:
+        date_list.append(datetime.strftime(current_date, "%Y-%m-%d"))
+        current_date += timedelta(days=1)
+    return date_list
+
+
+class SeasonStore:
+    """Schedule and game records, stored in sqlite."""
+
+    def __init__(self, db_file, ttl_live=DEFAULT_TTL_LIVE, ttl_preview=DEFAULT_TTL_PREVIEW,
+                 preview_lead=DEFAULT_PREVIEW_LEAD, final_settle=DEFAULT_FINAL_SETTLE):
+        self.db_file = db_file
+        self.ttl_live = ttl_live
+        self.ttl_preview = ttl_preview
+        self.preview_lead = preview_lead
+        self.final_settle = final_settle
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            if self._conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                self._conn.execute('DROP TABLE IF EXISTS games')
+                self._conn.execute('DROP TABLE IF EXISTS dates')
+                self._conn.execute('DROP TABLE IF EXISTS team_dates')
+                self._conn.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def is_game_fresh(self, state, start_time, fetched_at, now=None):
+        """Returns True if a stored game does not need to be fetched again."""
+        if now is None:
+            now = time.time()
+        age = now - fetched_at
+        if state == 'Final':
+            # the archive and highlight feeds are added for a while after the game ends
+            if fetched_at - start_time >= self.final_settle:
+                return True
+            return age < self.ttl_preview
+        if state == 'Live':
+            return age < self.ttl_live
+        # Preview (also postponed games): valid until shortly before game time
+        return now < start_time - self.preview_lead and age < self.ttl_preview
+
+    def _is_empty_date_fresh(self, date_str, fetched_at, now):
+        # games are not added to dates in the past
+        date_end = calendar.timegm(time.strptime(date_str, "%Y-%m-%d")) + 2 * 86400
+        if fetched_at >= date_end:
+            return True
+        return now - fetched_at < self.ttl_preview
+
+    def get_stale_dates(self, date_list, needs=0, team_code=None, now=None):
+        """Returns the dates from date_list which must be fetched from the network.
+
+        needs: the NEED_* flags which the stored games must have been requested with
+        team_code: only consider the games of the given team
+        """
+        if not date_list:
+            return list()
+        if now is None:
+            now = time.time()
+        start_date_str, end_date_str = min(date_list), max(date_list)
+        query = 'SELECT game_date, state, start_time, needs, fetched_at FROM games WHERE game_date BETWEEN ? AND ?'
+        params = (start_date_str, end_date_str)
+        if team_code is not None:
+            query += ' AND (away = ? OR home = ?)'
+            params += (team_code, team_code)
+        with self._lock:
+            fetched_dates = dict(self._conn.execute(
+                'SELECT game_date, fetched_at FROM dates WHERE game_date BETWEEN ? AND ?',
+                (start_date_str, end_date_str)).fetchall())
+            if team_code is not None:
+                # a date fetched for the team is as good as the whole date
+                for date_str, fetched_at in self._conn.execute(
+                        'SELECT game_date, fetched_at FROM team_dates WHERE team = ? AND game_date BETWEEN ? AND ?',
+                        (team_code, start_date_str, end_date_str)).fetchall():
+                    fetched_dates[date_str] = max(fetched_at, fetched_dates.get(date_str, 0))
+            game_rows = self._conn.execute(query, params).fetchall()
+        stale_game_dates = set()
+        game_dates = set()
+        for game_date, state, start_time, game_needs, fetched_at in game_rows:
+            game_dates.add(game_date)
+            if game_needs & needs != needs or not self.is_game_fresh(state, start_time, fetched_at, now):
+                stale_game_dates.add(game_date)
+        stale_dates = list()
+        for date_str in date_list:
+            if date_str in stale_game_dates:
+                stale_dates.append(date_str)
+            elif date_str not in fetched_dates:
+                stale_dates.append(date_str)
+            elif date_str not in game_dates and not self._is_empty_date_fresh(date_str, fetched_dates[date_str], now):
+                stale_dates.append(date_str)
+        return stale_dates
+
+    def save_schedule(self, json_data, start_date_str, end_date_str, needs, team_code=None):
+        """Stores a statsapi schedule response which covers start to end date (inclusive).
+        Any previously stored games in the date range which are not in the response are removed.
+
+        needs: the NEED_* flags the response was requested with
+        team_code: set if the response only contains the games for the given team. In this case
+                   only the team's stored games in the date range are replaced.
+        """
+        now = time.time()
+        rows = list()
+        for date_entry in json_data.get('dates') or list():
+            for game in date_entry['games']:
+                rows.append((game['gamePk'],
+                             date_entry['date'],
+                             _parse_start_time(game['gameDate']),
+                             game.get('season'),
+                             game['teams']['away']['team'].get('abbreviation', '').lower(),
+                             game['teams']['home']['team'].get('abbreviation', '').lower(),
+                             game['status']['abstractGameState'],
+                             needs,
+                             now,
+                             json.dumps(game, separators=(',', ':'))))
+        date_list = get_date_list(start_date_str, end_date_str)
+        with self._lock, self._conn:
+            if team_code is None:
+                self._conn.execute('DELETE FROM games WHERE game_date BETWEEN ? AND ?',
+                                   (start_date_str, end_date_str))
+                self._conn.executemany('INSERT OR REPLACE INTO dates VALUES (?, ?)',
+                                       [(date_str, now) for date_str in date_list])
+            else:
+                # e.g. a postponed game which was moved out of the range
+                self._conn.execute('DELETE FROM games WHERE game_date BETWEEN ? AND ? AND (away = ? OR home = ?)',
+                                   (start_date_str, end_date_str, team_code, team_code))
+                self._conn.executemany('INSERT OR REPLACE INTO team_dates VALUES (?, ?, ?)',
+                                       [(date_str, team_code, now) for date_str in date_list])
+            self._conn.executemany('INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        LOG.debug('Stored %s games for %s to %s', len(rows), start_date_str, end_date_str)
+        return len(rows)
+
+    def _query_games(self, where_clause, params):
+        with self._lock:
+            rows = self._conn.execute(
+                ('SELECT game_date, data, needs FROM games WHERE {} '
+                 'ORDER BY game_date, start_time, game_pk').format(where_clause),
+                params).fetchall()
+        games_by_date = list()
+        for game_date, data, needs in rows:
+            if not games_by_date or games_by_date[-1][0] != game_date:
+                games_by_date.append((game_date, list()))
+            games_by_date[-1][1].append((json.loads(data), needs))
+        return games_by_date
+
+    def get_games_by_date(self, start_date_str, end_date_str, team_code=None):
+        """Returns a list of (game_date, [(statsapi game, needs), ...]) tuples for each date which has games."""
+        if team_code is not None:
+            return self.get_games_for_team(team_code, start_date_str, end_date_str)
+        return self._query_games('game_date BETWEEN ? AND ?', (start_date_str, end_date_str))
+
+    def get_games_for_team(self, team_code, start_date_str='0000-00-00', end_date_str='9999-99-99'):
+        """Returns a list of (game_date, [(statsapi game, needs)]) tuples for every stored game of the given team."""
+        return self._query_games('(away = ? OR home = ?) AND game_date BETWEEN ? AND ?',
+                                 (team_code, team_code, start_date_str, end_date_str))
+
+
+def get_store():
+    """Returns the season store, or None if it is disabled in the config."""
+    global _STORE
+    if _STORE is None:
+        if not config.CONFIG.parser.getboolean('season_store', True):
+            return None
+        _STORE = SeasonStore(os.path.join(config.CONFIG.dir, STORE_FILENAME),
+                             ttl_live=config.CONFIG.parser.getint('store_ttl_live', DEFAULT_TTL_LIVE),
+                             ttl_preview=config.CONFIG.parser.getint('store_ttl_preview', DEFAULT_TTL_PREVIEW),
+                             preview_lead=config.CONFIG.parser.getint('store_preview_lead_secs', DEFAULT_PREVIEW_LEAD),
+                             final_settle=config.CONFIG.parser.getint('store_final_settle_secs', DEFAULT_FINAL_SETTLE))
+    return _STORE
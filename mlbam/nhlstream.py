@@ -5,13 +5,17 @@ Streaming functions
 
 import logging
 import os
+import re
+import socket
 import subprocess
 import sys
+import threading
 import time
 import urllib.request
 import urllib.error
 import urllib.parse
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import requests
@@ -19,48 +23,130 @@ import requests
 import mlbam.auth as auth
 import mlbam.common.util as util
 import mlbam.common.config as config
+import mlbam.common.hls as hls
+import mlbam.common.hlsproxy as hlsproxy
+import mlbam.common.httpcache as httpcache
+import mlbam.common.httpclient as httpclient
+import mlbam.common.m3u8 as m3u8
+import mlbam.common.segmentcache as segmentcache
+import mlbam.common.state as state
 import mlbam.common.stream as stream
+import mlbam.nhlgamedata as nhlgamedata
 
 
 LOG = logging.getLogger(__name__)
 
+DEFAULT_REFRESH_MARGIN = 300  # renew credentials this many seconds before they expire
+DEFAULT_MEDIA_AUTH_TTL = 2 * 3600
+RETRY_INTERVAL = 30
+
+STREAM_CACHE_KEY = 'stream:{}:{}:{}'  # mediaPlaybackId, cdn, playback scenario
+STREAM_CACHE_MIN_REMAINING = 600  # don't use a cached stream which expires within this many seconds
+EXPIRY_RE = re.compile(r'\bexp=(\d{9,11})\b')  # expiry in signed urls/tokens, e.g. hdnea=exp=1514851200~acl=...
+
+
+StreamException = stream.StreamException  # raised by fetch_stream and auth.get_session_key
+
 
 def select_feed_for_team(game_rec, team_code, feedtype=None):
-    found = False
-    if game_rec['away']['abbrev'] == team_code:
-        found = True
-        if feedtype is None and 'away' in game_rec['feed']:
-            feedtype = 'away'  # assume user wants their team's feed
-    elif game_rec['home']['abbrev'] == team_code:
-        found = True
-        if feedtype is None and 'home' in game_rec['feed']:
-            feedtype = 'home'  # assume user wants their team's feed
-    if found:
-        if feedtype is None:
-            LOG.info('Default (home/away) feed not found: choosing first available feed')
-            if len(game_rec['feed']) > 0:
-                feedtype = list(game_rec['feed'].keys())[0]
-                LOG.info("Chose '%s' feed (override with --feed option)", feedtype)
-        if feedtype not in game_rec['feed']:
-            LOG.error("Feed is not available: %s", feedtype)
-            return None, None
-        return game_rec['feed'][feedtype]['mediaPlaybackId'], game_rec['feed'][feedtype]['eventId']
-    return None, None
+    if team_code not in (game_rec.away.abbrev, game_rec.home.abbrev):
+        return None, None
+    chosen_feedtype = nhlgamedata.choose_feedtype(game_rec, team_code, feedtype)
+    if chosen_feedtype is None:
+        LOG.error("Feed is not available: %s", feedtype or 'no game feed')
+        return None, None
+    feed = game_rec.feeds[chosen_feedtype]
+    return feed.media_playback_id, feed.event_id
 
 
 def find_highlight_url_for_team(game_rec, feedtype):
     if feedtype not in config.HIGHLIGHT_FEEDTYPES:
         raise Exception('highlight: feedtype must be condensed or recap')
-    if feedtype in game_rec['feed'] and 'playback_url' in game_rec['feed'][feedtype]:
-        return game_rec['feed'][feedtype]['playback_url']
-    LOG.error('No playback_url found for %s vs %s', game_rec['away']['abbrev'], game_rec['home']['abbrev'])
+    if feedtype in game_rec.feeds and game_rec.feeds[feedtype].playback_url is not None:
+        return game_rec.feeds[feedtype].playback_url
+    LOG.error('No playback_url found for %s vs %s', game_rec.away.abbrev, game_rec.home.abbrev)
     return None
 
 
-def fetch_stream(game_pk, content_id, event_id):  # pylint: disable=too-many-branches, too-many-locals
+def _get_stream_cache_key(content_id, cdn):
+    return STREAM_CACHE_KEY.format(content_id, cdn, config.CONFIG.playback_scenario)
+
+
+def get_stream_expiry(stream_url, media_auth, now=None):
+    """Returns the time (epoch seconds) until which a resolved stream can be used: the expiry of
+    the signed url or media auth if they carry one, limited to media_auth_ttl_secs.
+    """
+    if now is None:
+        now = time.time()
+    expiries = [now + config.CONFIG.parser.getint('media_auth_ttl_secs', DEFAULT_MEDIA_AUTH_TTL)]
+    for value in (stream_url, media_auth):
+        match = EXPIRY_RE.search(urllib.parse.unquote(value or ''))
+        if match:
+            expiries.append(int(match.group(1)))
+    return min(expiries)
+
+
+def _is_stream_authorized(stream_url, media_auth):
+    """Checks a cached stream against the CDN (a small master playlist request)."""
+    headers = {
+        "User-Agent": config.CONFIG.parser['svc_user_agent'],
+        "Cookie": media_auth
+    }
+    try:
+        response = httpclient.get(stream_url, headers=headers, cookies=auth.load_cookies(), timeout=10)
+    except requests.exceptions.RequestException as ex:
+        LOG.debug('Could not check cached stream: %s', ex)
+        return True  # let the player deal with it
+    return response.status_code not in (401, 403)
+
+
+def get_cached_stream(content_id, cdn):
+    """Returns the cached (stream_url, media_auth) for the content, or None."""
+    cache = httpcache.get_cache()
+    if cache is None or not config.CONFIG.parser.getboolean('stream_cache', True):
+        return None
+    cache_key = _get_stream_cache_key(content_id, cdn)
+    entry = cache.get(cache_key)
+    if entry is None:
+        return None
+    stream_url, media_auth, expiry = entry.data
+    if expiry - time.time() < STREAM_CACHE_MIN_REMAINING:
+        cache.remove(cache_key)
+        return None
+    if not _is_stream_authorized(stream_url, media_auth):
+        LOG.debug('Cached stream is no longer authorized')
+        cache.remove(cache_key)
+        return None
+    return stream_url, media_auth
+
+
+def cache_stream(content_id, cdn, stream_url, media_auth):
+    cache = httpcache.get_cache()
+    if cache is None or not config.CONFIG.parser.getboolean('stream_cache', True):
+        return
+    cache.put(_get_stream_cache_key(content_id, cdn), (stream_url, media_auth, get_stream_expiry(stream_url, media_auth)))
+
+
+def invalidate_stream(content_id, cdn=None):
+    """Removes a cached stream (e.g. after a 401/403 response)."""
+    cache = httpcache.get_cache()
+    if cache is not None:
+        cache.remove(_get_stream_cache_key(content_id, cdn or get_cdn()))
+
+
+def get_cdn():
+    """Returns the user's CDN, in the form used by the media service."""
+    if config.CONFIG.parser['cdn'] == 'level3':
+        return 'MED2_LEVEL3_SECURE'
+    return 'MED2_AKAMAI_SECURE'
+
+
+def fetch_stream(game_pk, content_id, event_id, use_cache=True):  # pylint: disable=too-many-branches, too-many-locals
     """ game_pk: game_pk
         event_id: eventId
         content_id: mediaPlaybackId
+        use_cache: use a previously resolved stream for the same content, CDN and playback scenario if it is still valid
+    Raises StreamException if the stream can't be played (blackout, no subscription, media service error).
     """
     stream_url = None
     media_auth = None
@@ -70,6 +156,14 @@ def fetch_stream(game_pk, content_id, event_id):  # pylint: disable=too-many-bra
         LOG.error("fetch_stream: not logged in")
         return stream_url, media_auth
 
+    # Get user set CDN
+    cdn = get_cdn()
+    if use_cache:
+        cached_stream = get_cached_stream(content_id, cdn)
+        if cached_stream is not None:
+            LOG.debug('fetch_stream: using cached stream for %s', content_id)
+            return cached_stream
+
     session_key = auth.get_session_key(game_pk, event_id, content_id, auth_cookie)
     if session_key is None:
         return stream_url, media_auth
@@ -80,12 +174,6 @@ def fetch_stream(game_pk, content_id, event_id):  # pylint: disable=too-many-bra
         LOG.info('Game Blacked Out: %s', msg)
         return stream_url, media_auth
 
-    # Get user set CDN
-    if config.CONFIG.parser['cdn'] == 'akamai':
-        cdn = 'MED2_AKAMAI_SECURE'
-    elif config.CONFIG.parser['cdn'] == 'level3':
-        cdn = 'MED2_LEVEL3_SECURE'
-
     url = config.CONFIG.parser['mf_svc_url'].format(content_id, config.CONFIG.playback_scenario,
                                                     config.CONFIG.platform, urllib.parse.quote_plus(session_key), cdn)
 
@@ -100,8 +188,7 @@ def fetch_stream(game_pk, content_id, event_id):  # pylint: disable=too-many-bra
     }
 
     util.log_http(url, 'get', headers, sys._getframe().f_code.co_name)
-    # json_source = requests.get(url, headers=headers, cookies=auth.load_cookies(), verify=config.VERIFY_SSL).json()
-    response = requests.get(url, headers=headers, cookies=auth.load_cookies(), verify=config.VERIFY_SSL)
+    response = httpclient.get(url, headers=headers, cookies=auth.load_cookies())
     json_source = response.json()
 
     # if json_source is not None and config.SAVE_JSON_FILE:
@@ -112,8 +199,7 @@ def fetch_stream(game_pk, content_id, event_id):  # pylint: disable=too-many-bra
                                      '{}-{}.json'.format(output_filename, time.strftime("%Y-%m-%d-%H%M")))
         else:
             json_file = os.path.join(util.get_tempdir(), '{}.json'.format(output_filename))
-        with open(json_file, 'w') as out:  # write date to json_file
-            out.write(response.text)
+        state.atomic_write(json_file, response.content)
 
     if json_source['status_code'] == 1:
         media_item = json_source['user_verified_event'][0]['user_verified_content'][0]['user_verified_media_item'][0]
@@ -121,27 +207,28 @@ def fetch_stream(game_pk, content_id, event_id):  # pylint: disable=too-many-bra
             msg = ('The game you are trying to access is not currently available due to local '
                    'or national blackout restrictions.\n'
                    'Full game archives will be available 48 hours after completion of this game.')
-            util.die('Game Blacked Out: {}'.format(msg))
+            raise StreamException('Game Blacked Out: {}'.format(msg))
         elif media_item['auth_status'] == 'NotAuthorizedStatus':
             msg = 'You do not have an active subscription. To access this content please purchase a subscription.'
-            util.die('Account Not Authorized: {}'.format(msg))
+            raise StreamException('Account Not Authorized: {}'.format(msg))
         else:
             stream_url = media_item['url']
             media_auth = '{}={}'.format(str(json_source['session_info']['sessionAttributes'][0]['attributeName']),
                                         str(json_source['session_info']['sessionAttributes'][0]['attributeValue']))
-            if session_key in json_source:
-                session_key = json_source['session_key']
-                auth.update_session_key(session_key)
+            if 'session_key' in json_source:
+                session_key = str(json_source['session_key'])
+                auth.update_session_key(session_key, event_id)
+            cache_stream(content_id, cdn, stream_url, media_auth)
     else:
         msg = json_source['status_message']
-        util.die('Error Fetching Stream: {}', msg)
+        raise StreamException('Error Fetching Stream: {}'.format(msg))
 
     LOG.debug('fetch_stream stream_url: %s', stream_url)
     LOG.debug('fetch_stream media_auth: %s', media_auth)
     return stream_url, media_auth
 
 
-def save_playlist_to_file(stream_url, media_auth):
+def save_playlist_to_file(stream_url, media_auth, content_id=None):
     headers = {
         "Accept": "*/*",
         "Accept-Encoding": "identity",
@@ -151,21 +238,136 @@ def save_playlist_to_file(stream_url, media_auth):
         "Cookie": media_auth
     }
     util.log_http(stream_url, 'get', headers, sys._getframe().f_code.co_name)
-    playlist = requests.get(stream_url, headers=headers, cookies=auth.load_cookies(), verify=config.VERIFY_SSL).text
+    response = httpclient.get(stream_url, headers=headers, cookies=auth.load_cookies())
+    if response.status_code in (401, 403):
+        LOG.debug('Playlist request not authorized: %s', response.status_code)
+        if content_id is not None:
+            invalidate_stream(content_id)
+    playlist = response.text
     playlist_file = os.path.join(config.CONFIG.dir, 'playlist-{}.m3u8'.format(time.strftime("%Y-%m-%d")))
     LOG.debug('writing playlist to: %s', playlist_file)
-    with open(playlist_file, 'w') as handle:
-        handle.write(playlist)
+    state.atomic_write(playlist_file, playlist)
     LOG.debug('save_playlist_to_file: %s', playlist)
 
 
+class StreamCredentials:
+    """The credentials needed to download a stream, and when they expire (epoch seconds)."""
+    __slots__ = ('stream_url', 'media_auth', 'auth_cookie', 'auth_expiry', 'media_auth_expiry', 'session_key_time')
+
+    def __init__(self, stream_url, media_auth, auth_cookie, auth_expiry, media_auth_expiry, session_key_time):
+        self.stream_url = stream_url
+        self.media_auth = media_auth
+        self.auth_cookie = auth_cookie
+        self.auth_expiry = auth_expiry
+        self.media_auth_expiry = media_auth_expiry
+        self.session_key_time = session_key_time
+
+    def get_cookies(self):
+        """Returns the cookies for stream requests, as a dict."""
+        cookies = {'Authorization': self.auth_cookie}
+        if self.media_auth:
+            name, _, value = self.media_auth.partition('=')
+            cookies[name] = value
+        return cookies
+
+
+class CredentialsRefresher:
+    """Renews the stream credentials in a background thread, before they expire.
+
+    The authorization cookie is renewed by logging in again, the session key once it reaches its
+    maximum age, and the media authorization by resolving the stream again. Listeners (e.g. a
+    downloader) are called with the new StreamCredentials.
+    """
+
+    def __init__(self, game_pk, content_id, event_id, credentials):
+        self.game_pk = game_pk
+        self.content_id = content_id
+        self.event_id = event_id
+        self.margin = config.CONFIG.parser.getint('credentials_refresh_margin_secs', DEFAULT_REFRESH_MARGIN)
+        self.media_auth_ttl = config.CONFIG.parser.getint('media_auth_ttl_secs', DEFAULT_MEDIA_AUTH_TTL)
+        self.session_key_ttl = config.CONFIG.parser.getint('session_key_ttl_secs', auth.DEFAULT_SESSION_KEY_TTL)
+        self._credentials = credentials
+        self._listeners = list()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def create(cls, game_pk, content_id, event_id, stream_url, media_auth):
+        """Returns a refresher for credentials which were just resolved (by fetch_stream)."""
+        now = time.time()
+        media_auth_ttl = config.CONFIG.parser.getint('media_auth_ttl_secs', DEFAULT_MEDIA_AUTH_TTL)
+        credentials = StreamCredentials(stream_url, media_auth, auth.get_auth_cookie(), auth.get_auth_cookie_expiry(),
+                                        now + media_auth_ttl, now)
+        return cls(game_pk, content_id, event_id, credentials)
+
+    @property
+    def credentials(self):
+        with self._lock:
+            return self._credentials
+
+    def add_listener(self, listener):
+        """listener: called with the new StreamCredentials after each renewal"""
+        self._listeners.append(listener)
+
+    def get_next_refresh(self):
+        """Returns the time (epoch seconds) at which the credentials should be renewed."""
+        credentials = self.credentials
+        expiries = [credentials.media_auth_expiry, credentials.session_key_time + self.session_key_ttl]
+        if credentials.auth_expiry is not None:
+            expiries.append(credentials.auth_expiry)
+        return min(expiries) - self.margin
+
+    def refresh(self, now=None):
+        """Renews the credentials which are about to expire, and resolves the stream again."""
+        if now is None:
+            now = time.time()
+        current = self.credentials
+        if current.auth_expiry is not None and current.auth_expiry - self.margin <= now:
+            LOG.info('Renewing authorization')
+            auth.nhl_login(force=True)
+        auth_cookie = auth.get_auth_cookie()
+        session_key_time = current.session_key_time
+        if session_key_time + self.session_key_ttl - self.margin <= now:
+            LOG.info('Renewing session key')
+            auth.get_session_key(self.game_pk, self.event_id, self.content_id, auth_cookie, force=True)
+            session_key_time = now
+        stream_url, media_auth = fetch_stream(self.game_pk, self.content_id, self.event_id, use_cache=False)
+        if stream_url is None:
+            raise StreamException('Could not renew the stream credentials')
+        credentials = StreamCredentials(stream_url, media_auth, auth_cookie, auth.get_auth_cookie_expiry(),
+                                        now + self.media_auth_ttl, session_key_time)
+        with self._lock:
+            self._credentials = credentials
+        for listener in self._listeners:
+            listener(credentials)
+        return credentials
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            delay = max(self.get_next_refresh() - time.time(), 0)
+            if self._stop_event.wait(delay):
+                break
+            try:
+                self.refresh()
+            except (StreamException, requests.exceptions.RequestException) as ex:
+                LOG.error('Credential renewal failed, retrying: %s', ex)
+                self._stop_event.wait(RETRY_INTERVAL)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='credentials', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
 def get_game_rec(game_data, team_to_play):
     """Lookup game record from game data."""
-    game_rec = None
-    for game_pk in game_data:
-        if team_to_play in (game_data[game_pk]['away']['abbrev'], game_data[game_pk]['home']['abbrev']):
-            game_rec = game_data[game_pk]
-            break
+    game_rec = game_data.find_team(team_to_play)
     if game_rec is None:
         util.die("No game found for team {}".format(team_to_play))
     return game_rec
@@ -173,7 +375,7 @@ def get_game_rec(game_data, team_to_play):
 
 # pylint: disable=too-many-locals, too-many-arguments
 def play_stream(game_rec, team_to_play, feedtype, date_str, fetch, login_func,
-                from_start, offset=None, duration=None, is_multi_highlight=False):
+                from_start, offset=None, duration=None, is_multi_highlight=False, start_time=None, proxy_port=None):
     """Plays the stream."""
     if feedtype is not None and feedtype in config.HIGHLIGHT_FEEDTYPES:
         # handle condensed/recap
@@ -181,8 +383,8 @@ def play_stream(game_rec, team_to_play, feedtype, date_str, fetch, login_func,
         if playback_url is None:
             util.die("No playback url for feed '{}'".format(feedtype))
         stream.play_highlight(playback_url,
-                              stream.get_fetch_filename(date_str, game_rec['home']['abbrev'],
-                                                        game_rec['away']['abbrev'], feedtype, fetch),
+                              stream.get_fetch_filename(date_str, game_rec.home.abbrev,
+                                                        game_rec.away.abbrev, feedtype, fetch),
                               is_multi_highlight)
     else:
         # handle full game (live or archive)
@@ -197,24 +399,195 @@ def play_stream(game_rec, team_to_play, feedtype, date_str, fetch, login_func,
 
         media_playback_id, event_id = select_feed_for_team(game_rec, team_to_play, feedtype)
         if media_playback_id is not None:
-            stream_url, media_auth = fetch_stream(game_rec['game_pk'], media_playback_id, event_id)
-            if stream_url is not None:
-                if config.SAVE_PLAYLIST_FILE:
-                    save_playlist_to_file(stream_url, media_auth)
-                streamlink(stream_url, media_auth,
-                           stream.get_fetch_filename(date_str, game_rec['home']['abbrev'],
-                                                     game_rec['away']['abbrev'], feedtype, fetch),
-                           from_start, offset, duration)
-            else:
-                LOG.error("No stream URL found")
+            try:
+                _play_game_stream(game_rec, media_playback_id, event_id, feedtype, date_str, fetch,
+                                  from_start, offset, duration, start_time=start_time, proxy_port=proxy_port)
+            except StreamException as ex:
+                util.die(str(ex))
         else:
             LOG.info("No game stream found for %s", team_to_play)
     return 0
 
 
-def streamlink(stream_url, media_auth, fetch_filename=None, from_start=False, offset=None, duration=None):
-    """Invoke streamlink with given url."""
+def _play_game_stream(game_rec, media_playback_id, event_id, feedtype, date_str, fetch,
+                      from_start, offset=None, duration=None, timer=None, start_time=None, proxy_port=None):
+    if timer is None:
+        timer = util.StepTimer()
+    with timer.step('stream'):
+        stream_url, media_auth = fetch_stream(game_rec.game_pk, media_playback_id, event_id)
+    if stream_url is None:
+        LOG.error("No stream URL found")
+        return
+    if config.SAVE_PLAYLIST_FILE:
+        with timer.step('playlist'):
+            save_playlist_to_file(stream_url, media_auth, media_playback_id)
+    timer.report()
+    if proxy_port is not None:
+        serve_proxy(game_rec, media_playback_id, event_id, stream_url, media_auth, proxy_port)
+        return
+    if (not fetch and game_rec.abstract_game_state == 'Final' and not (from_start or offset or duration or start_time)
+            and segmentcache.get_cache() is not None):
+        if play_cached(game_rec, media_playback_id, event_id, stream_url, media_auth):
+            return
+    fetch_filename = stream.get_fetch_filename(date_str, game_rec.home.abbrev, game_rec.away.abbrev, feedtype, fetch)
+    if fetch and game_rec.abstract_game_state == 'Final' and config.CONFIG.parser.getboolean('native_fetch', True):
+        if fetch_native(stream_url, media_auth, fetch_filename, offset, duration, start_time):
+            return
+    if fetch and game_rec.abstract_game_state != 'Final':
+        fetch_live(game_rec, media_playback_id, event_id, stream_url, media_auth, fetch_filename, from_start,
+                   offset, duration, start_time)
+        return
+    streamlink(stream_url, media_auth, fetch_filename, from_start, offset, duration, start_time)
+
+
+def _create_proxy_downloader(refresher):
+    """Returns an HlsDownloader for the refresher's stream, which is kept up to date with the renewed credentials."""
+    headers = {'User-Agent': config.CONFIG.ua_iphone}
+    cookies = refresher.credentials.get_cookies()
+    media_playlist_url, _ = stream.resolve_playlist_url(refresher.credentials.stream_url, headers=headers,
+                                                        cookies=cookies)
+    downloader = hls.HlsDownloader(media_playlist_url, None, headers=headers, cookies=cookies,
+                                   select_variant=stream.select_variant, segment_cache=segmentcache.get_cache())
+    refresher.add_listener(lambda credentials: downloader.set_cookies(credentials.get_cookies()))
+    return downloader
+
+
+def play_cached(game_rec, media_playback_id, event_id, stream_url, media_auth):
+    """Plays an archived game through the segment cache (see stream.play_cached).
+    Returns False if the stream can't be played this way.
+    """
+    refresher = CredentialsRefresher.create(game_rec.game_pk, media_playback_id, event_id, stream_url, media_auth)
+    downloader = _create_proxy_downloader(refresher)
+    refresher.start()
+    try:
+        return stream.play_cached(downloader)
+    finally:
+        refresher.stop()
+
+
+def serve_proxy(game_rec, media_playback_id, event_id, stream_url, media_auth, port):
+    """Serves the stream to local players through the caching proxy, until interrupted.
+    The credentials are renewed for as long as the proxy runs.
+    """
+    refresher = CredentialsRefresher.create(game_rec.game_pk, media_playback_id, event_id, stream_url, media_auth)
+    downloader = _create_proxy_downloader(refresher)
+    proxy = hlsproxy.HlsProxy(downloader, config.CONFIG.parser.getint('proxy_prefetch', hlsproxy.DEFAULT_PREFETCH))
+    host = config.CONFIG.parser.get('proxy_host', '127.0.0.1')
+    LOG.info('Serving %s vs %s at http://%s:%s%s (Ctrl-C to stop)', game_rec.away.abbrev.upper(),
+             game_rec.home.abbrev.upper(), socket.gethostname() if host == '0.0.0.0' else host, port,
+             hlsproxy.PLAYLIST_PATH)
+    refresher.start()
+    try:
+        proxy.serve(host, port)
+    except KeyboardInterrupt:
+        LOG.info('Proxy stopped')
+    finally:
+        refresher.stop()
+
+
+def fetch_live(game_rec, media_playback_id, event_id, stream_url, media_auth, fetch_filename, from_start=False,
+               offset=None, duration=None, start_time=None):
+    """Records a live game with streamlink, through the local proxy.
+    A live recording can outlast the credentials, which can't be changed in a running streamlink:
+    streamlink reads the stream from the proxy, whose downloader gets the renewed credentials.
+    """
+    refresher = CredentialsRefresher.create(game_rec.game_pk, media_playback_id, event_id, stream_url, media_auth)
+    downloader = _create_proxy_downloader(refresher)
+    proxy = hlsproxy.HlsProxy(downloader, config.CONFIG.parser.getint('proxy_prefetch', hlsproxy.DEFAULT_PREFETCH))
+    proxy_url = proxy.start()
+    LOG.debug('Recording through the proxy at %s', proxy_url)
+    refresher.start()
+    try:
+        streamlink(proxy_url, media_auth, fetch_filename, from_start, offset, duration, start_time)
+    finally:
+        refresher.stop()
+        proxy.shutdown()
+
+
+def fetch_native(stream_url, media_auth, fetch_filename, offset=None, duration=None, start_time=None):
+    """Downloads an archived stream with the built-in parallel downloader.
+    Returns False if the stream can't be downloaded this way (the caller falls back to streamlink).
+    Exits if the download is interrupted.
+
+    offset, duration: [HH:]MM:SS strings, to download part of the stream
+    start_time: wall-clock time (epoch seconds) to start the download at, instead of offset
+    """
+    credentials = StreamCredentials(stream_url, media_auth, auth.get_auth_cookie(), None, None, None)
+    downloader = hls.HlsDownloader(stream_url, fetch_filename,
+                                   headers={'User-Agent': config.CONFIG.ua_iphone},
+                                   cookies=credentials.get_cookies(),
+                                   select_variant=stream.select_variant,
+                                   segment_cache=segmentcache.get_cache())
+    try:
+        playlist = downloader.load_playlist()
+        segments = None
+        if offset or duration or start_time is not None:
+            start, end = playlist.get_time_index().find_range(util.parse_duration(offset) if offset else None,
+                                                              util.parse_duration(duration) if duration else None,
+                                                              start_time)
+            segments = playlist.segments[start:end]
+        downloader.download(segments, playlist)
+    except (hls.HlsException, m3u8.PlaylistException) as ex:
+        LOG.info('Using streamlink to download (%s)', ex)
+        return False
+    except requests.exceptions.RequestException as ex:
+        # the partial download is kept: running the same command again resumes it. Exits non-zero,
+        # so that the download isn't taken as complete (e.g. by the recording daemon)
+        util.die('Download interrupted: {}. Run the same command again to resume.'.format(ex))
+    return True
+
+
+def _ensure_login(login_func):
+    if auth.get_auth_cookie() is None:
+        login_func()
+
+
+def play_team_stream(gamedata_retriever, needs, team_to_play, feedtype, date_str, fetch, login_func,
+                     from_start, offset=None, duration=None, start_time=None, proxy_port=None):
+    """Retrieves the team's game and plays the stream, running the independent startup steps
+    concurrently: the login runs alongside the schedule request, and the session key is requested
+    as soon as the feed's event id is known.
+    """
+    timer = util.StepTimer()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        login_future = None
+        if feedtype not in config.HIGHLIGHT_FEEDTYPES:
+            login_future = executor.submit(timer.run, 'login', _ensure_login, login_func)
+        game_day_tuple_list = timer.run('schedule', gamedata_retriever.process_game_data,
+                                        date_str, 1, needs, team_to_play)
+        if len(game_day_tuple_list) == 0:
+            return 0  # nothing to stream
+        game_rec = get_game_rec(game_day_tuple_list[0][1], team_to_play)
+        if login_future is None:
+            return play_stream(game_rec, team_to_play, feedtype, date_str, fetch, login_func, from_start,
+                               offset=offset, duration=duration, start_time=start_time, proxy_port=proxy_port)
+
+        with timer.step('feeds'):
+            media_playback_id, event_id = select_feed_for_team(game_rec, team_to_play, feedtype)
+        login_future.result()
+        if media_playback_id is None:
+            LOG.info("No game stream found for %s", team_to_play)
+            return 0
+        try:
+            timer.run('session key', auth.get_session_key, game_rec.game_pk, event_id, media_playback_id,
+                      auth.get_auth_cookie())
+        except StreamException as ex:
+            util.die(str(ex))
+    try:
+        _play_game_stream(game_rec, media_playback_id, event_id, feedtype, date_str, fetch,
+                          from_start, offset, duration, timer, start_time, proxy_port)
+    except StreamException as ex:
+        util.die(str(ex))
+    return 0
+
+
+def streamlink(stream_url, media_auth, fetch_filename=None, from_start=False, offset=None, duration=None,
+               start_time=None):
+    """Invoke streamlink with given url. start_time: wall-clock time (epoch seconds) to start the stream at."""
     LOG.debug("Stream url: %s", stream_url)
+    credentials = StreamCredentials(stream_url, media_auth, auth.get_auth_cookie(), None, None, None)
+    stream_url, stream_name = stream.resolve_playlist_url(stream_url, headers={'User-Agent': config.CONFIG.ua_iphone},
+                                                          cookies=credentials.get_cookies())
     auth_cookie_str = "Authorization=" + auth.get_auth_cookie()
     media_auth_cookie_str = media_auth
     user_agent_hdr = 'User-Agent=' + config.CONFIG.ua_iphone
@@ -228,7 +601,20 @@ def streamlink(stream_url, media_auth, fetch_filename=None, from_start=False, of
                       "--http-header", user_agent_hdr,
                       "--hls-timeout", "600",         # default: 60
                       "--hls-segment-timeout", "60"]  # default: 10
-    if from_start:
+    if start_time is not None:
+        try:
+            start_offset, is_live = stream.get_start_offset(stream_url, start_time,
+                                                            headers={'User-Agent': config.CONFIG.ua_iphone},
+                                                            cookies=credentials.get_cookies())
+        except (requests.exceptions.RequestException, m3u8.PlaylistException) as ex:
+            util.die('Cannot start the stream at {}: {}'.format(datetime.fromtimestamp(start_time), ex))
+        if is_live:
+            streamlink_cmd.append("--hls-live-restart")  # the offset is from the start of the playlist
+        streamlink_cmd.append("--hls-start-offset")
+        streamlink_cmd.append(stream.format_offset(start_offset))
+        LOG.info("Starting at %s [--hls-start-offset %s]", datetime.fromtimestamp(start_time),
+                 stream.format_offset(start_offset))
+    elif from_start:
         streamlink_cmd.append("--hls-live-restart")
         LOG.info("Starting from beginning [--hls-live-restart]")
     elif offset:
@@ -260,7 +646,7 @@ def streamlink(stream_url, media_auth, fetch_filename=None, from_start=False, of
         streamlink_cmd.append("--loglevel")
         streamlink_cmd.append("debug")
     streamlink_cmd.append(stream_url)
-    streamlink_cmd.append(config.CONFIG.parser.get('resolution', 'best'))
+    streamlink_cmd.append(stream_name)
 
     LOG.debug('Playing: %s', str(streamlink_cmd))
     subprocess.run(streamlink_cmd)
@@ -16,7 +16,6 @@ import logging
 import os
 import subprocess
 import sys
-import time
 
 from datetime import datetime
 from datetime import timedelta
@@ -29,6 +28,11 @@ import mlbam.nhlconfig as nhlconfig
 import mlbam.nhlgamedata as nhlgamedata
 import mlbam.standings as standings
 import mlbam.nhlstream as nhlstream
+import mlbam.nhlfeed as nhlfeed
+import mlbam.nhlrecorder as nhlrecorder
+import mlbam.nhlresolve as nhlresolve
+import mlbam.nhlwait as nhlwait
+import mlbam.nhlwatch as nhlwatch
 
 
 LOG = None  # initialized in init_logging
@@ -66,6 +70,29 @@ def display_usage():
     return 0
 
 
+def follow_plays(game_day_tuple_list, team_to_play, arg_filter):
+    """Prints the play-by-play events for the selected games as they happen."""
+    game_recs = dict()
+    for _, game_data in game_day_tuple_list:
+        if team_to_play is not None:
+            game_rec = game_data.find_team(team_to_play)
+            if game_rec is not None:
+                game_recs[game_rec.game_pk] = game_rec
+        else:
+            for game_rec in game_data.select(gamedata.compile_filter(arg_filter, nhlgamedata.FILTERS)):
+                if game_rec.abstract_game_state != 'Preview':
+                    game_recs[game_rec.game_pk] = game_rec
+    if not game_recs:
+        LOG.info('No games to follow')
+        return 0
+    try:
+        for event in nhlfeed.iter_events([nhlfeed.LiveFeed(game_pk) for game_pk in game_recs]):
+            print(nhlfeed.format_event(event, game_recs[event.game_pk] if len(game_recs) > 1 else None), flush=True)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
 def main(argv=None):  # pylint: disable=unused-argument
     """Entry point for nhlv"""
     # pylint: disable=too-many-statements,too-many-return-statements,too-many-branches,too-many-locals
@@ -108,12 +135,24 @@ def main(argv=None):  # pylint: disable=unused-argument
                               "or will start a live game one hour prior to now."))
     parser.add_argument("--duration",
                         help="Limit the playback duration, useful for watching segments of a stream")
+    parser.add_argument("--start-time",
+                        help=("Start the stream at a wall-clock time: HH:MM (local time on the game date) "
+                              "or a full date and time, e.g. '2018-01-06 20:15'. "
+                              "For live and archived games, when the stream includes its program date/time."))
     parser.add_argument("--favs",
                         help=argparse.SUPPRESS)  # help=("Favourite teams, a comma-separated list of favourite teams " "(normally specified in config file)"))  # noqa E501
     parser.add_argument("-o", "--filter", nargs='?', const='favs',
                         metavar='filtername|teams',
                         help=("Filter output. Either a filter name (see --list-filters) or a comma-separated "
-                              "list of team codes, eg: 'tor.bos,wsh'. Default: favs"))
+                              "list of team codes, eg: 'tor,bos,wsh'. Filters can be combined with '+', "
+                              "and can include a game state (preview, live, final, critical), "
+                              "eg: 'atlantic+live'. Default: favs"))
+    parser.add_argument("--watch", action="store_true",
+                        help=("Keep the game listing on screen, updating it as games progress. "
+                              "Exits once all games are final."))
+    parser.add_argument("--plays", action="store_true",
+                        help=("Follow the play-by-play (goals, penalties, periods) for the game given by -t/--team, "
+                              "or for all games matching the filter. Exits once the games are final."))
     parser.add_argument("--list-filters", action='store_true'
                         , help="List the built-in filters")
     parser.add_argument("-s", "--scores", action="store_true",
@@ -127,8 +166,18 @@ def main(argv=None):  # pylint: disable=unused-argument
     parser.add_argument("--fetch", "--record", action="store_true",
                         help="Save stream to file instead of playing")
     parser.add_argument("--wait", action="store_true",
-                        help=("Wait for game to start (live games only). Will block launching the player until game time. "
+                        help=("Wait for game to start (live games only). Will block launching the player until the feed is live. "
                               "Useful when combined with the --fetch option."))
+    parser.add_argument("--record-daemon", action="store_true",
+                        help=("Record all games matching the filter (default: favs) for the given --date/--days, "
+                              "starting each recording at game time. Runs until the last game is recorded."))
+    parser.add_argument("--resolve", action="store_true",
+                        help=("Resolve the stream URLs for all feeds of the games matching the filter (or -t/--team, "
+                              "-f/--feed) and print them as JSON lines, rather than playing"))
+    parser.add_argument("--proxy", nargs='?', const='config', metavar='PORT',
+                        help=("Serve the -t/--team game stream to local players through a caching proxy, rather than "
+                              "playing it. Players on the local network share a single download of the stream. "
+                              "Default port: proxy_port config setting"))
     parser.add_argument("--standings", nargs='?', const='division',
                         metavar='category',
                         help=("[category] is one of: '" + ', '.join(standings.STANDINGS_OPTIONS) + "' [default: %(default)s]. "
@@ -137,6 +186,9 @@ def main(argv=None):  # pylint: disable=unused-argument
                               "categories will be included), e.g. 'div'. "
                               "Can be combined with -d/--date option to show standings for any given date.")
                         )
+    parser.add_argument("--backfill", metavar='SEASON',
+                        help=("Retrieve the schedule for an entire season (e.g. 20232024) into the local season store, then exit. "
+                              "Subsequent --date/--days queries within the season are answered locally."))
     parser.add_argument("--recaps", nargs='?', const='all', metavar='FILTER',
                         help=("Play recaps for given teams. "
                               "[FILTER] is an optional filter as per --filter option"))
@@ -214,6 +266,30 @@ def main(argv=None):  # pylint: disable=unused-argument
             "ERROR: You cannot combine the "
             "'--from-start' and '--offset' options")
         return -1
+    if args.start_time and (args.from_start or args.offset):
+        LOG.error("ERROR: You cannot combine '--start-time' with the '--from-start' or '--offset' options")
+        return -1
+    for option_name, value in (('--offset', args.offset), ('--duration', args.duration)):
+        if value:
+            try:
+                util.parse_duration(value)
+            except ValueError:
+                LOG.error("ERROR: Invalid %s: %s (format: HH:MM:SS)", option_name, value)
+                return -1
+    proxy_port = None
+    if args.proxy:
+        try:
+            proxy_port = config.CONFIG.parser.getint('proxy_port') if args.proxy == 'config' else int(args.proxy)
+        except ValueError:
+            LOG.error("ERROR: Invalid --proxy port: %s", args.proxy)
+            return -1
+    start_time = None
+    if args.start_time:
+        try:
+            start_time = util.parse_start_time(args.start_time, args.date)
+        except (ValueError, OverflowError):
+            LOG.error("ERROR: Invalid --start-time: %s", args.start_time)
+            return -1
 
     if args.standings:
         standings.get_standings(args.standings, args.date)
@@ -221,9 +297,44 @@ def main(argv=None):  # pylint: disable=unused-argument
 
     gamedata_retriever = nhlgamedata.GameDataRetriever()
 
-    # retrieve all games for the dates given
+    if args.backfill:
+        game_count = gamedata_retriever.backfill_season(args.backfill)
+        LOG.info('Stored %s games for season %s', game_count, args.backfill)
+        return 0
+
+    if args.record_daemon:
+        return nhlrecorder.RecordingDaemon(args.date, args.days, args.filter,
+                                           nhlrecorder.get_recording_args(args)).run()
+
+    if args.watch and team_to_play is None and not args.recaps:
+        return nhlwatch.ScoreboardWatcher(args.date, args.days, args.filter).watch()
+
+    if team_to_play is not None and not (args.recaps or args.wait or args.resolve or args.plays):
+        # play the team's game: the login is done while the schedule is retrieved
+        return nhlstream.play_team_stream(gamedata_retriever, nhlgamedata.NEED_TEAMS | nhlgamedata.NEED_FEEDS,
+                                          team_to_play, feedtype, args.date, args.fetch, auth.nhl_login,
+                                          args.from_start, offset=args.offset, duration=args.duration,
+                                          start_time=start_time, proxy_port=proxy_port)
+
+    # retrieve all games for the dates given, requesting only the data required for the command
+    if args.plays:
+        needs = nhlgamedata.NEED_TEAMS
+    elif team_to_play is None and not args.recaps:
+        needs = nhlgamedata.NEED_TEAMS | nhlgamedata.NEED_FEEDS
+        if config.CONFIG.parser.getboolean('scores'):
+            needs |= nhlgamedata.NEED_LINESCORE
+    elif args.wait and not args.recaps:
+        needs = nhlgamedata.NEED_TEAMS  # the feeds are requested by the waiter
+    else:
+        needs = nhlgamedata.NEED_TEAMS | nhlgamedata.NEED_FEEDS
     game_day_tuple_list = gamedata_retriever.process_game_data(
-        args.date, args.days)
+        args.date, args.days, needs, team_to_play)
+
+    if args.resolve:
+        return 1 if nhlresolve.resolve_streams(game_day_tuple_list, args.filter, feedtype) else 0
+
+    if args.plays:
+        return follow_plays(game_day_tuple_list, team_to_play, args.filter)
 
     if team_to_play is None and not args.recaps:
         # nothing to play; display the games
@@ -243,27 +354,17 @@ def main(argv=None):  # pylint: disable=unused-argument
         return 0  # nothing to stream
 
     if args.recaps:
-        recap_teams = list()
-        if args.recaps == 'all':
-            for game_pk in game_data:
-                # add the home team
-                recap_teams.append(game_data[game_pk]['home']['abbrev'])
-        else:
-            for team in args.recaps.split(','):
-                recap_teams.append(team.strip())
-        for game_pk in game_data:
-            game_rec = gamedata.apply_filter(game_data[game_pk], args.filter,
-                                             nhlgamedata.FILTERS)
-            if game_rec and (game_rec['home']['abbrev'] in recap_teams
-                             or game_rec['away']['abbrev'] in recap_teams):
-                if 'recap' in game_rec['feed']:
+        recap_filter = None
+        if args.recaps != 'all':
+            recap_filter = gamedata.compile_filter(args.recaps, nhlgamedata.FILTERS)
+        for game_rec in game_data.select(gamedata.compile_filter(args.filter, nhlgamedata.FILTERS)):
+            if recap_filter is None or recap_filter.matches(game_rec):
+                if 'recap' in game_rec.feeds:
                     LOG.info("Playing recap for %s at %s",
-                             game_rec['away']['abbrev'].upper(),
-                             game_rec['home']['abbrev'].upper())
-                    stream_game_rec = nhlstream.get_game_rec(
-                        game_data, game_rec['home']['abbrev'])
-                    nhlstream.play_stream(stream_game_rec,
-                                          game_rec['home']['abbrev'],
+                             game_rec.away.abbrev.upper(),
+                             game_rec.home.abbrev.upper())
+                    nhlstream.play_stream(game_rec,
+                                          game_rec.home.abbrev,
                                           'recap',
                                           game_date, args.fetch, None, None,
                                           offset=args.offset,
@@ -271,35 +372,14 @@ def main(argv=None):  # pylint: disable=unused-argument
                                           is_multi_highlight=True)
                 else:
                     LOG.info("No recap available for %s at %s",
-                             game_rec['away']['abbrev'].upper(),
-                             game_rec['home']['abbrev'].upper())
+                             game_rec.away.abbrev.upper(),
+                             game_rec.home.abbrev.upper())
         return 0
 
     game_rec = nhlstream.get_game_rec(game_data, team_to_play)
 
-    if args.wait and not util.has_reached_time(game_rec['nhldate']):
-        LOG.info('Waiting for game to start. Local start time is %s',
-                 util.convert_time_to_local(game_rec['nhldate']))
-        print('Use Ctrl-c to quit .', end='', flush=True)
-        count = 0
-        while not util.has_reached_time(game_rec['nhldate']):
-            time.sleep(10)
-            count += 1
-            if count % 6 == 0:
-                print('.', end='', flush=True)
-
-        # refresh the game data
-        LOG.info('Game time. Refreshing game data after wait...')
-        game_day_tuple_list = gamedata_retriever.process_game_data(
-            args.date, 1)
-        if len(game_day_tuple_list) > 0:
-            game_date, game_data = game_day_tuple_list[0]
-        else:
-            LOG.error(
-                'Unexpected error: no game data found after refresh on wait')
-            return 0
-
-        game_rec = nhlstream.get_game_rec(game_data, team_to_play)
+    if args.wait and not nhlwait.GameWaiter(game_rec, team_to_play, feedtype).wait():
+        return -1
 
     return nhlstream.play_stream(game_rec,
                                  team_to_play,
@@ -309,7 +389,9 @@ def main(argv=None):  # pylint: disable=unused-argument
                                  auth.nhl_login,
                                  args.from_start,
                                  offset=args.offset,
-                                 duration=args.duration)
+                                 duration=args.duration,
+                                 start_time=start_time,
+                                 proxy_port=proxy_port)
 
 
 if __name__ in ("__main__", "main"):
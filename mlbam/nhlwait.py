@@ -0,0 +1,119 @@
+"""
+Waiting for a game to start (--wait)
+
+Sleeps until shortly before the scheduled start time, then prepares the whole playback chain
+while the game has not started yet:
+
+- logs in (if there is no valid authorization cookie)
+- requests the session key
+- opens connections to the media service and CDN hosts
+
+Finally the game's EPG is polled, with a backoff, until the requested feed is live. The caller
+can then resolve the stream and launch the player immediately.
+"""
+
+import logging
+import time
+
+from datetime import datetime
+from datetime import timezone
+
+import requests
+
+import mlbam.auth as auth
+import mlbam.common.config as config
+import mlbam.common.httpclient as httpclient
+import mlbam.common.stream as stream
+import mlbam.common.util as util
+import mlbam.nhlgamedata as nhlgamedata
+
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_LEAD_SECS = 300  # start preparing this long before the scheduled start
+DEFAULT_FEED_TIMEOUT_SECS = 3600  # give up waiting for the feed this long after the scheduled start
+POLL_INTERVAL_MIN = 5
+POLL_INTERVAL_MAX = 30
+POLL_BACKOFF = 1.5
+MAX_SLEEP_SECS = 60  # long sleeps are split up, so that a system suspend doesn't oversleep the start
+
+
+def _seconds_until(datetime_val_utc):
+    return (datetime_val_utc - datetime.now(timezone.utc)).total_seconds()
+
+
+class GameWaiter:
+    """Waits for the feed of a game to go live."""
+
+    def __init__(self, game_rec, team_code, feedtype=None):
+        self.game_rec = game_rec
+        self.team_code = team_code
+        self.feedtype = feedtype
+        self.lead_secs = config.CONFIG.parser.getint('wait_lead_secs', DEFAULT_LEAD_SECS)
+        self.feed_timeout_secs = config.CONFIG.parser.getint('wait_feed_timeout_secs', DEFAULT_FEED_TIMEOUT_SECS)
+
+    def sleep_until_lead_time(self):
+        """Sleeps until lead_secs before the game starts."""
+        if _seconds_until(self.game_rec.nhldate) <= self.lead_secs:
+            return
+        LOG.info('Waiting for game to start. Local start time is %s',
+                 util.convert_time_to_local(self.game_rec.nhldate))
+        print('Use Ctrl-c to quit .', end='', flush=True)
+        while True:
+            remaining = _seconds_until(self.game_rec.nhldate) - self.lead_secs
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, MAX_SLEEP_SECS))
+            print('.', end='', flush=True)
+        print('')
+
+    def get_feed(self):
+        """Returns the requested feed for the game, or None if it is not in the EPG."""
+        # the same choice as playback (nhlstream.select_feed_for_team)
+        feedtype = nhlgamedata.choose_feedtype(self.game_rec, self.team_code, self.feedtype)
+        return self.game_rec.feeds[feedtype] if feedtype is not None else None
+
+    def prepare(self):
+        """Logs in, requests the session key and opens the connections needed for playback."""
+        LOG.info('Preparing playback')
+        if auth.get_auth_cookie() is None:
+            auth.nhl_login()
+        prewarm_urls = [auth.SESSION_KEY_URL, config.CONFIG.parser['mf_svc_url']]
+        prewarm_urls.extend(url for url in util.get_csv_list(config.CONFIG.parser.get('prewarm_urls', '')) if url)
+        httpclient.prewarm(prewarm_urls)
+        feed = self.get_feed()
+        auth_cookie = auth.get_auth_cookie()
+        if feed is not None and feed.event_id is not None and auth_cookie is not None:
+            try:
+                auth.get_session_key(self.game_rec.game_pk, feed.event_id, feed.media_playback_id, auth_cookie)
+            except stream.StreamException as ex:
+                # requested again for playback, which reports the error
+                LOG.debug('Could not prefetch the session key: %s', ex)
+
+    def wait_for_feed(self):
+        """Polls the EPG until the feed is live. Returns False on timeout."""
+        interval = POLL_INTERVAL_MIN
+        while True:
+            try:
+                self.game_rec.refresh_feeds()
+            except requests.exceptions.RequestException as ex:
+                LOG.debug('EPG request failed: %s', ex)
+            feed = self.get_feed()
+            if feed is not None and feed.is_available():
+                LOG.info('Feed is live: %s', feed.feedtype)
+                return True
+            if _seconds_until(self.game_rec.nhldate) < -self.feed_timeout_secs:
+                LOG.error('Timed out waiting for the feed to start')
+                return False
+            # poll faster once the scheduled start has been reached
+            if _seconds_until(self.game_rec.nhldate) <= 0:
+                interval = min(interval, POLL_INTERVAL_MIN * 2)
+            LOG.debug('Feed not live yet, checking again in %s seconds', interval)
+            time.sleep(interval)
+            interval = min(interval * POLL_BACKOFF, POLL_INTERVAL_MAX)
+
+    def wait(self):
+        """Returns once the feed is live (or the wait has timed out)."""
+        self.sleep_until_lead_time()
+        self.prepare()
+        return self.wait_for_feed()
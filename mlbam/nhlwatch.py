@@ -0,0 +1,149 @@
+"""
+Live scoreboard (--watch)
+
+Keeps the game listing on screen and polls the schedule/linescore, with a polling interval which
+adapts to the game states. Only the rows which changed since the last poll are redrawn. A failed
+poll keeps the last listing on screen, and is retried after the polling interval.
+"""
+
+import logging
+import sys
+import time
+
+from datetime import datetime
+from datetime import timezone
+
+import requests
+
+import mlbam.common.config as config
+import mlbam.common.gamedata as gamedata
+import mlbam.nhlgamedata as nhlgamedata
+
+from mlbam.common.displayutil import ANSI
+
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL_CRITICAL = 10
+DEFAULT_INTERVAL_LIVE = 20
+DEFAULT_INTERVAL_PREVIEW = 300
+
+# detailed states of games which will not be played today
+FINISHED_DETAILED_STATES = ('Postponed', )
+
+
+class ScoreboardWatcher:
+    """Polls and redraws the game listing until all games are final."""
+
+    def __init__(self, game_date, num_days, arg_filter):
+        self.game_date = game_date
+        self.num_days = num_days
+        self.arg_filter = arg_filter
+        # live data is wanted here: bypass the http cache and season store
+        self.retriever = nhlgamedata.GameDataRetriever(use_store=False, use_cache=False)
+        self.presenter = nhlgamedata.GameDatePresenter()
+        self.previous_records = dict()  # game_pk: GameRecord, from the previous poll
+        self.displayed_lines = list()
+        self.use_ansi = sys.stdout.isatty()
+
+    def _poll(self, needs):
+        game_day_tuple_list = self.retriever.process_game_data(self.game_date, self.num_days, needs)
+        for _, game_records in game_day_tuple_list:
+            for game_pk, game_rec in game_records.items():
+                previous_rec = self.previous_records.get(game_pk)
+                # feeds only change along with the game state (e.g. archive/highlights after the game)
+                if previous_rec is not None and previous_rec.abstract_game_state == game_rec.abstract_game_state:
+                    game_rec.copy_feeds_from(previous_rec)
+        return game_day_tuple_list
+
+    def _get_lines(self, game_day_tuple_list):
+        lines = list()
+        for game_date, game_records in game_day_tuple_list:
+            game_lines = self.presenter.get_game_data_lines(game_date, game_records, self.arg_filter)
+            if game_lines:
+                if lines:
+                    lines.append('')
+                lines.extend(game_lines)
+        return lines
+
+    def _redraw(self, lines):
+        """Redraws only the lines which changed. A change in the number of lines redraws everything."""
+        if not self.use_ansi:
+            if lines != self.displayed_lines:
+                print('\n'.join(lines + ['']), flush=True)
+            self.displayed_lines = lines
+            return
+        out = list()
+        num_displayed = len(self.displayed_lines)
+        if len(lines) != num_displayed:
+            out.append(ANSI.cursor_up(num_displayed) + ANSI.clear_to_end())
+            out.extend(line + '\n' for line in lines)
+        else:
+            for index, line in enumerate(lines):
+                if line != self.displayed_lines[index]:
+                    out.append(ANSI.cursor_up(num_displayed - index) + ANSI.clear_line() + line
+                               + ANSI.cursor_down(num_displayed - index))
+        if out:
+            sys.stdout.write(''.join(out))
+            sys.stdout.flush()
+        self.displayed_lines = lines
+
+    @staticmethod
+    def get_poll_interval(game_recs, now=None):
+        """Returns the number of seconds until the next poll, or None if all games are finished."""
+        if now is None:
+            now = datetime.now(timezone.utc)
+        interval_critical = config.CONFIG.parser.getint('watch_interval_critical', DEFAULT_INTERVAL_CRITICAL)
+        interval_live = config.CONFIG.parser.getint('watch_interval_live', DEFAULT_INTERVAL_LIVE)
+        interval = None
+        for game_rec in game_recs:
+            if game_rec.abstract_game_state == 'Final' or game_rec.detailed_state in FINISHED_DETAILED_STATES:
+                continue
+            if 'Critical' in game_rec.detailed_state:
+                game_interval = interval_critical
+            elif game_rec.abstract_game_state == 'Live':
+                game_interval = interval_live
+            else:
+                # wake up around game time, but keep checking for schedule/state changes
+                secs_to_start = (game_rec.nhldate - now).total_seconds()
+                game_interval = max(interval_live,
+                                    min(config.CONFIG.parser.getint('watch_interval_preview', DEFAULT_INTERVAL_PREVIEW),
+                                        secs_to_start))
+            interval = game_interval if interval is None else min(interval, game_interval)
+        return interval
+
+    def watch(self):
+        """Displays the games and polls for changes until all games are final."""
+        try:
+            return self._watch()
+        except KeyboardInterrupt:
+            return 0
+
+    def _watch(self):
+        needs = nhlgamedata.NEED_ALL
+        interval = config.CONFIG.parser.getint('watch_interval_live', DEFAULT_INTERVAL_LIVE)
+        while True:
+            try:
+                game_day_tuple_list = self._poll(needs)
+            except requests.exceptions.RequestException as ex:
+                # on a terminal, a log line would move the listing out from under the redraw
+                LOG.log(logging.DEBUG if self.use_ansi else logging.WARNING,
+                        'Could not update the games, retrying in %s seconds: %s', interval, ex)
+                time.sleep(interval)
+                continue
+            # the feeds are only requested once: later polls re-use them (or request them per game on a state change)
+            needs = nhlgamedata.NEED_TEAMS | nhlgamedata.NEED_LINESCORE
+            self._redraw(self._get_lines(game_day_tuple_list))
+
+            self.previous_records = dict()
+            displayed_recs = list()
+            compiled_filter = gamedata.compile_filter(self.arg_filter, nhlgamedata.FILTERS)
+            for _, game_records in game_day_tuple_list:
+                self.previous_records.update(game_records)
+                displayed_recs.extend(game_records.select(compiled_filter))
+            interval = self.get_poll_interval(displayed_recs)
+            if interval is None:
+                LOG.info('All games are final')
+                return 0
+            LOG.debug('Next poll in %s seconds', interval)
+            time.sleep(interval)
@@ -81,7 +81,7 @@ def get_standings(standings_option='all', date_str=None):
 
 def display_standings(standings_type, display_title, date_str, rank_tag='divisionRank', header_tags=('conference', 'division')):
     url = STANDINGS_URL.format(standings_type=standings_type, date=date_str)
-    json_data = util.request_json(url, 'standings')
+    json_data = util.request_json(url, 'standings', cache_ttl=config.CONFIG.parser.getint('cache_ttl_standings'))
 
     border = displayutil.Border(use_unicode=config.UNICODE)
 
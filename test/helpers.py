@@ -0,0 +1,61 @@
+"""Fakes and test data shared by the test modules
+"""
+
+import configparser
+import io
+
+import mlbam.nhlconfig as nhlconfig
+
+
+class FakeConfig:
+    playback_scenario = 'HTTP_CLOUD_TABLET_60'
+    ua_iphone = 'iPhone'
+
+    def __init__(self, **overrides):
+        parser = configparser.ConfigParser()
+        parser.read_dict(nhlconfig.DEFAULTS)
+        self.parser = parser['nhlv']
+        for key, val in overrides.items():
+            self.parser[key] = val
+
+
+class Response:
+    """A requests response with fixed content."""
+    def __init__(self, content):
+        self.content = content
+        self.text = content.decode() if isinstance(content, bytes) else content
+        self.headers = {'Content-Length': str(len(content))}
+        self.raw = io.BytesIO(content if isinstance(content, bytes) else content.encode())
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def schedule_game(game_pk, game_date, away='tor', home='mtl'):
+    """Returns a game of a statsapi schedule response."""
+    return {
+        'gamePk': game_pk,
+        'gameDate': '{}T23:00:00Z'.format(game_date),
+        'status': {'abstractGameState': 'Preview', 'detailedState': 'Scheduled'},
+        'teams': {
+            'away': {'team': {'name': away, 'abbreviation': away.upper()}, 'score': 0},
+            'home': {'team': {'name': home, 'abbreviation': home.upper()}, 'score': 0},
+        },
+        'linescore': {'currentPeriod': 0},
+        'content': {},
+    }
+
+
+def schedule_game_with_feeds(game_pk, away, home):
+    """Returns a game with home and away NHLTV feeds."""
+    game_json = schedule_game(game_pk, '2018-01-01', away, home)
+    game_json['content'] = {'media': {'epg': [
+        {'title': 'NHLTV', 'items': [
+            {'mediaFeedType': feedtype, 'mediaPlaybackId': '{}{}'.format(game_pk, index), 'eventId': game_pk,
+             'callLetters': '', 'mediaState': 'MEDIA_ON'}
+            for index, feedtype in enumerate(('HOME', 'AWAY'))]},
+    ]}}
+    return game_json
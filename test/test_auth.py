@@ -0,0 +1,102 @@
+"""pytest test cases for the auth module
+"""
+
+import http.cookiejar
+import os
+import time
+
+import pytest
+
+import mlbam.common.config as config
+import mlbam.common.util as util
+from mlbam import auth
+from mlbam.common import httpclient
+from test.helpers import FakeConfig
+
+
+def _cookie(name, value, expires):
+    return http.cookiejar.Cookie(0, name, value, None, False, '.nhl.com', True, True, '/', True, False,
+                                 expires, False, None, None, {})
+
+
+@pytest.fixture
+def cookie_dir(monkeypatch, tmpdir):
+    fake_config = FakeConfig()
+    fake_config.dir = str(tmpdir)
+    monkeypatch.setattr(config, 'CONFIG', fake_config)
+    monkeypatch.setattr(auth, '_COOKIE_JAR', None)
+    monkeypatch.setattr(auth, '_COOKIE_FILE_MTIME', None)
+    cookie_jar = http.cookiejar.LWPCookieJar()
+    cookie_jar.set_cookie(_cookie('Authorization', 'token', int(time.time()) + 3600))
+    cookie_jar.save(os.path.join(str(tmpdir), 'cookies.lwp'), ignore_discard=True)
+    return str(tmpdir)
+
+
+def test_warm_login(cookie_dir, monkeypatch):
+    load_count = list()
+    original_load = http.cookiejar.LWPCookieJar.load
+
+    def counting_load(self, *args, **kwargs):
+        load_count.append(1)
+        return original_load(self, *args, **kwargs)
+
+    def no_requests(*args, **kwargs):
+        raise AssertionError('unexpected request')
+
+    monkeypatch.setattr(http.cookiejar.LWPCookieJar, 'load', counting_load)
+    monkeypatch.setattr(httpclient, 'post', no_requests)
+    auth.nhl_login()
+    assert auth.get_auth_cookie() == 'token'
+    assert auth.get_auth_cookie_expiry() > time.time()
+    assert len(load_count) == 1
+
+    # unchanged cookies are not written back
+    mtime = os.stat(auth.get_cookie_file()).st_mtime_ns
+    cookie_jar = http.cookiejar.CookieJar()
+    cookie_jar.set_cookie(_cookie('Authorization', 'token', auth.get_auth_cookie_expiry()))
+    auth.save_cookies(cookie_jar)
+    assert os.stat(auth.get_cookie_file()).st_mtime_ns == mtime
+
+    cookie_jar.set_cookie(_cookie('Authorization', 'token2', auth.get_auth_cookie_expiry()))
+    auth.save_cookies(cookie_jar)
+    assert auth.get_auth_cookie() == 'token2'
+    assert len(load_count) == 1
+    assert 'token2' in open(auth.get_cookie_file()).read()
+
+
+def test_session_key_store(cookie_dir, monkeypatch):
+    requested = list()
+
+    class Response:
+        def __init__(self, event_id):
+            self.event_id = event_id
+
+        def json(self):
+            media_item = {'blackout_status': {'status': 'BlackedOutStatus' if self.event_id == '3' else 'None'}}
+            return {'status_code': 1, 'session_key': 'key' + self.event_id,
+                    'user_verified_event': [{'user_verified_content': [{'user_verified_media_item': [media_item]}]}]}
+
+    def fake_get(url, **kwargs):
+        event_id = url.split('eventId=')[1].split('&')[0]
+        requested.append(event_id)
+        return Response(event_id)
+
+    monkeypatch.setattr(httpclient, 'get', fake_get)
+    monkeypatch.setattr(util, 'log_http', lambda *args: None)
+    monkeypatch.setattr(config.CONFIG, 'platform', 'IPHONE', raising=False)
+    monkeypatch.setattr(config.CONFIG, 'ua_pc', 'ua', raising=False)
+    assert auth.get_session_key('1', '1', '10', 'token') == 'key1'
+    assert auth.get_session_key('2', '2', '20', 'token') == 'key2'
+    assert auth.get_session_key('1', '1', '10', 'token') == 'key1'
+    assert auth.get_session_key('3', '3', '30', 'token') == 'blackout'
+    assert auth.get_session_key('3', '3', '30', 'token') == 'blackout'
+    assert requested == ['1', '2', '3']
+    assert auth.get_session_key('1', '1', '10', 'token', force=True) == 'key1'
+    assert requested == ['1', '2', '3', '1']
+
+    # expired entries are requested again, and dropped from the file
+    real_time = time.time
+    monkeypatch.setattr(auth.time, 'time', lambda: real_time() + 7200)
+    assert auth.get_session_key('3', '3', '30', 'token') == 'blackout'
+    assert requested[-1] == '3'
+    assert auth.get_cached_session_key('1') == 'key1'
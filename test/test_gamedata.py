@@ -0,0 +1,78 @@
+"""pytest test cases for the gamedata module
+"""
+
+from mlbam.common import gamedata
+
+
+FILTERS = {
+    'favs': '',
+    'atlantic': 'bos,buf,det,fla,mtl,ott,tbl,tor',
+    'central': 'ari,chi,col,dal,min,nsh,stl,wpg',
+}
+
+
+class Team:
+    def __init__(self, abbrev):
+        self.abbrev = abbrev
+
+
+class Game:
+    def __init__(self, game_pk, away, home, state='Preview', detailed_state='Scheduled'):
+        self.game_pk = game_pk
+        self.away = Team(away)
+        self.home = Team(home)
+        self.abstract_game_state = state
+        self.detailed_state = detailed_state
+        self.favourite = None
+
+
+def _game_records():
+    game_records = gamedata.GameRecords()
+    game_records.add(Game('1', 'tor', 'mtl', 'Live', 'In Progress - Critical'))
+    game_records.add(Game('2', 'wpg', 'ott', 'Final', 'Final'))
+    game_records.add(Game('3', 'chi', 'stl'))
+    return game_records
+
+
+def _select(expression, favs='wpg'):
+    compiled_filter = gamedata.compile_filter(expression, FILTERS, favs=favs)
+    return [game_rec.game_pk for game_rec in _game_records().select(compiled_filter)]
+
+
+def test_team_filters():
+    assert _select(None) == ['1', '2', '3']
+    assert _select('tor,stl') == ['1', '3']
+    assert _select('atlantic') == ['1', '2']
+    assert _select('favs') == ['2']
+    assert _select('favs', favs='') == []
+
+
+def test_combined_filters():
+    assert _select('atlantic+live') == ['1']
+    assert _select('central+final,preview') == ['2', '3']
+    assert _select('favs,critical') == ['1', '2']
+    assert _select('critical+favs') == []
+
+
+def test_filter_matches_same_as_select():
+    for expression in ('atlantic+live', 'tor,stl', 'central+final,preview', 'critical'):
+        compiled_filter = gamedata.compile_filter(expression, FILTERS, favs='wpg')
+        matched = [game_rec.game_pk for game_rec in _game_records().values() if compiled_filter.matches(game_rec)]
+        assert matched == _select(expression)
+
+
+def test_find_team():
+    game_records = _game_records()
+    assert game_records.find_team('ott').game_pk == '2'
+    assert game_records.find_team('van') is None
+    game_records.add(Game('4', 'ott', 'bos'))  # a later game of the same team
+    assert game_records.find_team('ott').game_pk == '2'
+    assert game_records.by_team['ott'] == ['2', '4']
+
+
+def test_compiled_filter_follows_filter_changes():
+    filters = dict(FILTERS)
+    assert _select('atlantic') == ['1', '2']
+    filters['atlantic'] = 'chi'
+    compiled_filter = gamedata.compile_filter('atlantic', filters, favs='wpg')
+    assert [game_rec.game_pk for game_rec in _game_records().select(compiled_filter)] == ['3']
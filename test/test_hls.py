@@ -0,0 +1,190 @@
+"""pytest test cases for the m3u8 and hls modules
+"""
+
+import os
+import random
+import time
+
+import pytest
+import requests
+
+from mlbam.common import hls
+from mlbam.common import httpclient
+from mlbam.common import m3u8
+from test.helpers import Response
+
+
+MASTER = """#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360,CODECS="avc1.4d401e,mp4a.40.2"
+360p/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=6600000,RESOLUTION=1280x720,FRAME-RATE=60.000
+720p60/index.m3u8
+"""
+
+MEDIA = """#EXTM3U
+#EXT-X-TARGETDURATION:10
+#EXT-X-MEDIA-SEQUENCE:5
+#EXT-X-KEY:METHOD=AES-128,URI="https://keys/1",IV=0x000102030405060708090a0b0c0d0e0f
+#EXT-X-PROGRAM-DATE-TIME:2018-01-01T23:00:00.000Z
+#EXTINF:10.0,
+seg5.ts
+#EXT-X-KEY:METHOD=NONE
+#EXT-X-DISCONTINUITY
+#EXTINF:9.5,
+#EXT-X-BYTERANGE:100@0
+all.ts
+#EXTINF:10.0,
+#EXT-X-BYTERANGE:50
+all.ts
+#EXT-X-ENDLIST
+"""
+
+
+def test_parse_master():
+    playlist = m3u8.parse(MASTER, 'https://cdn/game/master.m3u8')
+    assert isinstance(playlist, m3u8.MasterPlaylist)
+    assert [variant.uri for variant in playlist.variants] == ['https://cdn/game/360p/index.m3u8',
+                                                              'https://cdn/game/720p60/index.m3u8']
+    assert playlist.variants[0].codecs == 'avc1.4d401e,mp4a.40.2'
+    assert playlist.variants[1].resolution == (1280, 720) and playlist.variants[1].frame_rate == 60
+    assert hls.select_best_variant(playlist) is playlist.variants[1]
+
+
+def test_parse_media():
+    playlist = m3u8.parse(MEDIA, 'https://cdn/game/720p60/index.m3u8')
+    assert playlist.endlist and playlist.target_duration == 10
+    assert [segment.sequence for segment in playlist.segments] == [5, 6, 7]
+    assert playlist.segments[0].uri == 'https://cdn/game/720p60/seg5.ts'
+    assert playlist.segments[0].key.iv == bytes(range(16))
+    assert playlist.segments[0].program_date_time == '2018-01-01T23:00:00.000Z'
+    assert playlist.segments[1].key is None and playlist.segments[1].discontinuity
+    assert [segment.byterange for segment in playlist.segments[1:]] == [(100, 0), (50, 100)]
+    assert playlist.get_duration() == 29.5
+    assert m3u8.Key('AES-128').get_iv(1) == bytes(15) + b'\x01'
+    with pytest.raises(m3u8.PlaylistException):
+        m3u8.parse('not a playlist', 'https://cdn/')
+
+
+def test_download_in_order(monkeypatch, tmpdir):
+    segment_count = 40
+    media = '#EXTM3U\n#EXT-X-TARGETDURATION:10\n' + \
+            ''.join('#EXTINF:10.0,\nseg{}.ts\n'.format(index) for index in range(segment_count)) + '#EXT-X-ENDLIST\n'
+    requested_cookies = list()
+
+    def fake_get(url, headers=None, cookies=None, timeout=None, **kwargs):
+        requested_cookies.append(cookies)
+        if url.endswith('master.m3u8'):
+            return Response(MASTER)
+        if url.endswith('index.m3u8'):
+            assert '720p60' in url
+            return Response(media)
+        time.sleep(random.random() * 0.01)  # complete out of order
+        return Response(url.rsplit('/', 1)[1].encode())
+
+    monkeypatch.setattr(httpclient, 'get', fake_get)
+    output = str(tmpdir.join('out.ts'))
+    downloader = hls.HlsDownloader('https://cdn/game/master.m3u8', output, cookies={'Authorization': 'a'},
+                                   workers=4, window=6)
+    assert downloader.download() == sum(len('seg{}.ts'.format(index)) for index in range(segment_count))
+    with open(output, 'rb') as infile:
+        assert infile.read() == b''.join('seg{}.ts'.format(index).encode() for index in range(segment_count))
+    assert requested_cookies[0] == {'Authorization': 'a'}
+
+
+def test_unsupported(monkeypatch):
+    monkeypatch.setattr(httpclient, 'get', lambda url, **kwargs: Response(MEDIA.replace('#EXT-X-ENDLIST', '')))
+    downloader = hls.HlsDownloader('https://cdn/game/index.m3u8', 'unused')
+    with pytest.raises(hls.HlsException):
+        downloader.check_supported(downloader.load_playlist())
+
+
+def test_resume(monkeypatch, tmpdir):
+    segment_count = 30
+    media = '#EXTM3U\n#EXT-X-TARGETDURATION:10\n' + \
+            ''.join('#EXTINF:10.0,\nseg{:02}.ts\n'.format(index) for index in range(segment_count)) + '#EXT-X-ENDLIST\n'
+    expected = b''.join('seg{:02}.ts'.format(index).encode() for index in range(segment_count))
+    requested = list()
+    fail_at = ['seg20.ts']
+
+    def fake_get(url, headers=None, cookies=None, timeout=None, **kwargs):
+        if url.endswith('.m3u8'):
+            return Response(media)
+        name = url.rsplit('/', 1)[1]
+        if name in fail_at:
+            raise requests.exceptions.ConnectionError('connection lost')
+        requested.append(name)
+        return Response(name.encode())
+
+    monkeypatch.setattr(httpclient, 'get', fake_get)
+    output = str(tmpdir.join('out.ts'))
+    with pytest.raises(requests.exceptions.ConnectionError):
+        hls.HlsDownloader('https://cdn/game/index.m3u8', output, workers=2, window=4).download()
+    assert os.path.exists(hls.get_journal_filename(output))
+
+    # resume: only the missing tail is downloaded
+    fail_at = list()
+    requested.clear()
+    assert hls.HlsDownloader('https://cdn/game/index.m3u8', output, workers=2, window=4).download() == len(expected)
+    assert requested == ['seg{:02}.ts'.format(index) for index in range(20, segment_count)]
+    with open(output, 'rb') as infile:
+        assert infile.read() == expected
+    assert not os.path.exists(hls.get_journal_filename(output))
+
+
+def test_resume_verifies_tail(monkeypatch, tmpdir):
+    media = '#EXTM3U\n' + ''.join('#EXTINF:10.0,\nseg{}.ts\n'.format(index) for index in range(6)) + '#EXT-X-ENDLIST\n'
+    segments = m3u8.parse(media, 'https://cdn/index.m3u8').segments
+    output = str(tmpdir.join('out.ts'))
+    journal = hls.SegmentJournal(hls.get_journal_filename(output), hls.get_variant_id('https://cdn/index.m3u8'))
+    journal.start(segments, 0)
+    with open(output, 'wb') as outfile:
+        for segment in segments[:4]:
+            data = 'seg{}.ts'.format(segment.sequence).encode()
+            journal.add(segment.sequence, outfile.tell(), data)
+            outfile.write(data)
+    journal.close()
+    assert journal.get_resume_point(output, segments) == (4, 28)
+
+    # corrupt the third segment
+    with open(output, 'r+b') as outfile:
+        outfile.seek(15)
+        outfile.write(b'X')
+    assert journal.get_resume_point(output, segments) == (2, 14)
+
+    # a journal for a different stream is ignored
+    assert journal.get_resume_point(output, segments[:5]) == (0, 0)
+    # as is a journal for another variant of the stream
+    other_variant = hls.SegmentJournal(journal.path, hls.get_variant_id('https://cdn/360p/index.m3u8?token=1'))
+    assert other_variant.get_resume_point(output, segments) == (0, 0)
+
+
+def test_time_index():
+    media = '#EXTM3U\n#EXT-X-MEDIA-SEQUENCE:100\n#EXTINF:6.0,\nseg100.ts\n' + \
+            '#EXT-X-PROGRAM-DATE-TIME:2018-01-01T23:00:06.000Z\n#EXTINF:6.0,\n#EXT-X-BYTERANGE:500@1000\nseg101.ts\n' + \
+            ''.join('#EXTINF:4.0,\nseg{}.ts\n'.format(index) for index in range(102, 1000)) + '#EXT-X-ENDLIST\n'
+    time_index = m3u8.parse(media, 'https://cdn/game/index.m3u8').get_time_index()
+    assert len(time_index) == 900 and time_index.get_duration() == 12 + 898 * 4
+    start = 1514847600  # 2018-01-01T23:00:00Z
+    assert list(time_index.times[:3]) == [start, start + 6, start + 12]
+    assert time_index.get_byterange(1) == (500, 1000) and time_index.get_byterange(2) is None
+    assert time_index.find_sequence(150) == 50 and time_index.find_sequence(99) is None
+
+    assert time_index.find_offset(0) == 0
+    assert time_index.find_offset(11.9) == 1
+    assert time_index.find_offset(12) == 2
+    assert time_index.find_offset(3600) == 2 + (3600 - 12) // 4
+    with pytest.raises(m3u8.PlaylistException):
+        time_index.find_offset(time_index.get_duration())
+    assert time_index.find_time(start - 60) == 0
+    assert time_index.find_time(start + 12 + 4 * 100 + 1) == 102
+    with pytest.raises(m3u8.PlaylistException):
+        time_index.find_time(start + time_index.get_duration())
+
+    assert time_index.find_range() == (0, 900)
+    assert time_index.find_range(offset=12, duration=10) == (2, 5)
+    assert time_index.find_range(offset=13, duration=8) == (2, 5)
+    assert time_index.find_range(timestamp=start + 12 + 4 * 100, duration=4) == (102, 103)
+    assert time_index.find_range(duration=100000) == (0, 900)
+    with pytest.raises(m3u8.PlaylistException):
+        m3u8.parse(MEDIA.replace('#EXT-X-PROGRAM-DATE-TIME:2018-01-01T23:00:00.000Z\n', ''),
+                   'https://cdn/').get_time_index().find_time(start)
@@ -0,0 +1,87 @@
+"""pytest test cases for the hlsproxy module
+"""
+
+import collections
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from mlbam.common import hls
+from mlbam.common import hlsproxy
+from mlbam.common import httpclient
+from test.helpers import Response
+
+
+MEDIA = '#EXTM3U\n#EXT-X-TARGETDURATION:10\n#EXT-X-MEDIA-SEQUENCE:7\n' + \
+        '#EXT-X-KEY:METHOD=NONE\n#EXT-X-PROGRAM-DATE-TIME:2018-01-01T23:00:00.000Z\n' + \
+        ''.join('#EXTINF:10.0,\n#EXT-X-BYTERANGE:10@{}\nall.ts\n'.format(index * 10) for index in range(10)) + \
+        '#EXT-X-ENDLIST\n'
+
+
+def _make_proxy(monkeypatch, prefetch=2):
+    requests_made = collections.Counter()
+
+    def fake_get(url, headers=None, cookies=None, timeout=None, **kwargs):
+        key = url if headers is None or 'Range' not in headers else headers['Range']
+        requests_made[key] += 1
+        if url.endswith('.m3u8'):
+            return Response(MEDIA)
+        time.sleep(0.01)
+        return Response(key.encode())
+
+    monkeypatch.setattr(httpclient, 'get', fake_get)
+    downloader = hls.HlsDownloader('https://cdn/game/index.m3u8', None, workers=2)
+    return hlsproxy.HlsProxy(downloader, prefetch), requests_made
+
+
+def test_playlist_rewrite(monkeypatch):
+    proxy, _ = _make_proxy(monkeypatch)
+    text = proxy.get_playlist_text()
+    lines = text.splitlines()
+    assert '#EXT-X-MEDIA-SEQUENCE:7' in lines and lines[-1] == '#EXT-X-ENDLIST'
+    assert '#EXT-X-PROGRAM-DATE-TIME:2018-01-01T23:00:00.000Z' in lines
+    assert [line for line in lines if not line.startswith('#')] == ['/segment/{}.ts'.format(seq) for seq in range(7, 17)]
+    assert 'KEY' not in text and 'BYTERANGE' not in text
+
+
+def test_shared_segments_and_prefetch(monkeypatch):
+    proxy, requests_made = _make_proxy(monkeypatch)
+    server = hlsproxy.ProxyServer(('127.0.0.1', 0), hlsproxy._make_handler(proxy))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    try:
+        results = list()
+
+        def player():
+            with urllib.request.urlopen(base_url + hlsproxy.PLAYLIST_PATH) as response:
+                assert b'/segment/7.ts' in response.read()
+            with urllib.request.urlopen(base_url + '/segment/8.ts') as response:
+                results.append(response.read())
+
+        players = [threading.Thread(target=player) for _ in range(3)]
+        for player_thread in players:
+            player_thread.start()
+        for player_thread in players:
+            player_thread.join()
+        assert results == [b'bytes=10-19'] * 3
+        assert requests_made['bytes=10-19'] == 1  # one upstream download for all players
+        assert requests_made['https://cdn/game/index.m3u8'] == 1
+
+        # the next segments were prefetched
+        for _ in range(100):
+            if requests_made['bytes=30-39']:
+                break
+            time.sleep(0.01)
+        assert requests_made['bytes=20-29'] == 1 and requests_made['bytes=30-39'] == 1
+        assert requests_made['bytes=40-49'] == 0
+
+        try:
+            urllib.request.urlopen(base_url + '/segment/99.ts')
+            assert False
+        except urllib.error.HTTPError as ex:
+            assert ex.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
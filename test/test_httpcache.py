@@ -0,0 +1,51 @@
+"""pytest test cases for the httpcache module
+"""
+
+import os
+import time
+
+from mlbam.common import httpcache
+
+
+URL = 'http://statsapi.web.nhl.com/api/v1/schedule?startDate=2018-01-01'
+
+
+def test_put_get(tmp_path):
+    cache = httpcache.HttpCache(str(tmp_path), 1024 * 1024)
+    assert cache.get(URL) is None
+    cache.put(URL, {'dates': [{'date': '2018-01-01', 'games': []}]}, etag='"abc"')
+    entry = cache.get(URL)
+    assert entry.data['dates'][0]['date'] == '2018-01-01'
+    assert entry.is_fresh(60)
+    assert not entry.is_fresh(0)
+    assert entry.get_validator_headers() == {'If-None-Match': '"abc"'}
+
+
+def test_expired_entry_is_kept_for_revalidation(tmp_path):
+    cache = httpcache.HttpCache(str(tmp_path), 1024 * 1024)
+    entry = cache.put(URL, {'a': 1}, last_modified='Mon, 01 Jan 2018 00:00:00 GMT')
+    entry.fetched_at = time.time() - 120
+    cache.refresh(entry)
+    assert cache.get(URL).is_fresh(300)
+
+
+def test_evict_least_recently_used(tmp_path):
+    cache = httpcache.HttpCache(str(tmp_path), 2500)
+    for i in range(3):
+        cache.put('{}&i={}'.format(URL, i), {'payload': 'x' * 1000})
+        path = cache._get_path('{}&i={}'.format(URL, i))
+        os.utime(path, (i, i))
+    cache.put(URL, {'payload': 'y' * 1000})
+    assert cache.get('{}&i=0'.format(URL)) is None
+    assert cache.get(URL) is not None
+
+
+def test_get_evicted(monkeypatch, tmp_path):
+    cache = httpcache.HttpCache(str(tmp_path), 1024 * 1024)
+    cache.put(URL, {'a': 1})
+
+    def evicted(path):
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, 'utime', evicted)  # removed by another process after the read
+    assert cache.get(URL).data == {'a': 1}
@@ -0,0 +1,39 @@
+"""pytest test cases for the httpclient module
+"""
+
+import pytest
+
+import mlbam.common.config as config
+from mlbam.common import httpclient
+from test.helpers import FakeConfig
+
+
+@pytest.fixture
+def fresh_session(monkeypatch):
+    monkeypatch.setattr(httpclient, '_SESSION', None)
+    yield
+    httpclient.close()
+
+
+def test_pool_sized_for_fetch_workers(monkeypatch, fresh_session):
+    monkeypatch.setattr(config, 'CONFIG', FakeConfig(http_pool_maxsize='4', fetch_workers='12'))
+    assert httpclient.get_session().get_adapter('https://cdn/seg1.ts')._pool_maxsize == 12
+
+
+def test_shared_session(monkeypatch, fresh_session):
+    monkeypatch.setattr(config, 'CONFIG', FakeConfig())
+    session = httpclient.get_session()
+    assert httpclient.get_session() is session
+    httpclient.close()
+    assert httpclient._SESSION is None
+    assert httpclient.get_session() is not session
+
+
+def test_request_verify_default(monkeypatch, fresh_session):
+    monkeypatch.setattr(config, 'CONFIG', FakeConfig())
+    monkeypatch.setattr(config, 'VERIFY_SSL', False)
+    sent = list()
+    monkeypatch.setattr(httpclient.get_session(), 'request', lambda method, url, **kwargs: sent.append(kwargs))
+    httpclient.get('https://statsapi/schedule')
+    httpclient.get('https://statsapi/schedule', verify=True)
+    assert [kwargs['verify'] for kwargs in sent] == [False, True]
@@ -0,0 +1,97 @@
+"""pytest test cases for the jsonpatch and nhlfeed modules
+"""
+
+import pytest
+
+import mlbam.common.config as config
+import mlbam.common.jsonpatch as jsonpatch
+import mlbam.common.util as util
+from mlbam import nhlfeed
+from test.helpers import FakeConfig
+
+
+def _play(index, event_type, away_goals=0, home_goals=0):
+    return {
+        'result': {'eventTypeId': event_type, 'description': '{} {}'.format(event_type, index)},
+        'about': {'eventIdx': index, 'period': 1, 'ordinalNum': '1st', 'periodTime': '05:00',
+                  'goals': {'away': away_goals, 'home': home_goals}},
+        'team': {'triCode': 'TOR'},
+    }
+
+
+def _feed(timestamp, plays, state='Live'):
+    return {
+        'metaData': {'timeStamp': timestamp},
+        'gameData': {'status': {'abstractGameState': state}},
+        'liveData': {'plays': {'allPlays': plays}},
+    }
+
+
+def test_apply_patch():
+    doc = {'a': {'b': [1, 2]}, 'c~d': 1, 'e/f': 2}
+    patched = jsonpatch.apply_patch(doc, [
+        {'op': 'add', 'path': '/a/b/-', 'value': 3},
+        {'op': 'add', 'path': '/a/b/0', 'value': 0},
+        {'op': 'replace', 'path': '/c~0d', 'value': 5},
+        {'op': 'remove', 'path': '/e~1f'},
+        {'op': 'copy', 'from': '/a/b', 'path': '/g'},
+        {'op': 'move', 'from': '/c~0d', 'path': '/h'},
+        {'op': 'test', 'path': '/h', 'value': 5},
+    ])
+    assert patched is doc
+    assert doc == {'a': {'b': [0, 1, 2, 3]}, 'g': [0, 1, 2, 3], 'h': 5}
+    assert doc['g'] is not doc['a']['b']
+    assert jsonpatch.apply_patch(doc, [{'op': 'replace', 'path': '', 'value': [1]}]) == [1]
+
+    for bad_op in ({'op': 'remove', 'path': '/x'},
+                   {'op': 'replace', 'path': '/a/b/9', 'value': 1},
+                   {'op': 'test', 'path': '/h', 'value': 6},
+                   {'op': 'bogus', 'path': '/h'}):
+        with pytest.raises(jsonpatch.JsonPatchException):
+            jsonpatch.apply_patch({'h': 5, 'a': {'b': []}}, [bad_op])
+
+
+def test_live_feed_patches(monkeypatch):
+    monkeypatch.setattr(config, 'CONFIG', FakeConfig())
+    responses = [
+        _feed('20180101_230000', [_play(0, 'PERIOD_START'), _play(1, 'SHOT')]),
+        [],
+        [{'diff': [{'op': 'replace', 'path': '/metaData/timeStamp', 'value': '20180101_230100'},
+                   {'op': 'add', 'path': '/liveData/plays/allPlays/-', 'value': _play(2, 'GOAL', 1, 0)}]},
+         {'diff': [{'op': 'replace', 'path': '/metaData/timeStamp', 'value': '20180101_230200'},
+                   {'op': 'replace', 'path': '/gameData/status/abstractGameState', 'value': 'Final'}]}],
+    ]
+    requested_urls = list()
+
+    def fake_request_json(url, output_filename=None, cache_ttl=None):
+        requested_urls.append(url)
+        return responses.pop(0)
+
+    monkeypatch.setattr(util, 'request_json', fake_request_json)
+
+    live_feed = nhlfeed.LiveFeed(2017020001)
+    events = list(nhlfeed.iter_events([live_feed], poll_interval=0))
+    assert [event.event_type for event in events] == ['PERIOD_START', 'GOAL']
+    assert (events[1].team, events[1].away_goals, events[1].home_goals) == ('tor', 1, 0)
+    assert requested_urls[0].endswith('/game/2017020001/feed/live')
+    assert requested_urls[1].endswith('/feed/live/diffPatch?startTimecode=20180101_230000')
+    assert requested_urls[2].endswith('/feed/live/diffPatch?startTimecode=20180101_230000')
+    assert live_feed.timecode == '20180101_230200'
+    assert live_feed.is_final()
+
+
+def test_live_feed_bad_patch(monkeypatch):
+    monkeypatch.setattr(config, 'CONFIG', FakeConfig())
+    responses = [
+        _feed('20180101_230000', []),
+        [{'diff': [{'op': 'replace', 'path': '/liveData/plays/allPlays/5', 'value': _play(5, 'GOAL')}]}],
+        _feed('20180101_230100', [_play(0, 'PERIOD_START')]),
+    ]
+    monkeypatch.setattr(util, 'request_json', lambda url, output_filename=None, cache_ttl=None: responses.pop(0))
+
+    live_feed = nhlfeed.LiveFeed(2017020001)
+    assert live_feed.refresh()
+    assert live_feed.refresh()  # falls back to a full request
+    assert live_feed.timecode == '20180101_230100'
+    assert [event.index for event in live_feed.get_new_events()] == [0]
+    assert live_feed.get_new_events() == []
@@ -0,0 +1,106 @@
+"""pytest test cases for the nhlgamedata module
+"""
+
+import pytest
+
+import mlbam.common.config as config
+import mlbam.common.util as util
+import mlbam.nhlgamedata as nhlgamedata
+import mlbam.nhlstore as nhlstore
+from test.helpers import FakeConfig
+from test.helpers import schedule_game
+
+
+@pytest.fixture
+def fake_config(monkeypatch):
+    monkeypatch.setattr(config, 'CONFIG', FakeConfig(schedule_chunk_days='2', season_store='false'))
+    return config.CONFIG
+
+
+def test_process_game_data_ranged(fake_config, monkeypatch):
+    requested_urls = list()
+
+    def fake_request_json(url, output_filename=None, cache_ttl=None):
+        requested_urls.append(url)
+        if 'startDate=2018-01-01' in url:
+            return {'dates': [{'date': '2018-01-01', 'games': [schedule_game(1, '2018-01-01')]},
+                              {'date': '2018-01-02', 'games': [schedule_game(2, '2018-01-02'),
+                                                               schedule_game(3, '2018-01-02', 'wpg', 'ott')]}]}
+        return {'dates': [{'date': '2018-01-03', 'games': [schedule_game(4, '2018-01-03')]}]}
+
+    monkeypatch.setattr(util, 'request_json', fake_request_json)
+    game_days = nhlgamedata.GameDataRetriever().process_game_data('2018-01-01', 3)
+
+    assert len(requested_urls) == 2
+    assert 'startDate=2018-01-01&endDate=2018-01-02' in requested_urls[0]
+    assert 'startDate=2018-01-03&endDate=2018-01-03' in requested_urls[1]
+    assert [game_date for game_date, _ in game_days] == ['2018-01-01', '2018-01-02', '2018-01-03']
+    assert sorted(game_days[1][1].keys()) == ['2', '3']
+    assert game_days[1][1]['3'].away.abbrev == 'wpg'
+
+
+def test_process_game_data_no_games(fake_config, monkeypatch):
+    monkeypatch.setattr(util, 'request_json', lambda url, output_filename=None, cache_ttl=None: {'dates': []})
+    assert nhlgamedata.GameDataRetriever().process_game_data('2018-07-01', 5) == []
+
+
+def test_process_game_data_from_store(fake_config, monkeypatch, tmp_path):
+    requested_urls = list()
+
+    def fake_request_json(url, output_filename=None, cache_ttl=None):
+        requested_urls.append(url)
+        return {'dates': [{'date': '2018-01-01', 'games': [schedule_game(1, '2018-01-01')]}]}
+
+    monkeypatch.setattr(util, 'request_json', fake_request_json)
+    retriever = nhlgamedata.GameDataRetriever()
+    retriever.store = nhlstore.SeasonStore(str(tmp_path / 'season.db'))
+    # the game is far in the future, so the stored Preview game stays fresh
+    monkeypatch.setattr(nhlstore, '_parse_start_time', lambda game_date_str: 4102444800)
+
+    for _ in range(2):
+        game_days = retriever.process_game_data('2018-01-01', 2)
+        assert [game_date for game_date, _ in game_days] == ['2018-01-01']
+        assert game_days[0][1]['1'].home.abbrev == 'mtl'
+    assert len(requested_urls) == 1
+
+
+def test_game_record_feeds(fake_config):
+    game = schedule_game(5, '2018-01-01')
+    game['content'] = {'media': {'epg': [
+        {'title': 'NHLTV', 'items': [
+            {'mediaFeedType': 'HOME', 'mediaPlaybackId': 101, 'eventId': '221-1', 'callLetters': 'TSN4'},
+            {'mediaFeedType': 'COMPOSITE', 'mediaPlaybackId': 102, 'eventId': '221-1', 'callLetters': ''}]},
+        {'title': 'Recap', 'items': [
+            {'mediaPlaybackId': 103, 'playbacks': [{'name': 'HTTP_CLOUD_TABLET_60', 'url': 'http://x/recap.m3u8'}]}]},
+    ]}}
+    game_rec = nhlgamedata.GameRecord(game)
+    assert game_rec._feeds is None
+    assert sorted(game_rec.feeds.keys()) == ['home', 'recap']
+    assert game_rec.feeds['home'].media_playback_id == '101'
+    assert game_rec.feeds['recap'].playback_url == 'http://x/recap.m3u8'
+    assert game_rec.linescore.current_period_ordinal == 'Not Started'
+
+
+def test_lean_request_upgrades_to_feeds(fake_config, monkeypatch):
+    requested_urls = list()
+
+    def fake_request_json(url, output_filename=None, cache_ttl=None):
+        requested_urls.append(url)
+        game = schedule_game(6, '2018-01-01')
+        if 'gamePk=6' in url:
+            game['content'] = {'media': {'epg': [{'title': 'NHLTV', 'items': [
+                {'mediaFeedType': 'AWAY', 'mediaPlaybackId': 201, 'eventId': '221-2', 'callLetters': 'SN'}]}]}}
+        return {'dates': [{'date': '2018-01-01', 'games': [game]}]}
+
+    monkeypatch.setattr(util, 'request_json', fake_request_json)
+    game_days = nhlgamedata.GameDataRetriever().process_game_data(
+        '2018-01-01', 1, nhlgamedata.NEED_TEAMS, 'tor')
+    assert len(requested_urls) == 1
+    assert 'teamId=10' in requested_urls[0]
+    assert 'expand=schedule.teams&' in requested_urls[0]
+    assert 'epg' not in requested_urls[0]
+
+    game_rec = game_days[0][1].find_team('tor')
+    assert game_rec.feeds['away'].event_id == '221-2'
+    assert len(requested_urls) == 2
+    assert 'gamePk=6' in requested_urls[1]
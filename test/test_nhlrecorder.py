@@ -0,0 +1,117 @@
+"""pytest test cases for the nhlrecorder module
+"""
+
+import argparse
+
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+import mlbam.common.config as config
+import mlbam.common.gamedata as gamedata
+from mlbam import nhlgamedata
+from mlbam import nhlrecorder
+from test.helpers import FakeConfig
+from test.helpers import schedule_game
+
+
+START = datetime(2018, 1, 1, 23, 0, tzinfo=timezone.utc)
+
+
+class FakeProcess:
+    def __init__(self):
+        self.return_code = None
+
+    def poll(self):
+        return self.return_code
+
+    def terminate(self):
+        self.return_code = -15
+
+    def wait(self, timeout=None):
+        return self.return_code
+
+
+class FakeRetriever:
+    def __init__(self, games):
+        self.games = games
+
+    def process_game_data(self, game_date, num_days=1, needs=nhlgamedata.NEED_ALL, team_code=None):
+        game_records = gamedata.GameRecords()
+        for game in self.games:
+            game_records.add(nhlgamedata.GameRecord(game, has_feeds=False))
+        return [('2018-01-01', game_records)]
+
+
+def test_plan_and_supervise(monkeypatch, tmpdir):
+    fake_config = FakeConfig(favs='tor', record_max_concurrent='1', record_max_retries='1')
+    fake_config.dir = str(tmpdir)
+    monkeypatch.setattr(config, 'CONFIG', fake_config)
+    games = [schedule_game(1, '2018-01-01', 'tor', 'mtl'), schedule_game(2, '2018-01-01', 'bos', 'tor'),
+             schedule_game(3, '2018-01-01', 'bos', 'mtl')]
+    daemon = nhlrecorder.RecordingDaemon('2018-01-01', 1)
+    daemon.retriever = FakeRetriever(games)
+    started = list()
+
+    def fake_start(recording):
+        recording.attempts += 1
+        recording.process = FakeProcess()
+        started.append(recording.game_pk)
+
+    monkeypatch.setattr(daemon, '_start', fake_start)
+
+    daemon.plan(date(2018, 1, 1))
+    assert sorted(daemon.recordings) == ['1', '2']
+    assert daemon.recordings['1'].team_code == 'tor'
+    assert daemon.recordings['2'].get_command()[-6:] == ['-t', 'tor', '--date', '2018-01-01', '--fetch', '--wait']
+
+    daemon.supervise(START - timedelta(hours=1))
+    assert started == []
+    daemon.supervise(START)
+    assert started == ['1']  # limited by record_max_concurrent
+
+    # postponed games are dropped, and a failed recording is restarted
+    games[1]['status']['detailedState'] = 'Postponed'
+    daemon.plan(date(2018, 1, 1))
+    assert daemon.recordings['2'].done
+    daemon.recordings['1'].process.return_code = 1
+    daemon.recordings['1'].log_handle = open(str(tmpdir.join('log')), 'w')
+    daemon.supervise(START)
+    assert started == ['1', '1']
+    daemon.recordings['1'].process.return_code = 0
+    daemon.recordings['1'].log_handle = open(str(tmpdir.join('log')), 'w')
+    daemon.supervise(START)
+    assert daemon.is_finished(date(2018, 1, 2))
+
+
+def test_recording_args(monkeypatch):
+    monkeypatch.setattr(config, 'CONFIG', FakeConfig())
+    args = argparse.Namespace(feed='home', resolution='540p', duration=None, use_rogers=None, from_start=True,
+                              verbose=False, debug=False)
+    recording_args = nhlrecorder.get_recording_args(args)
+    assert recording_args == ['--feed', 'home', '--resolution', '540p', '--from-start']
+    recording = nhlrecorder.Recording('1', '2018-01-01', 'tor', nhlgamedata.GameRecord(schedule_game(1, '2018-01-01'),
+                                                                                       has_feeds=False))
+    assert recording.get_command(recording_args)[-11:] == ['-t', 'tor', '--date', '2018-01-01', '--fetch', '--wait',
+                                                           '--feed', 'home', '--resolution', '540p', '--from-start']
+
+
+def test_postponed_recording_is_stopped(monkeypatch, tmpdir):
+    fake_config = FakeConfig(favs='tor')
+    fake_config.dir = str(tmpdir)
+    monkeypatch.setattr(config, 'CONFIG', fake_config)
+    games = [schedule_game(1, '2018-01-01', 'tor', 'mtl')]
+    daemon = nhlrecorder.RecordingDaemon('2018-01-01', 1)
+    daemon.retriever = FakeRetriever(games)
+    daemon.plan(date(2018, 1, 1))
+    recording = daemon.recordings['1']
+    process = FakeProcess()
+    recording.process = process
+    recording.log_handle = open(str(tmpdir.join('log')), 'w')
+
+    games[0]['status']['detailedState'] = 'Postponed'
+    daemon.plan(date(2018, 1, 1))
+    assert recording.done and recording.process is None and process.return_code == -15
+    daemon.supervise(START)  # not restarted
+    assert recording.process is None and daemon.is_finished(date(2018, 1, 2))
@@ -0,0 +1,42 @@
+"""pytest test cases for the nhlresolve module
+"""
+
+import io
+import json
+
+import mlbam.common.config as config
+import mlbam.common.gamedata as gamedata
+from mlbam import auth
+from mlbam import nhlgamedata
+from mlbam import nhlresolve
+from mlbam import nhlstream
+from test.helpers import FakeConfig
+from test.helpers import schedule_game_with_feeds
+
+
+def test_resolve_streams(monkeypatch):
+    monkeypatch.setattr(config, 'CONFIG', FakeConfig())
+    monkeypatch.setattr(auth, 'get_auth_cookie', lambda: 'cookie')
+    monkeypatch.setattr(auth, 'get_session_key', lambda *args: 'key')
+
+    def fake_fetch_stream(game_pk, content_id, event_id):
+        if content_id == '11':
+            raise nhlstream.StreamException('Game Blacked Out')
+        return 'https://cdn/{}.m3u8'.format(content_id), 'mediaAuth=x'
+
+    monkeypatch.setattr(nhlstream, 'fetch_stream', fake_fetch_stream)
+    game_records = gamedata.GameRecords()
+    for game in (schedule_game_with_feeds(1, 'tor', 'mtl'), schedule_game_with_feeds(2, 'bos', 'ott'),
+                 schedule_game_with_feeds(3, 'bos', 'tor')):
+        game_records.add(nhlgamedata.GameRecord(game))
+
+    out = io.StringIO()
+    error_count = nhlresolve.resolve_streams([('2018-01-01', game_records)], 'tor', out=out)
+    results = sorted((json.loads(line) for line in out.getvalue().splitlines()),
+                     key=lambda result: (result['game_pk'], result['feedtype']))
+    assert error_count == 1
+    assert [(result['game_pk'], result['feedtype']) for result in results] == \
+        [('1', 'away'), ('1', 'home'), ('3', 'away'), ('3', 'home')]
+    assert results[1]['stream_url'] == 'https://cdn/10.m3u8'
+    assert results[1]['cookies'] == {'Authorization': 'cookie'}
+    assert results[0]['stream_url'] is None and results[0]['error'] == 'Game Blacked Out'
@@ -0,0 +1,70 @@
+"""pytest test cases for the nhlstore module
+"""
+
+from mlbam import nhlstore
+
+
+START = 1514847600  # 2018-01-01T23:00:00Z
+
+
+def _game(game_pk, state='Preview', away='TOR', home='MTL'):
+    return {
+        'gamePk': game_pk,
+        'gameDate': '2018-01-01T23:00:00Z',
+        'season': '20172018',
+        'status': {'abstractGameState': state},
+        'teams': {'away': {'team': {'abbreviation': away}}, 'home': {'team': {'abbreviation': home}}},
+    }
+
+
+def test_game_freshness():
+    store = nhlstore.SeasonStore(':memory:', ttl_live=30, ttl_preview=3600, preview_lead=900, final_settle=21600)
+    assert store.is_game_fresh('Preview', START, START - 86400, now=START - 86000)
+    assert not store.is_game_fresh('Preview', START, START - 3000, now=START - 600)
+    assert store.is_game_fresh('Live', START, START + 600, now=START + 620)
+    assert not store.is_game_fresh('Live', START, START + 600, now=START + 640)
+    assert store.is_game_fresh('Final', START, START + 86400, now=START + 10 * 86400)
+    assert not store.is_game_fresh('Final', START, START + 9000, now=START + 20000)
+
+
+def test_save_and_query():
+    store = nhlstore.SeasonStore(':memory:')
+    store.save_schedule({'dates': [{'date': '2018-01-01',
+                                    'games': [_game(1, 'Final'), _game(2, 'Final', 'WPG', 'OTT')]}]},
+                        '2018-01-01', '2018-01-03', 7)
+    games_by_date = store.get_games_by_date('2018-01-01', '2018-01-03')
+    assert [game_date for game_date, _ in games_by_date] == ['2018-01-01']
+    assert [(game['gamePk'], needs) for game, needs in games_by_date[0][1]] == [(1, 7), (2, 7)]
+    assert [game['gamePk'] for _, games in store.get_games_for_team('wpg') for game, _ in games] == [2]
+    # dates without games are remembered, so only unknown dates are stale
+    assert store.get_stale_dates(['2018-01-02', '2018-01-03', '2018-01-04'], now=START + 86400) == ['2018-01-04']
+
+
+def test_stale_when_more_data_needed():
+    store = nhlstore.SeasonStore(':memory:')
+    store.save_schedule({'dates': [{'date': '2018-01-01', 'games': [_game(1, 'Final')]}]},
+                        '2018-01-01', '2018-01-01', 1)
+    assert store.get_stale_dates(['2018-01-01'], needs=1) == []
+    assert store.get_stale_dates(['2018-01-01'], needs=5) == ['2018-01-01']
+
+
+def test_team_games_stored_without_date():
+    store = nhlstore.SeasonStore(':memory:')
+    store.save_schedule({'dates': [{'date': '2018-01-01', 'games': [_game(1, 'Final')]}]},
+                        '2018-01-01', '2018-01-01', 7, team_code='tor')
+    assert store.get_stale_dates(['2018-01-01'], needs=7, team_code='tor') == []
+    assert store.get_stale_dates(['2018-01-01'], needs=7, team_code='wpg') == ['2018-01-01']
+    assert store.get_stale_dates(['2018-01-01'], needs=7) == ['2018-01-01']
+
+
+def test_team_schedule_replaces_team_games():
+    store = nhlstore.SeasonStore(':memory:')
+    store.save_schedule({'dates': [{'date': '2018-01-01', 'games': [_game(1), _game(2, away='WPG', home='OTT')]}]},
+                        '2018-01-01', '2018-01-02', 7)
+    # the team's game was postponed out of the range: it is removed, the other teams' games are kept
+    store.save_schedule({'dates': []}, '2018-01-01', '2018-01-03', 7, team_code='tor')
+    assert [game['gamePk'] for _, games in store.get_games_by_date('2018-01-01', '2018-01-03')
+            for game, _ in games] == [2]
+    # the team's off-days are fresh, but not for the other teams
+    assert store.get_stale_dates(['2018-01-02', '2018-01-03'], team_code='tor', now=START + 3600) == []
+    assert store.get_stale_dates(['2018-01-02', '2018-01-03'], team_code='wpg', now=START + 3600) == ['2018-01-03']
@@ -0,0 +1,162 @@
+"""pytest test cases for the nhlstream module
+"""
+
+import os
+import threading
+import urllib.request
+
+import pytest
+import requests
+
+import mlbam.common.config as config
+import mlbam.common.gamedata as gamedata
+import mlbam.common.hls as hls
+import mlbam.common.httpcache as httpcache
+import mlbam.common.httpclient as httpclient
+import mlbam.common.util as util
+from mlbam import auth
+from mlbam import nhlgamedata
+from mlbam import nhlstream
+from test.helpers import FakeConfig
+from test.helpers import Response
+from test.helpers import schedule_game_with_feeds
+
+
+def test_credentials_refresh(monkeypatch):
+    monkeypatch.setattr(config, 'CONFIG', FakeConfig(credentials_refresh_margin_secs='100',
+                                                     media_auth_ttl_secs='1000', session_key_ttl_secs='5000'))
+    calls = list()
+    auth_state = {'cookie': 'token1', 'expiry': 3000}
+
+    def fake_login(force=False):
+        calls.append('login')
+        auth_state.update(cookie='token2', expiry=9000)
+
+    monkeypatch.setattr(auth, 'nhl_login', fake_login)
+    monkeypatch.setattr(auth, 'get_auth_cookie', lambda: auth_state['cookie'])
+    monkeypatch.setattr(auth, 'get_auth_cookie_expiry', lambda: auth_state['expiry'])
+    monkeypatch.setattr(auth, 'get_session_key', lambda *args, **kwargs: calls.append('session_key'))
+    monkeypatch.setattr(nhlstream, 'fetch_stream',
+                        lambda *args, **kwargs: ('https://cdn/stream.m3u8', 'mediaAuth_v2={}'.format(len(calls))))
+    monkeypatch.setattr(nhlstream.time, 'time', lambda: 0)
+
+    refresher = nhlstream.CredentialsRefresher.create('1', '10', '20', 'https://cdn/stream.m3u8', 'mediaAuth_v2=0')
+    assert refresher.get_next_refresh() == 900  # media auth
+    received = list()
+    refresher.add_listener(received.append)
+
+    credentials = refresher.refresh(now=900)
+    assert calls == []  # only the stream is resolved again
+    assert credentials.media_auth_expiry == 1900 and received == [credentials]
+    assert refresher.get_next_refresh() == 1800
+
+    credentials = refresher.refresh(now=2950)
+    assert calls == ['login']
+    assert credentials.get_cookies() == {'Authorization': 'token2', 'mediaAuth_v2': '1'}
+
+    refresher.refresh(now=4950)
+    assert calls == ['login', 'session_key']
+    assert refresher.credentials.session_key_time == 4950
+
+
+def test_fetch_live_renews_credentials(monkeypatch):
+    monkeypatch.setattr(config, 'CONFIG', FakeConfig())
+    monkeypatch.setattr(auth, 'get_auth_cookie', lambda: 'token')
+    monkeypatch.setattr(auth, 'get_auth_cookie_expiry', lambda: None)
+    monkeypatch.setattr(nhlstream, 'fetch_stream', lambda *args, **kwargs: ('https://cdn/stream.m3u8', 'mediaAuth_v2=2'))
+    monkeypatch.setattr(nhlstream.CredentialsRefresher, 'start', lambda self: self.refresh())
+    segment_cookies = list()
+
+    def fake_get(url, headers=None, cookies=None, timeout=None, **kwargs):
+        if url.endswith('.m3u8'):
+            return Response('#EXTM3U\n#EXT-X-TARGETDURATION:10\n#EXTINF:10.0,\nseg1.ts\n')
+        segment_cookies.append(cookies)
+        return Response(b'data')
+
+    monkeypatch.setattr(httpclient, 'get', fake_get)
+    recorded = list()
+
+    def fake_streamlink(stream_url, media_auth, fetch_filename, *args):
+        # streamlink records from the proxy, which downloads with the renewed credentials
+        with urllib.request.urlopen(stream_url.replace('/stream.m3u8', '/segment/0.ts')) as response:
+            recorded.append((fetch_filename, response.read()))
+
+    monkeypatch.setattr(nhlstream, 'streamlink', fake_streamlink)
+    nhlstream.fetch_live(nhlgamedata.GameRecord(schedule_game_with_feeds(1, 'tor', 'mtl')), '11', '1',
+                         'https://cdn/stream.m3u8', 'mediaAuth_v2=1', 'out.ts')
+    assert recorded == [('out.ts', b'data')]
+    assert segment_cookies == [{'Authorization': 'token', 'mediaAuth_v2': '2'}]
+
+
+def test_play_team_stream(monkeypatch):
+    monkeypatch.setattr(config, 'CONFIG', FakeConfig())
+    login_started = threading.Event()
+    calls = list()
+
+    class FakeRetriever:
+        def process_game_data(self, game_date, num_days=1, needs=nhlgamedata.NEED_ALL, team_code=None):
+            # the login runs concurrently with the schedule request
+            assert login_started.wait(5)
+            game_records = gamedata.GameRecords()
+            game_records.add(nhlgamedata.GameRecord(schedule_game_with_feeds(1, 'tor', 'mtl')))
+            return [(game_date, game_records)]
+
+    def fake_login():
+        login_started.set()
+        calls.append('login')
+
+    monkeypatch.setattr(auth, 'get_auth_cookie', lambda: 'token' if calls else None)
+    monkeypatch.setattr(auth, 'get_session_key', lambda *args: calls.append(('session_key',) + args))
+    monkeypatch.setattr(nhlstream, 'fetch_stream', lambda *args: ('https://cdn/stream.m3u8', 'mediaAuth_v2=1'))
+    monkeypatch.setattr(nhlstream, 'streamlink', lambda *args: calls.append('streamlink'))
+    timer_steps = list()
+    monkeypatch.setattr(util.StepTimer, 'report', lambda self: timer_steps.extend(step[0] for step in self.steps))
+
+    assert nhlstream.play_team_stream(FakeRetriever(), nhlgamedata.NEED_ALL, 'tor', None, '2018-01-01',
+                                      False, fake_login, False) == 0
+    assert calls == ['login', ('session_key', '1', '1', '11', 'token'), 'streamlink']
+    assert sorted(timer_steps) == ['feeds', 'login', 'schedule', 'session key', 'stream']
+
+
+def test_stream_cache(monkeypatch, tmpdir):
+    monkeypatch.setattr(config, 'CONFIG', FakeConfig(media_auth_ttl_secs='7200'))
+    monkeypatch.setattr(httpcache, '_CACHE', httpcache.HttpCache(str(tmpdir), 1024 * 1024))
+    signed_url = 'https://cdn/master.m3u8?hdnea=exp%3D1514851200~acl%3D%2F*~hmac%3Dabc'
+    assert nhlstream.get_stream_expiry(signed_url, 'mediaAuth_v2=x', now=1514850000) == 1514851200
+    assert nhlstream.get_stream_expiry('https://cdn/master.m3u8', 'mediaAuth_v2=x', now=1000) == 8200
+
+    authorized = [True]
+    monkeypatch.setattr(nhlstream, '_is_stream_authorized', lambda *args: authorized[0])
+    cdn = nhlstream.get_cdn()
+    nhlstream.cache_stream('10', cdn, 'https://cdn/master.m3u8', 'mediaAuth_v2=x')
+    assert nhlstream.get_cached_stream('10', cdn) == ('https://cdn/master.m3u8', 'mediaAuth_v2=x')
+    assert nhlstream.get_cached_stream('11', cdn) is None
+
+    # a 401/403 from the CDN drops the entry
+    authorized[0] = False
+    assert nhlstream.get_cached_stream('10', cdn) is None
+    authorized[0] = True
+    assert nhlstream.get_cached_stream('10', cdn) is None
+
+    # expired entries are not used
+    nhlstream.cache_stream('12', cdn, 'https://cdn/master.m3u8?exp=1000000000', 'mediaAuth_v2=x')
+    assert nhlstream.get_cached_stream('12', cdn) is None
+
+
+def test_fetch_native_interrupted(monkeypatch, tmpdir):
+    monkeypatch.setattr(config, 'CONFIG', FakeConfig())
+    monkeypatch.setattr(auth, 'get_auth_cookie', lambda: 'token')
+    monkeypatch.setattr(nhlstream.segmentcache, 'get_cache', lambda: None)
+
+    def fake_get(url, headers=None, cookies=None, timeout=None, **kwargs):
+        if url.endswith('.m3u8'):
+            return Response('#EXTM3U\n#EXTINF:10.0,\nseg1.ts\n#EXTINF:10.0,\nseg2.ts\n#EXT-X-ENDLIST\n')
+        raise requests.exceptions.ConnectionError(url)
+
+    monkeypatch.setattr(httpclient, 'get', fake_get)
+    output = str(tmpdir.join('out.ts'))
+    # the incomplete download exits non-zero, and can be resumed
+    with pytest.raises(SystemExit) as excinfo:
+        nhlstream.fetch_native('https://cdn/stream.m3u8', 'mediaAuth_v2=1', output)
+    assert excinfo.value.code == 1
+    assert os.path.exists(hls.get_journal_filename(output))
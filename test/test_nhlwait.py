@@ -0,0 +1,58 @@
+"""pytest test cases for the nhlwait module
+"""
+
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+import mlbam.common.config as config
+from mlbam import nhlgamedata
+from mlbam import nhlstream
+from mlbam import nhlwait
+from test.helpers import FakeConfig
+
+
+class Game:
+    def __init__(self, epg_states):
+        self.game_pk = '2017020001'
+        self.nhldate = datetime.now(timezone.utc) - timedelta(minutes=1)
+        self.away = nhlgamedata.Team('Toronto', 'tor', 0)
+        self.home = nhlgamedata.Team('Montreal', 'mtl', 0)
+        self.epg_states = epg_states
+        self.feeds = dict()
+        self.refresh_count = 0
+
+    def refresh_feeds(self):
+        media_state = self.epg_states[min(self.refresh_count, len(self.epg_states) - 1)]
+        self.refresh_count += 1
+        self.feeds = dict()
+        if media_state is not None:
+            self.feeds['national'] = nhlgamedata.Feed('national', '1', '2', media_state=media_state)
+        return self.feeds
+
+
+def test_wait_for_feed(monkeypatch):
+    monkeypatch.setattr(config, 'CONFIG', FakeConfig())
+    monkeypatch.setattr(nhlwait.time, 'sleep', lambda secs: None)
+
+    game = Game([None, 'MEDIA_OFF', 'MEDIA_ON'])
+    waiter = nhlwait.GameWaiter(game, 'tor')
+    assert waiter.wait_for_feed()
+    assert game.refresh_count == 3
+    assert waiter.get_feed().feedtype == 'national'
+
+    # a specific feedtype is waited for
+    game = Game(['MEDIA_ON'])
+    monkeypatch.setattr(config, 'CONFIG', FakeConfig(wait_feed_timeout_secs='0'))
+    assert not nhlwait.GameWaiter(game, 'tor', 'home').wait_for_feed()
+
+
+def test_same_feed_as_playback(monkeypatch):
+    monkeypatch.setattr(config, 'CONFIG', FakeConfig())
+    game = Game(['MEDIA_ON'])
+    game.feeds = {'recap': nhlgamedata.Feed('recap', '5'),
+                  'audio-home': nhlgamedata.Feed('audio-home', '3', '2'),
+                  'national': nhlgamedata.Feed('national', '1', '2')}
+    # neither the home nor the away feed: both wait for and play the first game feed
+    assert nhlwait.GameWaiter(game, 'tor').get_feed().feedtype == 'national'
+    assert nhlstream.select_feed_for_team(game, 'tor') == ('1', '2')
@@ -0,0 +1,63 @@
+"""pytest test cases for the nhlwatch module
+"""
+
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+import pytest
+import requests
+
+import mlbam.common.config as config
+from mlbam import nhlgamedata
+from mlbam import nhlwatch
+from test.helpers import FakeConfig
+
+
+NOW = datetime(2018, 1, 1, 23, 0, tzinfo=timezone.utc)
+
+
+class Game:
+    def __init__(self, state, detailed_state, start=NOW):
+        self.abstract_game_state = state
+        self.detailed_state = detailed_state
+        self.nhldate = start
+
+
+@pytest.fixture
+def fake_config(monkeypatch):
+    monkeypatch.setattr(config, 'CONFIG', FakeConfig())
+
+
+def test_poll_interval(fake_config):
+    get_poll_interval = nhlwatch.ScoreboardWatcher.get_poll_interval
+    assert get_poll_interval([Game('Final', 'Final')], NOW) is None
+    assert get_poll_interval([Game('Preview', 'Postponed')], NOW) is None
+    assert get_poll_interval([Game('Final', 'Final'), Game('Live', 'In Progress')], NOW) == 20
+    assert get_poll_interval([Game('Live', 'In Progress'), Game('Live', 'In Progress - Critical')], NOW) == 10
+    assert get_poll_interval([Game('Preview', 'Scheduled', NOW + timedelta(hours=3))], NOW) == 300
+    assert get_poll_interval([Game('Preview', 'Scheduled', NOW + timedelta(seconds=90))], NOW) == 90
+    assert get_poll_interval([Game('Preview', 'Scheduled', NOW - timedelta(seconds=90))], NOW) == 20
+
+
+def test_failed_poll_is_retried(fake_config, monkeypatch):
+    watcher = nhlwatch.ScoreboardWatcher('2018-01-01', 1, None)
+    watcher.use_ansi = False
+    watcher.displayed_lines = ['TOR 1 MTL 0']
+    polls = list()
+    sleeps = list()
+
+    def fake_poll(needs):
+        polls.append(needs)
+        if len(polls) == 1:
+            raise requests.exceptions.ConnectionError('offline')
+        return list()
+
+    monkeypatch.setattr(watcher, '_poll', fake_poll)
+    monkeypatch.setattr(nhlwatch.time, 'sleep', sleeps.append)
+    monkeypatch.setattr(watcher, '_redraw', lambda lines: polls.append(('redraw', lines)))
+    assert watcher.watch() == 0
+    # the failed poll kept the display, and was retried with the same needs after the live interval
+    assert sleeps == [20]
+    assert polls == [nhlgamedata.NEED_ALL, nhlgamedata.NEED_ALL, ('redraw', [])]
+    assert watcher.displayed_lines == ['TOR 1 MTL 0']
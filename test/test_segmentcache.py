@@ -0,0 +1,75 @@
+"""pytest test cases for the segmentcache module
+"""
+
+import collections
+import os
+
+from mlbam.common import hls
+from mlbam.common import httpclient
+from mlbam.common import segmentcache
+from test.helpers import Response
+
+
+def test_segment_key():
+    key = segmentcache.get_segment_key('https://cdn/game/seg1.ts?hdnea=exp=1514851200~hmac=ab&quality=720')
+    assert key == 'https://cdn/game/seg1.ts?quality=720'
+    assert segmentcache.get_segment_key('https://cdn/game/seg1.ts?hdnea=exp=1514900000~hmac=cd&quality=720') == key
+    assert segmentcache.get_segment_key('https://cdn/game/all.ts', (100, 200)) == 'https://cdn/game/all.ts@200+100'
+
+
+def test_lru_eviction(tmpdir):
+    cache = segmentcache.SegmentCache(str(tmpdir), 250)
+    for index in range(2):
+        cache.put('seg{}'.format(index), bytes(100))
+        os.utime(cache._get_path('seg{}'.format(index)), (index, index))
+    assert cache.get('seg0') == bytes(100)  # now the most recently used
+    cache.put('seg2', bytes(100))
+    assert cache.get('seg1') is None
+    assert cache.get('seg0') == bytes(100) and cache.get('seg2') == bytes(100)
+    assert cache.get('missing') is None
+
+
+def test_get_evicted(monkeypatch, tmpdir):
+    cache = segmentcache.SegmentCache(str(tmpdir), 1024)
+    cache.put('seg', b'data')
+
+    def evicted(path):
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, 'utime', evicted)  # removed by another process after the read
+    assert cache.get('seg') == b'data'
+
+
+def test_downloader_reads_through(monkeypatch, tmpdir):
+    media = '#EXTM3U\n' + ''.join('#EXTINF:10.0,\nseg{}.ts?hdnea={}\n'.format(index, '{token}')
+                                  for index in range(4))
+    token = ['a']
+    requests_made = collections.Counter()
+
+    def fake_get(url, headers=None, cookies=None, timeout=None, **kwargs):
+        requests_made[url.split('?')[0]] += 1
+        if url.endswith('.m3u8'):
+            return Response(media.format(token=token[0]) + ('#EXT-X-ENDLIST\n' if 'vod' in url else ''))
+        return Response(url.split('?')[0].encode())
+
+    monkeypatch.setattr(httpclient, 'get', fake_get)
+    cache = segmentcache.SegmentCache(str(tmpdir.join('cache')), 1024 * 1024)
+    output = str(tmpdir.join('out.ts'))
+    hls.HlsDownloader('https://cdn/vod/index.m3u8', output, segment_cache=cache).download()
+    assert not os.listdir(cache.cache_dir)  # fetching doesn't fill the cache
+
+    # played segments are cached, and read when fetching
+    downloader = hls.HlsDownloader('https://cdn/vod/index.m3u8', None, segment_cache=cache)
+    for segment in downloader.load_playlist().segments[:2]:
+        downloader.download_segment(segment)
+    token[0] = 'b'  # new credentials: the segments are still found in the cache
+    hls.HlsDownloader('https://cdn/vod/index.m3u8', output, segment_cache=cache).download()
+    with open(output, 'rb') as infile:
+        assert infile.read() == b''.join('https://cdn/vod/seg{}.ts'.format(index).encode() for index in range(4))
+    assert requests_made['https://cdn/vod/seg0.ts'] == 2 and requests_made['https://cdn/vod/seg3.ts'] == 2
+
+    # segments of live playlists aren't cached
+    downloader = hls.HlsDownloader('https://cdn/live/index.m3u8', None, segment_cache=cache)
+    for _ in range(2):
+        downloader.download_segment(downloader.load_playlist().segments[0])
+    assert requests_made['https://cdn/live/seg0.ts'] == 2
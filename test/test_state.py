@@ -0,0 +1,41 @@
+"""pytest test cases for the state module
+"""
+
+import marshal
+import os
+import threading
+
+from mlbam.common import state
+
+
+def test_atomic_write_and_read(tmpdir):
+    path = str(tmpdir.join('data'))
+    state.atomic_write(path, 'text')
+    assert state.read_mapped(path) == b'text'
+    state.atomic_write(path, marshal.dumps((1, 'two')))
+    assert state.read_mapped(path, marshal.loads) == (1, 'two')
+    state.atomic_write(path, b'')
+    assert state.read_mapped(path) == b''
+    assert sorted(os.listdir(str(tmpdir))) == ['data']
+
+    with state.atomic_open(path) as outfile:
+        outfile.write('replaced')
+    assert state.read_mapped(path) == b'replaced'
+
+
+def test_locked(tmpdir):
+    path = str(tmpdir.join('counter'))
+    state.atomic_write(path, '0')
+
+    def increment():
+        for _ in range(50):
+            with state.locked(path):
+                value = int(state.read_mapped(path))
+                state.atomic_write(path, str(value + 1))
+
+    threads = [threading.Thread(target=increment) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert state.read_mapped(path) == b'200'
@@ -0,0 +1,60 @@
+"""pytest test cases for the stream module
+"""
+
+import pytest
+import requests
+
+from mlbam.common import httpclient
+from mlbam.common import m3u8
+from mlbam.common import stream
+from test.helpers import FakeConfig
+from test.helpers import Response
+
+
+MASTER = """#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=6600000,RESOLUTION=1280x720
+720p_60/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360
+360p/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=3500000,RESOLUTION=1280x720
+720p_30/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=64000,CODECS="mp4a.40.2"
+audio/index.m3u8
+"""
+
+
+def test_select_variant(monkeypatch):
+    monkeypatch.setattr(stream.config, 'CONFIG', FakeConfig(resolution='720p_alt'))
+    playlist = m3u8.parse(MASTER, 'https://cdn/game/master.m3u8')
+    assert sorted(stream.get_variant_names(playlist)) == ['360p', '64k', '720p', '720p_alt']
+
+    def selected(resolution=None):
+        return stream.select_variant(playlist, resolution).uri.rsplit('/', 2)[1]
+
+    assert selected() == '720p_60'
+    assert selected('720p') == '720p_30'
+    assert selected('1080p, 540p,360p') == '360p'
+    assert selected('best') == '720p_60'
+    assert selected('worst') == '360p'
+    with pytest.raises(m3u8.PlaylistException):
+        selected('1080p')
+
+
+def test_resolve_playlist_url(monkeypatch):
+    monkeypatch.setattr(stream.config, 'CONFIG', FakeConfig(resolution='1080p,720p'))
+    responses = {'https://cdn/game/master.m3u8': MASTER,
+                 'https://cdn/game/720p_30/index.m3u8': '#EXTM3U\n#EXTINF:10.0,\nseg1.ts\n'}
+
+    def fake_get(url, headers=None, cookies=None, timeout=None, **kwargs):
+        if url not in responses:
+            raise requests.exceptions.ConnectionError(url)
+        return Response(responses[url])
+
+    monkeypatch.setattr(httpclient, 'get', fake_get)
+    assert stream.resolve_playlist_url('https://cdn/game/master.m3u8') == \
+        ('https://cdn/game/720p_30/index.m3u8', 'best')
+    assert stream.resolve_playlist_url('https://cdn/game/720p_30/index.m3u8') == \
+        ('https://cdn/game/720p_30/index.m3u8', 'best')
+    # not resolved here: streamlink gets the original url and resolution list
+    assert stream.resolve_playlist_url('https://cdn/other/master.m3u8') == \
+        ('https://cdn/other/master.m3u8', '1080p,720p')
@@ -1,10 +1,67 @@
 """pytest test cases for the util module
 """
 
+import logging
+import time
+
+import mlbam.common.config as config
+from mlbam.common import httpcache
+from mlbam.common import httpclient
 from mlbam.common import util
+from test.helpers import FakeConfig
 
 
 def test_csv_list():
     list1 = ['e1', 'e2', 'e3']
     string1 = 'e1, e2, e3'
     assert list1[1] == util.get_csv_list(string1)[1]
+
+
+def test_parse_duration():
+    assert util.parse_duration('01:00:00') == 3600
+    assert util.parse_duration('05:30') == 330
+    assert util.parse_duration('90') == 90
+    assert util.parse_duration('1h2m3s') == 3723
+    assert util.parse_duration('20m') == 1200
+    try:
+        util.parse_duration('1 hour')
+        assert False
+    except ValueError:
+        pass
+
+
+def test_parse_start_time():
+    assert util.parse_start_time('2018-01-01T23:15:00Z', '2018-01-01') == 1514848500
+    assert util.parse_start_time('20:15', '2018-01-01') == util.parse_start_time('2018-01-01 20:15', '2018-01-05')
+
+
+class NotModified:
+    status_code = 304
+
+    def raise_for_status(self):
+        assert False, 'not raised for a revalidated response'
+
+
+def test_request_json_revalidates(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, 'CONFIG', FakeConfig())
+    monkeypatch.setattr(util, 'LOG', logging.getLogger(util.__name__))  # set by init_logging
+    url = 'https://statsapi/api/v1/schedule?date=2018-01-01'
+    cache = httpcache.HttpCache(str(tmp_path), 1024 * 1024)
+    monkeypatch.setattr(httpcache, 'get_cache', lambda: cache)
+    fetched_at = time.time() - 120
+    with monkeypatch.context() as patch:
+        patch.setattr(time, 'time', lambda: fetched_at)
+        cache.put(url, {'dates': []}, etag='"abc"', last_modified='Mon, 01 Jan 2018 00:00:00 GMT')
+    sent_headers = list()
+
+    def fake_get(request_url, headers=None, **kwargs):
+        sent_headers.append(headers)
+        return NotModified()
+
+    monkeypatch.setattr(httpclient, 'get', fake_get)
+    assert util.request_json(url, cache_ttl=60) == {'dates': []}
+    assert sent_headers[0]['If-None-Match'] == '"abc"'
+    assert sent_headers[0]['If-Modified-Since'] == 'Mon, 01 Jan 2018 00:00:00 GMT'
+    # the revalidated entry is fresh again: no further request
+    assert util.request_json(url, cache_ttl=60) == {'dates': []}
+    assert len(sent_headers) == 1
@@ -0,0 +1,111 @@
+"""pytest test cases for the writer module
+"""
+
+import errno
+import io
+import os
+
+from mlbam.common import writer
+
+
+def test_readinto_all():
+    buffer = bytearray(4)
+    data = bytes(range(256)) * 40
+    assert writer.readinto_all(io.BytesIO(data), buffer) == len(data)
+    assert buffer[:len(data)] == data
+
+
+def test_recording_writer(monkeypatch, tmpdir):
+    writes = list()
+    pwrite = os.pwrite
+
+    def fake_pwrite(fd, data, offset):
+        writes.append((offset, len(data)))
+        return pwrite(fd, data, offset)
+
+    monkeypatch.setattr(os, 'pwrite', fake_pwrite)
+    path = str(tmpdir.join('out.ts'))
+    cache_path = str(tmpdir.join('cached.seg'))
+    with open(cache_path, 'wb') as cache_file:
+        cache_file.write(b'c' * 3000)
+    with open(path, 'wb') as outfile:
+        outfile.write(b'x' * 1000)  # resumed at offset 1000
+    written = list()
+    with open(path, 'r+b') as outfile:
+        recording = writer.RecordingWriter(outfile, 1000, expected_size=100000, write_size=8192,
+                                           fsync_policy='none', on_written=written.append)
+        assert os.path.getsize(path) == 100000  # preallocated
+        recording.write(b'a' * 5000, 'a')
+        assert not written and not writes  # buffered
+        recording.write(b'b' * 5000, 'b')
+        assert written == ['a']
+        with open(cache_path, 'rb') as cache_file:
+            recording.join(cache_file, 3000, 'c')
+        assert written == ['a', 'b', 'c']
+        recording.write(b'd' * 10000, 'd')
+        recording.close()
+    assert written == ['a', 'b', 'c', 'd']
+    assert recording.position == 24000
+    with open(path, 'rb') as infile:
+        assert infile.read() == b'x' * 1000 + b'a' * 5000 + b'b' * 5000 + b'c' * 3000 + b'd' * 10000
+    # the first write, and the first write after the join, end on a block boundary; the tail is written on close
+    assert writes == [(1000, 8192 - 1000), (8192, 2808), (14000, 20480 - 14000), (20480, 3520)]
+
+
+def test_fsync_policy(monkeypatch, tmpdir):
+    fsyncs = list()
+    monkeypatch.setattr(os, 'fsync', fsyncs.append)
+    assert writer.get_fsync_interval('none') is None and writer.get_fsync_interval('close') is None
+    with open(str(tmpdir.join('out.ts')), 'wb') as outfile:
+        recording = writer.RecordingWriter(outfile, write_size=1024 * 1024, fsync_policy='1')
+        for _ in range(5):
+            recording.write(bytes(512 * 1024))
+        assert len(fsyncs) == 2
+        recording.close()
+    assert len(fsyncs) == 3
+
+
+def test_no_preallocation_without_native_fallocate(monkeypatch, tmpdir):
+    def unsupported(fileno, mode, offset, length):
+        monkeypatch.setattr(writer.ctypes, 'get_errno', lambda: errno.EOPNOTSUPP)
+        return -1
+
+    monkeypatch.setattr(writer, '_FALLOCATE', unsupported)
+    path = str(tmpdir.join('out.ts'))
+    with open(path, 'wb') as outfile:
+        recording = writer.RecordingWriter(outfile, expected_size=100000)
+        assert os.path.getsize(path) == 0  # no zeros written over the estimated size
+        recording.write(b'a' * 10)
+        recording.close()
+    assert os.path.getsize(path) == 10
+
+
+def test_invalid_fsync_policy(monkeypatch, tmpdir):
+    fsyncs = list()
+    monkeypatch.setattr(os, 'fsync', fsyncs.append)
+    with open(str(tmpdir.join('out.ts')), 'wb') as outfile:
+        recording = writer.RecordingWriter(outfile, fsync_policy='often')
+        assert recording.fsync_policy == writer.FSYNC_CLOSE
+        recording.write(b'a' * 10)
+        recording.close()
+    assert len(fsyncs) == 1
+
+
+def test_write_without_pwrite(monkeypatch, tmpdir):
+    # e.g. Windows: no os.pread/os.pwrite
+    monkeypatch.delattr(os, 'pwrite')
+    monkeypatch.delattr(os, 'pread')
+    monkeypatch.delattr(os, 'copy_file_range', raising=False)
+    path = str(tmpdir.join('out.ts'))
+    cache_path = str(tmpdir.join('cached.seg'))
+    with open(cache_path, 'wb') as cache_file:
+        cache_file.write(b'c' * 3000)
+    with open(path, 'wb') as outfile:
+        recording = writer.RecordingWriter(outfile, write_size=4096, fsync_policy='none')
+        recording.write(b'a' * 5000)
+        with open(cache_path, 'rb') as cache_file:
+            recording.join(cache_file, 3000)
+        recording.write(b'b' * 10)
+        recording.close()
+    with open(path, 'rb') as infile:
+        assert infile.read() == b'a' * 5000 + b'c' * 3000 + b'b' * 10